@@ -3,29 +3,85 @@ any2json — Multimodal to JSON converter
 MVP: Image support with token budget control
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form, Query
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
+from contextlib import asynccontextmanager
 import base64
 import httpx
 import os
+import time
+
+from backend.auth import credential_digest
+from backend.batch import ConcurrencyLimiter, stream_batch
+from backend.media import Media
+from backend.metrics import CONTENT_TYPE, Metrics, MetricsMiddleware, SlowRequestProfiler, label, stage
+from backend import pipeline
+from backend.pipeline import ConvertRequest, coalesced_events, fetcher, run_convert
+from backend.ratelimit import RateLimiter, RateLimitMiddleware, SQLiteRateStore, bearer_token, limited_response
+from backend.responses import CompressionMiddleware, FastJSONResponse, body_format, document_response
+from backend.streaming import LatencyTracker, collect_document, encode_json_stream, encode_sse, started
+from backend import tokens
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics.start()
+    async with pipeline.running():  # the handlers' clients and worker pools
+        yield
+    await metrics.stop()
+
 
 app = FastAPI(
     title="any2json",
     description="Convert any media to context-efficient JSON",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
+# Accept-Encoding: zstd/br/gzip for bodies from ANY2JSON_COMPRESS_MIN_BYTES, streams included
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.environ.get("ANY2JSON_COMPRESS_MIN_BYTES", 1024)))
+
+# Batch fan-out: max concurrent conversions per client
+batch_limiter = ConcurrencyLimiter(int(os.environ.get("ANY2JSON_BATCH_CONCURRENCY", 8)))
+
+# No accounts here: ANY2JSON_RATELIMIT_TIER applies that tier's limits to every API key (or client address)
+RATELIMIT_TIER = os.environ.get("ANY2JSON_RATELIMIT_TIER")
+if RATELIMIT_TIER:
+    async def rate_limit_identity(scope: dict) -> tuple:
+        token = bearer_token(scope)
+        key = credential_digest(token).hex() if token else (scope.get("client") or ("unknown",))[0]
+        return key, RATELIMIT_TIER
+    
+    rate_limiter = RateLimiter(SQLiteRateStore(os.environ["ANY2JSON_RATELIMIT_DB"])
+                               if os.environ.get("ANY2JSON_RATELIMIT_DB") else None)
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter, identify=rate_limit_identity,
+                       prefixes=("/convert",), methods=("POST",), exclude=("/convert/batch",))
+
+# Time-to-first-byte vs total latency, per response mode (buffered/json/sse)
+convert_latency = LatencyTracker()
+
+# Prometheus /metrics: request and per-stage latency, in-flight, event loop lag, component counters.
+# ANY2JSON_PROFILE_SLOW_MS writes a sampled profile of every slower request to ANY2JSON_PROFILE_DIR.
+metrics = Metrics()
+if os.environ.get("ANY2JSON_PROFILE_SLOW_MS"):
+    metrics.profiler = SlowRequestProfiler(
+        os.environ.get("ANY2JSON_PROFILE_DIR", "profiles"),
+        threshold=float(os.environ["ANY2JSON_PROFILE_SLOW_MS"]) / 1000,
+        interval=float(os.environ.get("ANY2JSON_PROFILE_INTERVAL_MS", 5)) / 1000
+    )
+pipeline.collect(metrics)
+metrics.collect("latency", convert_latency.summary, label="mode")
+if RATELIMIT_TIER:
+    metrics.collect("ratelimit", rate_limiter.stats)
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
 # --- Models ---
 
-class ConvertRequest(BaseModel):
-    input: str  # URL or base64
-    type: str = "auto"  # auto|image|video|audio|document
-    max_tokens: int = 500
-    format: str = "flat"  # flat|nested|progressive
-    expand: Optional[List[str]] = None
+class BatchConvertRequest(BaseModel):
+    items: List[ConvertRequest]
 
 
 class ConvertResponse(BaseModel):
@@ -36,56 +92,6 @@ class ConvertResponse(BaseModel):
     _tokens_used: int
 
 
-# --- Token Budget Prompts ---
-
-def get_prompt_for_budget(max_tokens: int, media_type: str) -> str:
-    """Generate prompt based on token budget."""
-    
-    if max_tokens <= 200:
-        detail = "极简：1-2 sentences, key facts only"
-    elif max_tokens <= 500:
-        detail = "summary: main elements, structure, key text"
-    elif max_tokens <= 2000:
-        detail = "detailed: all visible elements, full text, relationships"
-    else:
-        detail = "exhaustive: every detail, spatial relationships, colors, fonts"
-    
-    return f"""Analyze this {media_type} and return JSON.
-Detail level: {detail}
-Target: ~{max_tokens} tokens output.
-
-Return valid JSON with:
-- "summary": brief description
-- "elements": array of detected items (id, type, content)
-- "text": any text found (if applicable)
-- "metadata": dimensions, colors, etc.
-
-Be concise but complete within the token budget."""
-
-
-# --- Handlers ---
-
-async def process_image(image_data: str, max_tokens: int) -> dict:
-    """Process image with vision model."""
-    
-    # For MVP, return mock structure
-    # TODO: Integrate Claude/GPT-4V
-    
-    return {
-        "type": "image",
-        "summary": "Image analysis placeholder - integrate vision API",
-        "elements": [
-            {"id": "e1", "type": "placeholder", "content": "Vision API integration needed"}
-        ],
-        "text": None,
-        "metadata": {
-            "max_tokens_requested": max_tokens
-        },
-        "_expandable": ["e1"],
-        "_tokens_used": 45
-    }
-
-
 # --- Routes ---
 
 @app.get("/", response_class=HTMLResponse)
@@ -207,22 +213,107 @@ async def landing():
 """
 
 
+async def respond(request: ConvertRequest, http_request: Request, body: Optional[Media] = None):
+    """Run a conversion and build the buffered or streaming response."""
+    start = time.perf_counter()
+    try:
+        name = None if request.stream else body_format(http_request.headers.get("accept"))
+    except HTTPException:
+        if body:
+            body.close()
+        raise
+    cache_status, list_key, events, _ = await coalesced_events(request, body)
+    headers = {"X-Cache": cache_status}
+    
+    if not request.stream:
+        result = await collect_document(events, list_key)
+        with stage("serialize"):
+            response = document_response(result, name, headers)
+        elapsed = time.perf_counter() - start
+        convert_latency.record("buffered", elapsed, elapsed)
+        return response
+    
+    # Streaming: type/summary first, then each element, then the trailer
+    events = await started(events)
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        mode, media_type, chunks = "sse", "text/event-stream", encode_sse(events)
+    else:
+        mode, media_type, chunks = "json", "application/json", encode_json_stream(events, list_key)
+    return StreamingResponse(convert_latency.track(mode, chunks, start),
+                             media_type=media_type, headers=headers)
+
+
 @app.post("/convert")
-async def convert(request: ConvertRequest):
+async def convert(request: ConvertRequest, http_request: Request):
     """Convert media to JSON."""
+    return await respond(request, http_request)
+
+
+@app.post("/convert/upload")
+async def convert_upload(
+    http_request: Request,
+    file: UploadFile = File(...),
+    type: str = Form("auto"),
+    max_tokens: int = Form(500, ge=tokens.MIN_TOKENS),
+    format: str = Form("nested"),
+    expand: Optional[str] = Form(None),  # comma-separated ids
+    handle: Optional[str] = Form(None),
+    cache: bool = Form(True),
+    stream: bool = Form(False)
+):
+    """Convert a multipart upload; the file is spooled to disk, never base64-decoded."""
+    request = ConvertRequest(input="", type=type, max_tokens=max_tokens, format=format,
+                             expand=expand.split(",") if expand else None,
+                             handle=handle, cache=cache, stream=stream)
+    return await respond(request, http_request, Media.from_file(file.file, file.content_type))
+
+
+@app.post("/convert/raw")
+async def convert_raw(
+    http_request: Request,
+    type: str = "auto",
+    max_tokens: int = Query(500, ge=tokens.MIN_TOKENS),
+    format: str = "nested",
+    expand: Optional[str] = None,  # comma-separated ids
+    handle: Optional[str] = None,
+    cache: bool = True,
+    stream: bool = False
+):
+    """Convert a raw application/octet-stream body; options go in the query string."""
+    request = ConvertRequest(input="", type=type, max_tokens=max_tokens, format=format,
+                             expand=expand.split(",") if expand else None,
+                             handle=handle, cache=cache, stream=stream)
+    with stage("receive"):
+        body = await fetcher.spool(http_request.stream(), http_request.headers.get("content-type"))
+    return await respond(request, http_request, body)
+
+
+@app.post("/convert/batch")
+async def convert_batch(batch: BatchConvertRequest, http_request: Request):
+    """Convert many inputs; streams NDJSON lines in completion order."""
+    client = http_request.client.host if http_request.client else "anonymous"
+    label(modality="batch", tier="mixed")
+    headers = {}
+    if RATELIMIT_TIER:
+        # Counted here rather than by the middleware: each item is one request
+        key, tier = await rate_limit_identity(http_request.scope)
+        decision = rate_limiter.check(key, tier, cost=max(len(batch.items), 1))
+        if not decision.allowed:
+            return limited_response(decision, tier)
+        headers = decision.headers()
     
-    if request.type == "auto":
-        # TODO: Auto-detect type from input
-        request.type = "image"
+    async def worker(item: ConvertRequest) -> dict:
+        result, _, _ = await run_convert(item)
+        return result
     
-    if request.type == "image":
-        result = await process_image(request.input, request.max_tokens)
-        return JSONResponse(result)
+    async def lines():
+        try:
+            async for line in stream_batch(batch.items, worker, batch_limiter.checkout(client)):
+                yield line
+        finally:
+            batch_limiter.checkin(client)
     
-    raise HTTPException(
-        status_code=400,
-        detail=f"Type '{request.type}' not yet supported. MVP supports: image"
-    )
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers=headers)
 
 
 @app.get("/health")
@@ -230,6 +321,12 @@ async def health():
     return {"status": "ok", "version": "0.1.0"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text format."""
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,4 @@
+"""
+any2json backend package
+Run the API with: uvicorn backend.main:app (from the repo root)
+"""
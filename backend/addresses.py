@@ -0,0 +1,178 @@
+"""
+any2json payment address pool
+Pre-generated deposit addresses per network, handed out one per user and
+network. Allocation, the user -> address and address -> user lookups and
+the per-network counts are all index lookups, independent of pool size.
+Bulk import: python -m backend.addresses NETWORK FILE --db PATH
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+import argparse
+import sqlite3
+import sys
+import time
+
+
+NETWORKS = {
+    "trc20": "USDT (TRC-20)",
+    "erc20": "USDT (ERC-20)",
+    "dai": "DAI (Ethereum)",
+    "xdai": "xDAI (Gnosis)",
+}
+LOW_WATERMARK = 100  # available addresses below which a network is reported low
+IMPORT_BATCH = 10_000  # addresses per import transaction
+
+
+class AddressPool:
+    """Reference pool: one row per address in a local SQLite file (":memory:" when not persisted).
+
+    Unassigned addresses form a free list (a partial index in import
+    order), so allocation takes the head of it instead of scanning. Every
+    allocation is one IMMEDIATE transaction, so several server processes
+    can share the file without handing out an address twice.
+    """
+
+    def __init__(self, path: str = ":memory:", low_watermark: int = LOW_WATERMARK):
+        self.low_watermark = low_watermark
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS addresses (
+                id INTEGER PRIMARY KEY,
+                network TEXT NOT NULL,
+                address TEXT NOT NULL UNIQUE,
+                user_id TEXT,
+                assigned_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS addresses_free ON addresses (network, id) WHERE user_id IS NULL;
+            CREATE UNIQUE INDEX IF NOT EXISTS addresses_user ON addresses (user_id, network)
+                WHERE user_id IS NOT NULL;
+            -- Counts kept alongside the rows, so watermarks never need a COUNT(*)
+            CREATE TABLE IF NOT EXISTS pools (
+                network TEXT PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0,
+                assigned INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        self.assigned = 0
+        self.exhausted = 0  # requests that found the pool empty
+        self.assigned_while_low = 0
+
+    def address_for(self, user_id: str, network: str) -> Optional[str]:
+        row = self.conn.execute("SELECT address FROM addresses WHERE user_id = ? AND network = ?",
+                                (user_id, network)).fetchone()
+        return row[0] if row else None
+
+    def owner(self, address: str) -> Optional[Tuple[str, str]]:
+        """(user_id, network) an address was given to, e.g. to credit an incoming payment."""
+        row = self.conn.execute("SELECT user_id, network FROM addresses WHERE address = ? AND user_id IS NOT NULL",
+                                (address,)).fetchone()
+        return tuple(row) if row else None
+
+    def assign(self, user_id: str, network: str) -> Optional[str]:
+        """The user's address on `network`, allocating the next free one on first use.
+        None if the network has no free address left."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Checked inside the transaction: another process may have just assigned one
+            address, row = self.address_for(user_id, network), None
+            if address is None:
+                row = self.conn.execute(
+                    """UPDATE addresses SET user_id = ?, assigned_at = ?
+                       WHERE id = (SELECT id FROM addresses WHERE network = ? AND user_id IS NULL
+                                   ORDER BY id LIMIT 1)
+                       RETURNING address""",
+                    (user_id, time.time(), network)
+                ).fetchone()
+                if row:
+                    address = row[0]
+                    self.conn.execute("UPDATE pools SET assigned = assigned + 1 WHERE network = ?", (network,))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        if address is None:
+            self.exhausted += 1
+        elif row:
+            self.assigned += 1
+            if self.available(network) < self.low_watermark:
+                self.assigned_while_low += 1
+        return address
+
+    def available(self, network: str) -> int:
+        row = self.conn.execute("SELECT total - assigned FROM pools WHERE network = ?", (network,)).fetchone()
+        return row[0] if row else 0
+
+    def add(self, network: str, addresses: Iterable[str]) -> Dict[str, int]:
+        """Append addresses to a network's free list, streaming: at most
+        IMPORT_BATCH are held at once. Blank lines, `#` comments and
+        addresses already in the pool (any network) are skipped."""
+        added = skipped = 0
+        batch = []
+        for line in addresses:
+            address = line.strip()
+            if not address or address.startswith("#"):
+                continue
+            batch.append((network, address))
+            if len(batch) >= IMPORT_BATCH:
+                n = self._insert(network, batch)
+                added, skipped, batch = added + n, skipped + len(batch) - n, []
+        if batch:
+            n = self._insert(network, batch)
+            added, skipped = added + n, skipped + len(batch) - n
+        return {"added": added, "skipped": skipped, "available": self.available(network)}
+
+    def _insert(self, network: str, batch: list) -> int:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO addresses (network, address) VALUES (?, ?)", batch)
+            added = self.conn.total_changes - before
+            self.conn.execute("INSERT INTO pools (network, total) VALUES (?, ?)"
+                              " ON CONFLICT (network) DO UPDATE SET total = total + excluded.total",
+                              (network, added))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def add_file(self, network: str, path: str) -> Dict[str, int]:
+        """Import a file with one address per line."""
+        with open(path, encoding="utf-8") as f:
+            return self.add(network, f)
+
+    def stats(self) -> dict:
+        """Per network: total, assigned, available and whether it is below the low watermark."""
+        networks = {
+            network: {"total": total, "assigned": assigned, "available": total - assigned,
+                      "low": total - assigned < self.low_watermark}
+            for network, total, assigned in self.conn.execute("SELECT network, total, assigned FROM pools")
+        }
+        return {
+            "networks": networks,
+            "assigned": self.assigned,
+            "assigned_while_low": self.assigned_while_low,
+            "exhausted": self.exhausted,
+        }
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import payment addresses, one per line ('-' for stdin)")
+    parser.add_argument("network", choices=sorted(NETWORKS))
+    parser.add_argument("file")
+    parser.add_argument("--db", required=True, help="the server's ANY2JSON_ADDRESSES_DB")
+    args = parser.parse_args()
+    pool = AddressPool(args.db)
+    started = time.perf_counter()
+    result = pool.add(args.network, sys.stdin) if args.file == "-" else pool.add_file(args.network, args.file)
+    pool.close()
+    print(f"{args.network}: {result['added']} added, {result['skipped']} skipped, "
+          f"{result['available']} available ({time.perf_counter() - started:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+any2json analysis store
+Keeps the intermediate analysis of a conversion (decoded media, element map,
+model context) under a handle so later `expand` calls can reuse it.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+import contextlib
+import json
+import os
+import secrets
+import time
+
+
+@dataclass
+class AnalysisState:
+    digest: str  # content hash of the decoded media
+    media_type: str
+    media: bytes
+    elements: Dict[str, dict]  # element id -> element
+    context: dict  # model prompt, summary and anything the follow-up call needs
+    handle: str = field(default_factory=lambda: f"h_{secrets.token_urlsafe(12)}")
+    expanded: Dict[str, dict] = field(default_factory=dict)  # id -> detail, filled lazily
+    frames: Dict[str, bytes] = field(default_factory=dict)  # element id -> its own image (e.g. a video keyframe)
+    path: Optional[str] = None  # media kept in a temp file instead (documents); removed with the state
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+
+    def discard(self):
+        """Remove the media file, if any; the state is not used after this."""
+        if self.path:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+            self.path = None
+
+    def size(self) -> int:
+        """Approximate retained bytes (media plus serialized element/context maps)."""
+        return (len(self.media)
+                + (os.path.getsize(self.path) if self.path else 0)
+                + sum(len(frame) for frame in self.frames.values())
+                + len(json.dumps(self.elements, default=str))
+                + len(json.dumps(self.context, default=str))
+                + len(json.dumps(self.expanded, default=str)))
+
+
+class AnalysisStore:
+    """LRU of AnalysisState by handle, with a secondary index by content digest.
+
+    States expire `ttl` seconds after their last use; the store is bounded
+    by `max_entries` and by `max_bytes` of retained state, media files
+    included. A state's media file is removed when the state is dropped,
+    or at once if it is too large to keep.
+    """
+
+    def __init__(self, ttl: float = 1800.0, max_bytes: int = 256 * 2**20, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._states: "OrderedDict[str, AnalysisState]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._by_digest: Dict[str, str] = {}  # digest -> most recent handle
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def put(self, state: AnalysisState) -> str:
+        size = state.size()
+        if size > self.max_bytes:
+            state.discard()
+            return state.handle
+        self._states[state.handle] = state
+        self._sizes[state.handle] = size
+        self._by_digest[state.digest] = state.handle
+        self._bytes += size
+        self._evict()
+        return state.handle
+
+    def get(self, handle: Optional[str]) -> Optional[AnalysisState]:
+        state = self._states.get(handle) if handle else None
+        if state is None:
+            return None
+        if state.last_used + self.ttl <= time.time():
+            self._remove(handle)
+            return None
+        state.last_used = time.time()
+        self._states.move_to_end(handle)
+        return state
+
+    def find(self, digest: str) -> Optional[AnalysisState]:
+        """Most recent live analysis of the same media, if any."""
+        return self.get(self._by_digest.get(digest))
+
+    def touch(self, state: AnalysisState):
+        """Re-account a state's size after it grew (e.g. new expansions)."""
+        if state.handle not in self._states:
+            return
+        size = state.size()
+        self._bytes += size - self._sizes[state.handle]
+        self._sizes[state.handle] = size
+        self._evict()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._states), "bytes": self._bytes}
+
+    def _remove(self, handle: str):
+        state = self._states.pop(handle)
+        state.discard()
+        self._bytes -= self._sizes.pop(handle)
+        if self._by_digest.get(state.digest) == handle:
+            del self._by_digest[state.digest]
+
+    def _evict(self):
+        now = time.time()
+        while self._states:
+            handle, oldest = next(iter(self._states.items()))
+            expired = oldest.last_used + self.ttl <= now
+            if not expired and len(self._states) <= self.max_entries and self._bytes <= self.max_bytes:
+                break
+            self._remove(handle)
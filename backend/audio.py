@@ -0,0 +1,174 @@
+"""
+any2json audio chunking
+Decode audio to mono 16-bit PCM block by block (WAV directly, anything else
+through an ffmpeg pipe) and cut it into transcription chunks at silences
+found by a cheap energy-based VAD.
+"""
+
+from typing import AsyncIterator, BinaryIO, List, Optional, Tuple
+import asyncio
+import io
+import wave
+
+import numpy as np
+
+from backend.video import FFMPEG
+
+
+DECODE_RATE = 16000  # what ffmpeg resamples non-WAV input to
+BLOCK_SEC = 5.0  # PCM read per step
+FRAME_SEC = 0.03  # VAD frame
+TARGET_CHUNK_SEC = 30.0
+MAX_CHUNK_SEC = 60.0
+MIN_SILENCE_SEC = 0.3
+
+Chunk = Tuple[float, float, np.ndarray]  # start sec, end sec, int16 mono samples
+
+
+def is_wav(head: bytes) -> bool:
+    return head.startswith(b"RIFF") and head[8:12] == b"WAVE"
+
+
+def wav_info(file: BinaryIO) -> Optional[Tuple[int, float]]:
+    """(sample rate, duration in seconds) of a WAV that wav_blocks can decode.
+
+    None for the ones that need ffmpeg: float or WAVE_FORMAT_EXTENSIBLE
+    samples, widths other than 16 bits, or a damaged header.
+    """
+    file.seek(0)
+    try:
+        with wave.open(file, "rb") as reader:
+            if reader.getsampwidth() != 2 or not reader.getframerate():
+                return None
+            return reader.getframerate(), reader.getnframes() / reader.getframerate()
+    except (wave.Error, EOFError):
+        return None
+
+
+def wav_bytes(samples: np.ndarray, rate: int) -> bytes:
+    """Mono int16 samples as a WAV file."""
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(samples.astype("<i2").tobytes())
+    return out.getvalue()
+
+
+async def wav_blocks(file: BinaryIO) -> AsyncIterator[np.ndarray]:
+    """Mono int16 blocks of a 16-bit PCM WAV file, BLOCK_SEC at a time."""
+    file.seek(0)
+    with wave.open(file, "rb") as reader:
+        if reader.getsampwidth() != 2:
+            raise ValueError("Only 16-bit PCM WAV is decoded without ffmpeg")
+        channels = reader.getnchannels()
+        frames = int(reader.getframerate() * BLOCK_SEC)
+        while raw := reader.readframes(frames):
+            samples = np.frombuffer(raw, "<i2")
+            if channels > 1:
+                samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1)
+            yield samples.astype(np.int16)
+            await asyncio.sleep(0)  # let transcription tasks run between blocks
+
+
+async def ffmpeg_blocks(path: str, rate: int = DECODE_RATE) -> AsyncIterator[np.ndarray]:
+    """Mono int16 blocks of any audio (or video soundtrack) ffmpeg can decode."""
+    proc = await asyncio.create_subprocess_exec(
+        FFMPEG, "-v", "error", "-i", path, "-vn", "-ac", "1", "-ar", str(rate), "-f", "s16le", "pipe:1",
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    block_bytes = int(rate * BLOCK_SEC) * 2
+    try:
+        while True:
+            try:
+                raw = await proc.stdout.readexactly(block_bytes)
+            except asyncio.IncompleteReadError as e:
+                raw = e.partial
+            if len(raw) >= 2:
+                yield np.frombuffer(raw[:len(raw) // 2 * 2], "<i2")
+            if len(raw) < block_bytes:
+                break
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+
+
+def frame_energy(samples: np.ndarray, frame: int) -> np.ndarray:
+    """dBFS of each whole `frame`-sample frame."""
+    n = len(samples) // frame
+    frames = samples[:n * frame].astype(np.float32).reshape(n, frame)
+    rms = np.sqrt((frames * frames).mean(axis=1)) / 32768.0
+    return 20 * np.log10(np.maximum(rms, 1e-6))
+
+
+class SilenceChunker:
+    """Cuts a PCM stream into ~`target_sec` chunks, at the longest silence between
+    `target_sec` and `max_sec`, or at the quietest frame there if nothing is silent.
+
+    Silence is energy below the recording's 10th-percentile frame energy
+    plus `margin_db`, held for at least `min_silence_sec`.
+    """
+
+    def __init__(self, rate: int, target_sec: float = TARGET_CHUNK_SEC, max_sec: float = MAX_CHUNK_SEC,
+                 min_silence_sec: float = MIN_SILENCE_SEC, margin_db: float = 10.0):
+        self.rate = rate
+        self.frame = max(1, int(rate * FRAME_SEC))
+        self.target = int(target_sec / FRAME_SEC)  # in frames
+        self.max = int(max_sec / FRAME_SEC)
+        self.min_silence = max(1, int(min_silence_sec / FRAME_SEC))
+        self.margin_db = margin_db
+        self._pcm = np.zeros(0, np.int16)
+        self._energy = np.zeros(0, np.float32)
+        self._floor: List[float] = []  # per-block 10th percentiles
+        self._start = 0  # samples emitted so far
+
+    def feed(self, samples: np.ndarray) -> List[Chunk]:
+        self._pcm = np.concatenate([self._pcm, samples])
+        whole = len(self._pcm) // self.frame
+        energy = frame_energy(self._pcm[len(self._energy) * self.frame:whole * self.frame], self.frame)
+        if len(energy):
+            self._floor.append(float(np.percentile(energy, 10)))
+            self._energy = np.concatenate([self._energy, energy])
+        chunks = []
+        while len(self._energy) >= self.max or (len(self._energy) > self.target and self._silence_cut()):
+            chunks.append(self._emit(self._cut()))
+        return chunks
+
+    def flush(self) -> List[Chunk]:
+        chunks = []
+        while len(self._energy) > self.max:
+            chunks.append(self._emit(self._cut()))
+        if len(self._pcm):
+            chunks.append(self._emit(len(self._pcm) // self.frame + 1))
+        return chunks
+
+    def _silence_cut(self) -> Optional[int]:
+        """Frame index in the middle of the longest silence in [target, max), if any."""
+        window = self._energy[self.target:self.max]
+        silent = window < min(self._floor) + self.margin_db
+        if not silent.any():
+            return None
+        # Runs of silent frames: starts and ends from the edges of the boolean mask
+        edges = np.diff(np.concatenate([[0], silent.astype(np.int8), [0]]))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        lengths = ends - starts
+        best = int(np.argmax(lengths))
+        if lengths[best] < self.min_silence:
+            return None
+        return self.target + int(starts[best] + ends[best]) // 2
+
+    def _cut(self) -> int:
+        cut = self._silence_cut()
+        if cut is None:
+            cut = self.target + int(np.argmin(self._energy[self.target:self.max]))
+        return cut
+
+    def _emit(self, frames: int) -> Chunk:
+        samples = self._pcm[:frames * self.frame]
+        self._pcm = self._pcm[len(samples):]
+        self._energy = self._energy[frames:]
+        start = self._start / self.rate
+        self._start += len(samples)
+        return start, self._start / self.rate, samples
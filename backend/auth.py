@@ -0,0 +1,67 @@
+"""
+any2json credential cache
+Bounded TTL/LRU cache of already-verified bearer credentials (JWTs and API keys)
+"""
+
+from collections import OrderedDict
+from typing import Optional, Tuple
+import hashlib
+import time
+
+
+API_KEY_PREFIX = "a2j_"
+
+
+def credential_digest(credential: str) -> bytes:
+    """Fixed-size digest used as the lookup key, so raw secrets are never kept as keys."""
+    return hashlib.sha256(credential.encode()).digest()
+
+
+class CredentialCache:
+    """LRU map of credential digest -> (user_id, expires_at).
+
+    Entries expire after `ttl` seconds or at the credential's own expiry,
+    whichever comes first. Revoked credentials must be dropped explicitly
+    with `discard` (e.g. on API key regeneration).
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, credential: str) -> Optional[str]:
+        key = credential_digest(credential)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        user_id, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return user_id
+
+    def put(self, credential: str, user_id: str, expires_at: Optional[float] = None):
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        key = credential_digest(credential)
+        self._entries[key] = (user_id, deadline)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, credential: str):
+        self._entries.pop(credential_digest(credential), None)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,65 @@
+"""
+any2json batch conversion
+Bounded concurrent fan-out with NDJSON results streamed in completion order
+"""
+
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+import asyncio
+import json
+
+from fastapi import HTTPException
+
+
+class ConcurrencyLimiter:
+    """One semaphore per key (user id / client), shared across that key's batches."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._users: Dict[str, int] = {}
+
+    def checkout(self, key: str) -> asyncio.Semaphore:
+        """Semaphore for `key`; pair every checkout with a checkin."""
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(self.limit)
+            self._users[key] = 0
+        self._users[key] += 1
+        return self._semaphores[key]
+
+    def checkin(self, key: str):
+        self._users[key] -= 1
+        if not self._users[key]:
+            del self._users[key]
+            del self._semaphores[key]
+
+
+def ndjson_line(obj: dict) -> bytes:
+    return json.dumps(obj, separators=(",", ":")).encode() + b"\n"
+
+
+async def stream_batch(items: List[Any], worker: Callable[[Any], Awaitable[dict]],
+                       semaphore: asyncio.Semaphore) -> AsyncIterator[bytes]:
+    """Run `worker` over items under `semaphore`, yielding one NDJSON line per item
+    as soon as it finishes: {"index", "result"} or {"index", "error"}.
+
+    A failing item is reported in its line and never fails the batch. Pending
+    items are cancelled if the consumer goes away.
+    """
+
+    async def run(index: int, item: Any) -> dict:
+        async with semaphore:
+            try:
+                result = await worker(item)
+            except HTTPException as e:
+                return {"index": index, "error": {"status": e.status_code, "detail": e.detail}}
+            except Exception as e:
+                return {"index": index, "error": {"status": 500, "detail": str(e)}}
+        return {"index": index, "result": result}
+
+    tasks = [asyncio.create_task(run(i, item)) for i, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield ndjson_line(await next_done)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,178 @@
+"""
+any2json result cache
+Content-addressed conversion results with an in-memory LRU tier and an on-disk tier
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+
+
+def content_digest(data: bytes) -> str:
+    """Content address of the decoded input bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_key(digest: str, max_tokens: int, media_type: str, format: str,
+              expand: Optional[List[str]] = None) -> str:
+    """Hash of the input's content digest plus every parameter that shapes the output."""
+    params = json.dumps([digest, max_tokens, media_type, format, expand])
+    return hashlib.sha256(params.encode()).hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache of result documents, stored as compact JSON bytes.
+
+    Memory tier: LRU bounded by entry count and total bytes.
+    Disk tier (optional): one file per key under `disk_dir`, oldest-first
+    eviction once the directory exceeds `disk_max_bytes`. Disk hits are
+    promoted back into memory.
+
+    `get` and `put` are coroutines: file reads, writes and deletes run in
+    a thread, while the indexes are only touched on the event loop.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 2**20,
+                 disk_dir: Optional[str] = None, disk_max_bytes: int = 1024 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # key -> size, oldest first
+        self._disk_bytes = 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._load_disk_index()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --- Public API ---
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = self._memory.get(key)
+        if raw is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return json.loads(raw)
+
+        raw = await self._disk_get(key)
+        if raw is not None:
+            self._memory_put(key, raw)
+            self.hits += 1
+            self.disk_hits += 1
+            return json.loads(raw)
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, result: dict):
+        raw = json.dumps(result, separators=(",", ":")).encode()
+        self._memory_put(key, raw)
+        await self._disk_put(key, raw)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+        }
+
+    # --- Memory tier ---
+
+    def _memory_put(self, key: str, raw: bytes):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        if len(raw) > self.max_bytes:
+            return
+        self._memory[key] = raw
+        self._memory_bytes += len(raw)
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    # --- Disk tier ---
+
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.json"
+
+    def _load_disk_index(self):
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".json") and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    async def _disk_get(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir or key not in self._disk:
+            return None
+        try:
+            raw = await asyncio.to_thread(self._read, self._path(key))
+        except FileNotFoundError:
+            if key in self._disk:  # not already evicted while the read ran
+                self._disk_bytes -= self._disk.pop(key)
+            return None
+        if key in self._disk:
+            self._disk.move_to_end(key)
+        return raw
+
+    async def _disk_put(self, key: str, raw: bytes):
+        if not self.disk_dir or len(raw) > self.disk_max_bytes:
+            return
+        await asyncio.to_thread(self._write, self._path(key), raw)
+
+        self._disk_bytes -= self._disk.pop(key, 0)
+        self._disk[key] = len(raw)
+        self._disk_bytes += len(raw)
+        evicted = []
+        while self._disk_bytes > self.disk_max_bytes:
+            old, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.evictions += 1
+            evicted.append(self._path(old))
+        if evicted:
+            await asyncio.to_thread(self._remove, evicted)
+
+    # --- File I/O (runs in a thread) ---
+
+    @staticmethod
+    def _read(path: Path) -> bytes:
+        raw = path.read_bytes()
+        os.utime(path)
+        return raw
+
+    def _write(self, path: Path, raw: bytes):
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _remove(paths: List[Path]):
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,156 @@
+"""
+any2json request coalescing
+Single-flight: concurrent identical conversions share one in-flight computation
+instead of each fetching the input and calling the model.
+"""
+
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+
+
+class Flight:
+    """One in-flight computation, run as its own task so no single caller owns it.
+
+    `fn` returns (result, events or None). The events are recorded as they
+    arrive so every caller can replay them from the start.
+    """
+
+    def __init__(self, fn: Callable[[], Awaitable[Tuple[Any, Optional[AsyncIterator]]]]):
+        self.result: Any = None
+        self.events: List[Any] = []
+        self.error: Optional[BaseException] = None
+        self.started = False  # result available
+        self.done = False
+        self.waiters = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._run(fn))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, fn):
+        events = None
+        try:
+            self.result, events = await fn()
+            self.started = True
+            self._notify()
+            if events is not None:
+                async for event in events:
+                    self.events.append(event)
+                    self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            if events is not None and hasattr(events, "aclose"):
+                await events.aclose()
+            self.done = True
+            self._notify()
+
+    async def wait_result(self) -> Any:
+        while not (self.started or self.done):
+            await self._changed.wait()
+        if not self.started:
+            raise self.error or asyncio.CancelledError()
+        return self.result
+
+    async def replay(self) -> AsyncIterator[Any]:
+        i = 0
+        while True:
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.done:
+                if self.error:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """At most one computation per key; later callers with the same key wait for it.
+
+    Every caller gets the result (and its own replay of the events), so each
+    can still be billed and answered separately. A caller that goes away —
+    including the one that started the flight — only stops waiting; the
+    computation is cancelled once no caller is left.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self.flights = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+        self.cancelled = 0
+        self.leader_disconnects = 0
+
+    def _join(self, key: str, fn) -> Tuple[Flight, bool]:
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            flight = self._flights[key] = Flight(fn)
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+            self.flights += 1
+        flight.waiters += 1
+        self.max_waiters = max(self.max_waiters, flight.waiters - 1)
+        return flight, shared
+
+    def _finish(self, key: str, flight: Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _leave(self, flight: Flight, leader: bool):
+        flight.waiters -= 1
+        if flight.done:
+            return
+        if not flight.waiters:
+            flight.task.cancel()
+            self.cancelled += 1
+        elif leader:
+            self.leader_disconnects += 1
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(await fn(), shared), running fn once for concurrent callers of `key`."""
+
+        async def run():
+            return await fn(), None
+
+        flight, shared = self._join(key, run)
+        try:
+            return await flight.wait_result(), shared
+        finally:
+            self._leave(flight, leader=not shared)
+
+    async def stream(self, key: str, fn: Callable[[], Awaitable[Tuple[Any, AsyncIterator]]]
+                     ) -> Tuple[Any, AsyncIterator, bool]:
+        """Like `do` for fn returning (result, events): (result, events replay, shared).
+
+        Iterate the replay to the end (or close it) to release the flight.
+        """
+        flight, shared = self._join(key, fn)
+        try:
+            result = await flight.wait_result()
+        except BaseException:
+            self._leave(flight, leader=not shared)
+            raise
+        return result, self._follow(flight, leader=not shared), shared
+
+    async def _follow(self, flight: Flight, leader: bool) -> AsyncIterator[Any]:
+        try:
+            async for event in flight.replay():
+                yield event
+        finally:
+            self._leave(flight, leader)
+
+    def stats(self) -> dict:
+        return {
+            "flights": self.flights,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights),
+            "waiters": sum(f.waiters - 1 for f in self._flights.values() if f.waiters),
+            "max_waiters": self.max_waiters,
+            "cancelled": self.cancelled,
+            "leader_disconnects": self.leader_disconnects,
+        }
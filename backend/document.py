@@ -0,0 +1,337 @@
+"""
+any2json document extraction
+PDF (pypdf over a memory-mapped file) and DOCX (zip + streamed XML). Text,
+headings and tables are extracted page by page on a worker pool, and only
+for the pages a response or an `expand` actually needs.
+"""
+
+from concurrent.futures import Executor
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from typing import Iterator, List, Optional, Tuple
+import asyncio
+import mmap
+import os
+import re
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+from backend.metrics import timed
+from backend.streaming import dumps
+from backend.tokens import TokenCounter, shrink
+
+try:
+    import pypdf
+except ImportError:  # pypdf is optional; without it PDFs get a 501
+    pypdf = None
+
+
+FORMATS = ("pdf", "docx")
+PAGES_PER_TASK = 8  # pages one pool task extracts
+OUTLINE_TOKENS = 500  # at or below this budget, sections get titles only
+TOKENS_PER_SECTION = 30  # outline entry: id, title, page range
+TOKENS_PER_DETAIL = 150  # section with a text excerpt
+MAX_SECTIONS = 64
+CHARS_PER_PAGE = 2000  # rough text per page, to decide how many pages an excerpt needs
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DC = "{http://purl.org/dc/elements/1.1/}"
+
+CELL_GAP = re.compile(r"\t| {2,}")
+NUMBERED = re.compile(r"^(\d+(\.\d+)*\.?|[IVX]+\.|Chapter \d+|Section \d+)\s+\S")
+
+# A unit is one page (PDF) or one heading-delimited block (DOCX)
+Mark = Tuple[int, int, str]  # unit index, heading level (1 = top), title
+
+
+def section_budget(max_tokens: int, units: int) -> int:
+    """How many sections `max_tokens` can list."""
+    per = TOKENS_PER_SECTION if max_tokens <= OUTLINE_TOKENS else TOKENS_PER_DETAIL
+    return max(1, min(units, MAX_SECTIONS, max_tokens // per))
+
+
+def build_sections(units: int, marks: List[Mark], count: int) -> List[Tuple[int, int, Optional[str]]]:
+    """(first, last + 1, title) unit ranges, at most `count` of them.
+
+    Cuts go at the highest-level headings first; without any headings the
+    units are split evenly.
+    """
+    if not units:
+        return []
+    if marks:
+        cuts = sorted((m for m in marks if 0 < m[0] < units), key=lambda m: (m[1], m[0]))
+        cuts = sorted({m[0]: m for m in cuts[:count - 1]}.values())
+        titles = {m[0]: m[2] for m in marks}
+        bounds = [0] + [m[0] for m in cuts] + [units]
+        return [(a, b, titles.get(a)) for a, b in zip(bounds, bounds[1:])]
+    step = units / count
+    bounds = sorted({round(i * step) for i in range(count)} | {units})
+    return [(a, b, None) for a, b in zip(bounds, bounds[1:])]
+
+
+# --- Text structure ---
+
+def find_headings(lines: List[str]) -> List[str]:
+    """Short title-like lines: numbered, ALL CAPS, or Title Case without final punctuation."""
+    headings = []
+    for line in lines:
+        text = line.strip()
+        if not 2 < len(text) <= 80 or text[-1] in ".,;:" or CELL_GAP.search(text):
+            continue
+        words = text.split()
+        if NUMBERED.match(text) or (text.isupper() and len(words) <= 10) or \
+                (len(words) <= 8 and all(w[0].isupper() or not w[0].isalpha() for w in words)):
+            headings.append(text)
+    return headings
+
+
+def find_tables(lines: List[str], min_rows: int = 2) -> List[List[List[str]]]:
+    """Runs of lines that split into the same number (2+) of gap-separated cells."""
+    tables, run = [], []
+    for line in lines + [""]:
+        cells = [c for c in CELL_GAP.split(line.strip()) if c]
+        if len(cells) >= 2 and (not run or len(cells) == len(run[0])):
+            run.append(cells)
+            continue
+        if len(run) >= min_rows:
+            tables.append(run)
+        run = [cells] if len(cells) >= 2 else []
+    return tables
+
+
+def page_content(number: int, text: str) -> dict:
+    lines = [line for line in text.splitlines() if line.strip()]
+    return {
+        "page": number,
+        "text": "\n".join(" ".join(line.split()) for line in lines),
+        "headings": find_headings(lines),
+        "tables": find_tables(lines),
+    }
+
+
+# --- PDF (runs in pool workers) ---
+
+@contextmanager
+def mapped(path: str) -> Iterator[mmap.mmap]:
+    """The file, memory-mapped read-only: pages are paged in by the OS as the parser touches them."""
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+# Per worker process: file -> (open mapping, reader), so the page tree of a
+# document is flattened once per worker, not once per task. Files are temp
+# files whose names can come back, so they are keyed by (path, inode, mtime).
+FileKey = Tuple[str, int, int]
+_readers: "OrderedDict[FileKey, Tuple[ExitStack, object]]" = OrderedDict()
+_READERS_KEPT = 2
+
+
+def file_key(path: str) -> Optional[FileKey]:
+    """Identity of the file now at `path`; None once it is removed."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return path, stat.st_ino, stat.st_mtime_ns
+
+
+def pdf_reader(path: str):
+    # Readers of removed (or replaced) temp files would keep their mappings, and the disk space, alive
+    for key in [k for k in _readers if file_key(k[0]) != k]:
+        _readers.pop(key)[0].close()
+    key = file_key(path)
+    if key in _readers:
+        _readers.move_to_end(key)
+        return _readers[key][1]
+    stack = ExitStack()
+    reader = pypdf.PdfReader(stack.enter_context(mapped(path)))
+    _readers[key] = (stack, reader)
+    while len(_readers) > _READERS_KEPT:
+        _, (old, _) = _readers.popitem(last=False)
+        old.close()
+    return reader
+
+
+def pdf_outline(path: str) -> dict:
+    """Page count (from the page tree root), metadata and bookmarks; no page is decoded."""
+    reader = pdf_reader(path)
+    meta = reader.metadata or {}
+    marks: List[Mark] = []
+
+    def walk(items, level):
+        for item in items:
+            if isinstance(item, list):
+                walk(item, level + 1)
+                continue
+            try:
+                marks.append((reader.get_destination_page_number(item), level, str(item.title).strip()))
+            except Exception:  # dangling or malformed bookmark
+                continue
+
+    try:
+        walk(reader.outline, 1)
+    except Exception:
+        marks = []
+    try:
+        units = int(reader.trailer["/Root"]["/Pages"]["/Count"])
+    except (KeyError, TypeError, ValueError):
+        units = len(reader.pages)
+    return {
+        "units": units,
+        "title": str(meta.get("/Title") or "") or None,
+        "author": str(meta.get("/Author") or "") or None,
+        "marks": [m for m in marks if m[0] is not None and m[0] >= 0],
+    }
+
+
+def pdf_pages(path: str, first: int, last: int) -> dict:
+    """Content of pages [first, last), plus the seconds it took."""
+    started = time.perf_counter()
+    reader = pdf_reader(path)
+    pages = []
+    for i in range(first, min(last, len(reader.pages))):
+        try:
+            text = reader.pages[i].extract_text(extraction_mode="layout")
+        except Exception:  # one broken page shouldn't fail the document
+            text = ""
+        pages.append(page_content(i + 1, text))
+    return {"pages": pages, "seconds": time.perf_counter() - started}
+
+
+# --- DOCX (runs in pool workers) ---
+
+def docx_blocks(path: str) -> dict:
+    """Paragraphs and tables of word/document.xml, streamed, grouped into
+    heading-delimited units: {title, units: [{heading, level, paragraphs, tables}]}."""
+    started = time.perf_counter()
+    title = None
+    units = [{"heading": None, "level": 0, "paragraphs": [], "tables": []}]
+    depth = 0  # table nesting; paragraphs inside tables belong to the table
+    # ZipFile needs a seekable file, not a mapping; it still reads only the directory and document.xml
+    with open(path, "rb") as f, zipfile.ZipFile(f) as docx:
+        if "docProps/core.xml" in docx.namelist():
+            with docx.open("docProps/core.xml") as core:
+                node = ET.parse(core).find(f"{DC}title")
+                title = node.text if node is not None and node.text else None
+        with docx.open("word/document.xml") as xml:
+            for event, el in ET.iterparse(xml, events=("start", "end")):
+                if el.tag == f"{W}tbl":
+                    if event == "start":
+                        depth += 1
+                        continue
+                    depth -= 1
+                    if not depth:
+                        units[-1]["tables"].append([[run_text(cell) for cell in row.iter(f"{W}tc")]
+                                                    for row in el.iter(f"{W}tr")])
+                        el.clear()
+                elif el.tag == f"{W}p" and event == "end" and not depth:
+                    text = run_text(el)
+                    style = el.find(f"{W}pPr/{W}pStyle")
+                    style = style.get(f"{W}val", "") if style is not None else ""
+                    level = 1 if style == "Title" else int(style[7:]) if re.fullmatch(r"Heading\d", style) else 0
+                    if level and text:
+                        units.append({"heading": text, "level": level, "paragraphs": [], "tables": []})
+                    elif text:
+                        units[-1]["paragraphs"].append(text)
+                    el.clear()
+    if len(units) > 1 and not units[0]["paragraphs"] and not units[0]["tables"]:
+        units.pop(0)
+    return {"title": title, "units": units, "seconds": time.perf_counter() - started}
+
+
+def run_text(el: ET.Element) -> str:
+    """Whitespace-normalized text of all w:t runs under `el`."""
+    return " ".join("".join(t.text or "" for t in el.iter(f"{W}t")).split())
+
+
+def docx_content(units: List[dict], first: int, last: int) -> List[dict]:
+    """Units [first, last) in the same shape as PDF page content."""
+    return [{
+        "section": unit["heading"],
+        "text": "\n".join(unit["paragraphs"]),
+        "headings": [unit["heading"]] if unit["heading"] else [],
+        "tables": unit["tables"],
+    } for unit in units[first:last]]
+
+
+def fit_section(section: dict, allowance: float, tokens: TokenCounter) -> dict:
+    """Cut an expanded section to `allowance` tokens. Headings and tables each
+    keep the leading ones that fit in a quarter of it; the text is cut to the rest."""
+    section = dict(section)
+    for key in ("headings", "tables"):
+        kept, cost = [], 0.0
+        for item in section.get(key) or []:
+            cost += tokens(dumps(item)) + 1
+            if cost > allowance / 4:
+                break
+            kept.append(item)
+        section[key] = kept
+    # A bound by characters first, so shrink works on a page or two instead of the whole section
+    section["text"] = (section.get("text") or "")[:int(allowance * tokens.chars_per_token)]
+    return shrink(section, allowance, tokens)
+
+
+class DocumentAnalyzer:
+    """Outline and page extraction on a process pool.
+
+    PDF pages are extracted PAGES_PER_TASK at a time by separate tasks, each
+    mapping the file itself, so a long document's pages come out in
+    parallel and only the pages asked for are ever decoded. DOCX is a
+    single XML stream and is parsed by one task.
+    """
+
+    def __init__(self, executor: Executor, pages_per_task: int = PAGES_PER_TASK):
+        self.executor = executor
+        self.pages_per_task = pages_per_task
+        self.documents = 0
+        self.pages = 0
+        self.worker_seconds = 0.0
+
+    @timed("outline")
+    async def outline(self, path: str, format: str) -> dict:
+        """{units, title, author, marks[, content]}; DOCX also carries its parsed units."""
+        loop = asyncio.get_running_loop()
+        self.documents += 1
+        if format == "pdf":
+            return await loop.run_in_executor(self.executor, pdf_outline, path)
+        parsed = await loop.run_in_executor(self.executor, docx_blocks, path)
+        self.worker_seconds += parsed["seconds"]
+        units = parsed["units"]
+        return {
+            "units": len(units),
+            "title": parsed["title"],
+            "author": None,
+            "marks": [(i, u["level"], u["heading"]) for i, u in enumerate(units) if u["heading"]],
+            "content": units,
+        }
+
+    @timed("extract")
+    async def extract(self, path: str, outline: dict, ranges: List[Tuple[int, int]]) -> List[List[dict]]:
+        """Content of each [first, last) unit range, in order."""
+        if "content" in outline:
+            return [docx_content(outline["content"], first, last) for first, last in ranges]
+        loop = asyncio.get_running_loop()
+        tasks = [(start, min(start + self.pages_per_task, last))
+                 for first, last in ranges for start in range(first, last, self.pages_per_task)]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, pdf_pages, path, first, last) for first, last in tasks
+        ))
+        pages = {}
+        for result in results:
+            self.worker_seconds += result["seconds"]
+            self.pages += len(result["pages"])
+            pages.update((p["page"] - 1, p) for p in result["pages"])
+        return [[pages[i] for i in range(first, last) if i in pages] for first, last in ranges]
+
+    def stats(self) -> dict:
+        """Documents opened, pages extracted, and pages per second per busy worker."""
+        return {
+            "documents": self.documents,
+            "pages": self.pages,
+            "pages_per_core": self.pages / self.worker_seconds if self.worker_seconds else 0.0,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,124 @@
+"""
+any2json outbound address checks
+URLs the server requests on a client's behalf (URL inputs, job webhooks)
+must resolve to public addresses: never loopback, private (RFC 1918,
+unique local), link-local (cloud metadata), shared, reserved or multicast.
+`check_public` rejects a bad URL up front with a 400; `PublicTransport`
+enforces the same rule when connecting, on the addresses it connects to.
+"""
+
+from typing import Collection, List, Optional
+from urllib.parse import urlsplit
+import asyncio
+import ipaddress
+import socket
+
+from fastapi import HTTPException
+import httpcore
+import httpx
+
+
+def is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.partition("%")[0])  # drop an IPv6 zone
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+class PrivateAddressError(Exception):
+    pass
+
+
+async def public_addresses(host: str, port: int) -> List[str]:
+    """Addresses `host` resolves to, in resolver order, if every one is public.
+
+    Raises socket.gaierror when it doesn't resolve, PrivateAddressError
+    when any address is not public.
+    """
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except UnicodeError:
+        raise socket.gaierror(f"invalid host name '{host}'")
+    addresses = list(dict.fromkeys(sockaddr[0] for *_, sockaddr in infos))
+    if not all(is_public(address) for address in addresses):
+        raise PrivateAddressError(f"Host '{host}' resolves to a private or reserved address")
+    return addresses
+
+
+async def check_public(url: str, allow: Collection[str] = ()) -> None:
+    """Raise HTTPException(400) unless every address `url`'s host resolves to is public.
+
+    Hosts in `allow` (names or literal addresses, e.g. a local test
+    receiver) are not checked.
+    """
+    parts = urlsplit(url)
+    try:
+        host, port = parts.hostname, parts.port
+    except ValueError:
+        raise HTTPException(400, "Invalid port in URL")
+    if not host:
+        raise HTTPException(400, "URL has no host")
+    if host in allow:
+        return
+    try:
+        await public_addresses(host, port or (443 if parts.scheme == "https" else 80))
+    except socket.gaierror:
+        raise HTTPException(400, f"Cannot resolve host '{host}'")
+    except PrivateAddressError as e:
+        raise HTTPException(400, str(e))
+
+
+class PublicNetworkBackend(httpcore.AsyncNetworkBackend):
+    """Opens connections only to public addresses.
+
+    The host is resolved and checked here, and the connection goes to an
+    address from that same lookup. So a name that resolves differently at
+    connect time than when check_public looked (DNS rebinding) still can't
+    reach a private address. TLS SNI and certificate checks keep using the
+    host name, and pooled connections stay keyed by it.
+    """
+
+    def __init__(self, allow: Collection[str] = ()):
+        self.allow = allow
+        self.backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host: str, port: int, timeout: Optional[float] = None,
+                          local_address: Optional[str] = None, socket_options=None) -> httpcore.AsyncNetworkStream:
+        if host in self.allow:
+            return await self.backend.connect_tcp(host, port, timeout, local_address, socket_options)
+        try:
+            addresses = await public_addresses(host, port)
+        except (socket.gaierror, PrivateAddressError) as e:
+            raise httpcore.ConnectError(str(e))
+        for address in addresses[:-1]:
+            try:
+                return await self.backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout):
+                continue
+        return await self.backend.connect_tcp(addresses[-1], port, timeout, local_address, socket_options)
+
+    async def connect_unix_socket(self, path: str, timeout: Optional[float] = None,
+                                  socket_options=None) -> httpcore.AsyncNetworkStream:
+        raise httpcore.ConnectError("Unix sockets are not an allowed destination")
+
+    async def sleep(self, seconds: float) -> None:
+        await self.backend.sleep(seconds)
+
+
+class PublicTransport(httpx.AsyncHTTPTransport):
+    """httpx transport that connects only to public addresses (see PublicNetworkBackend).
+
+    Passing it to an AsyncClient also keeps proxy settings from the
+    environment out, which would connect on the server's behalf unchecked.
+    """
+
+    def __init__(self, allow: Collection[str] = (), http2: bool = False, limits: httpx.Limits = httpx.Limits()):
+        super().__init__(http2=http2, limits=limits)
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http2=http2,
+            network_backend=PublicNetworkBackend(allow)
+        )
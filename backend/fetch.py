@@ -0,0 +1,160 @@
+"""
+any2json media fetcher
+One long-lived pooled httpx.AsyncClient for URL inputs, with per-host
+connection limits, streaming downloads into spooled temp files, a hard size
+cap, and global accounting of the bytes downloads keep in memory.
+"""
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Collection, Dict, Optional
+from urllib.parse import urlsplit
+import asyncio
+import importlib.util
+
+from fastapi import HTTPException
+import httpx
+
+from backend.egress import PublicTransport, check_public
+from backend.media import Media
+from backend.metrics import timed
+
+
+HTTP2 = importlib.util.find_spec("h2") is not None  # httpx[http2]
+CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+
+
+class MemoryBudget:
+    """Bytes of downloaded media currently held in memory, across all downloads."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+
+    def try_reserve(self, n: int) -> bool:
+        if self.used + n > self.limit:
+            return False
+        self.used += n
+        return True
+
+    def release(self, n: int):
+        self.used -= n
+
+
+class MediaFetcher:
+    """Shared downloader for URL inputs.
+
+    Each download streams into a spooled temp file. Memory-resident bytes
+    are reserved against a global MemoryBudget; once the budget is exhausted
+    further downloads spill to disk instead of growing the process.
+    Downloads larger than `max_bytes` are aborted as soon as the
+    Content-Length or the running byte count says so. Redirects are
+    followed here rather than by httpx, so the host of the URL and of
+    every redirect hop must resolve to a public address (hosts in
+    `allow_hosts` excepted, see backend.egress), and connections only go
+    to addresses that pass the same check.
+    """
+
+    def __init__(self, max_bytes: int = 200 * 2**20, spool_bytes: int = 8 * 2**20,
+                 memory_limit: int = 256 * 2**20, per_host: int = 8, timeout: float = 30.0,
+                 allow_hosts: Collection[str] = ()):
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.budget = MemoryBudget(memory_limit)
+        self.per_host = per_host
+        self.allow_hosts = allow_hosts
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self.client = httpx.AsyncClient(
+            transport=PublicTransport(allow_hosts, http2=HTTP2, limits=httpx.Limits(
+                max_connections=200, max_keepalive_connections=50, keepalive_expiry=60)),
+            timeout=timeout,
+            headers={"User-Agent": "any2json/0.1"}
+        )
+
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+
+    @asynccontextmanager
+    async def _get(self, url: str, headers: dict = None) -> AsyncIterator[httpx.Response]:
+        """Streamed GET of `url`, checking the address of every hop before connecting to it."""
+        request = self.client.build_request("GET", url, headers=headers)
+        for _ in range(MAX_REDIRECTS + 1):
+            await check_public(str(request.url), self.allow_hosts)
+            response = await self.client.send(request, stream=True)
+            if response.next_request is None:
+                try:
+                    yield response
+                finally:
+                    await response.aclose()
+                return
+            await response.aclose()
+            request = response.next_request
+        raise HTTPException(502, f"Fetching input failed: more than {MAX_REDIRECTS} redirects")
+
+    @timed("fetch")
+    async def fetch(self, url: str, headers: dict = None) -> Media:
+        """Download `url` into a Media object. Caller must close() it."""
+        async with self._host_slot(url):
+            try:
+                async with self._get(url, headers) as response:
+                    if response.status_code >= 400:
+                        raise HTTPException(502, f"Fetching input failed: HTTP {response.status_code}")
+                    length = response.headers.get("content-length")
+                    if length and length.isdigit() and int(length) > self.max_bytes:
+                        raise HTTPException(413, f"Input exceeds {self.max_bytes} bytes")
+                    return await self.spool(response.aiter_bytes(CHUNK_SIZE),
+                                            response.headers.get("content-type"))
+            except httpx.HTTPError as e:
+                raise HTTPException(502, f"Fetching input failed: {e}")
+
+    async def fetch_head(self, url: str, n: int) -> bytes:
+        """First `n` bytes of `url` via a Range request; stops reading early if Range is ignored."""
+        async with self._host_slot(url):
+            try:
+                async with self._get(url, {"Range": f"bytes=0-{n - 1}"}) as response:
+                    if response.status_code >= 400:
+                        raise HTTPException(502, f"Fetching input failed: HTTP {response.status_code}")
+                    head = bytearray()
+                    async for chunk in response.aiter_bytes(n):
+                        head += chunk
+                        if len(head) >= n:
+                            break
+                    return bytes(head[:n])
+            except httpx.HTTPError as e:
+                raise HTTPException(502, f"Fetching input failed: {e}")
+
+    async def spool(self, chunks: AsyncIterator[bytes], content_type: Optional[str] = None) -> Media:
+        """Stream chunks (a download or a request body) into Media under the size cap
+        and the global memory budget."""
+        reserved = 0
+
+        def release():
+            self.budget.release(reserved)
+
+        media = Media(spool_bytes=self.spool_bytes, content_type=content_type, on_close=release)
+        try:
+            async for chunk in chunks:
+                if media.size + len(chunk) > self.max_bytes:
+                    raise HTTPException(413, f"Input exceeds {self.max_bytes} bytes")
+                if media.in_memory:
+                    if self.budget.try_reserve(len(chunk)):
+                        reserved += len(chunk)
+                    else:
+                        media.rollover()
+                media.write(chunk)
+                if not media.in_memory and reserved:
+                    self.budget.release(reserved)
+                    reserved = 0
+        except BaseException:
+            media.close()
+            raise
+        return media
+
+    def stats(self) -> dict:
+        return {"memory_used": self.budget.used, "memory_limit": self.budget.limit, "http2": HTTP2}
+
+    async def aclose(self):
+        await self.client.aclose()
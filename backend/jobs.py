@@ -0,0 +1,303 @@
+"""
+any2json job queue
+Long-running conversions as jobs: a persistent SQLite queue ordered by user
+tier, a pool of asyncio workers with retries, crash recovery on restart,
+and optional webhook delivery of the outcome.
+"""
+
+from typing import Awaitable, Callable, Collection, Dict, Optional
+import asyncio
+import json
+import random
+import secrets
+import sqlite3
+import time
+
+import httpx
+from fastapi import HTTPException
+
+from backend.egress import PublicTransport, check_public
+
+
+# Lower runs first; unknown tiers sit between paid and free
+TIER_PRIORITY = {"enterprise": 0, "paid": 10, "free": 30}
+DEFAULT_PRIORITY = 20
+
+JOB_FIELDS = ("id", "user_id", "priority", "status", "request", "webhook", "attempts", "max_attempts",
+              "result", "error", "webhook_status", "created_at", "run_at", "started_at", "finished_at")
+
+
+def row_to_job(row: tuple) -> dict:
+    job = dict(zip(JOB_FIELDS, row))
+    job["request"] = json.loads(job["request"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["error"] = json.loads(job["error"]) if job["error"] else None
+    return job
+
+
+class JobQueue:
+    """Reference queue: one row per job in a local SQLite file (":memory:" when not persisted).
+
+    Jobs move queued -> running -> done | failed. A job that fails with a
+    retryable error goes back to queued with an exponential delay until
+    `max_attempts` is used up. Jobs left running by a crash are requeued by
+    `recover()` at startup.
+    """
+
+    def __init__(self, path: str = ":memory:", max_attempts: int = 3, backoff: float = 5.0):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                request TEXT NOT NULL,
+                webhook TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                result TEXT,
+                error TEXT,
+                webhook_status TEXT,
+                created_at REAL NOT NULL,
+                run_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        # Covers the claim query: due queued jobs by priority, then age
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, priority, run_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, created_at)")
+        self.conn.commit()
+
+    def submit(self, user_id: str, tier: str, request: dict, webhook: Optional[str] = None) -> dict:
+        now = time.time()
+        job_id = f"job_{secrets.token_urlsafe(12)}"
+        self.conn.execute(
+            "INSERT INTO jobs (id, user_id, priority, request, webhook, max_attempts, created_at, run_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, user_id, TIER_PRIORITY.get(tier, DEFAULT_PRIORITY), json.dumps(request), webhook,
+             self.max_attempts, now, now)
+        )
+        self.conn.commit()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self.conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row_to_job(row) if row else None
+
+    def position(self, job: dict) -> int:
+        """Queued jobs that will be claimed before this one."""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+            " AND (priority < ? OR (priority = ? AND run_at < ?))",
+            (job["priority"], job["priority"], job["run_at"])
+        ).fetchone()[0]
+
+    def claim(self) -> Optional[dict]:
+        """Mark the most urgent due job running and return it, or None."""
+        now = time.time()
+        row = self.conn.execute(
+            f"""UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?
+                WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND run_at <= ?
+                            ORDER BY priority, run_at LIMIT 1)
+                RETURNING {', '.join(JOB_FIELDS)}""",
+            (now, now)
+        ).fetchone()
+        self.conn.commit()
+        return row_to_job(row) if row else None
+
+    def next_due(self) -> Optional[float]:
+        """When the earliest queued job becomes due, if any is waiting."""
+        return self.conn.execute("SELECT MIN(run_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def complete(self, job_id: str, result: dict):
+        self._finish(job_id, "done", result=json.dumps(result))
+
+    def fail(self, job_id: str, error: dict, retry: bool) -> bool:
+        """Record a failed attempt. Returns True if the job was requeued."""
+        job = self.get(job_id)
+        if retry and job["attempts"] < job["max_attempts"]:
+            delay = self.backoff * 2 ** (job["attempts"] - 1) * random.uniform(0.5, 1.0)
+            self.conn.execute("UPDATE jobs SET status = 'queued', run_at = ?, error = ? WHERE id = ?",
+                              (time.time() + delay, json.dumps(error), job_id))
+            self.conn.commit()
+            return True
+        self._finish(job_id, "failed", error=json.dumps(error))
+        return False
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        self.conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                          (status, result, error, time.time(), job_id))
+        self.conn.commit()
+
+    def set_webhook_status(self, job_id: str, status: str):
+        self.conn.execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (status, job_id))
+        self.conn.commit()
+
+    def recover(self) -> int:
+        """Requeue jobs a previous process left running, and webhooks it never delivered."""
+        cursor = self.conn.execute("UPDATE jobs SET status = 'queued', run_at = ? WHERE status = 'running'",
+                                   (time.time(),))
+        self.conn.execute("UPDATE jobs SET webhook_status = 'pending' WHERE webhook IS NOT NULL"
+                          " AND status IN ('done', 'failed') AND webhook_status IS NULL")
+        self.conn.commit()
+        return cursor.rowcount
+
+    def undelivered(self) -> list:
+        rows = self.conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE webhook_status = 'pending'")
+        return [row_to_job(row) for row in rows]
+
+    def stats(self) -> dict:
+        counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ("queued", "running", "done", "failed")}
+
+    def close(self):
+        self.conn.close()
+
+
+def public_job(job: dict) -> dict:
+    """What GET /convert/jobs/{id} shows."""
+    out = {
+        "id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+    if job["status"] == "done":
+        out["result"] = job["result"]
+    elif job["error"]:
+        out["error"] = job["error"]  # the last attempt's error while a retry is pending
+    if job["webhook"]:
+        out["webhook"] = {"url": job["webhook"], "status": job["webhook_status"]}
+    return out
+
+
+class JobRunner:
+    """`workers` asyncio tasks claiming jobs from a JobQueue and running them with `run(job)`.
+
+    HTTPException 4xx outcomes are final; anything else is retried by the
+    queue. Outcomes are POSTed to the job's webhook, retried with backoff,
+    and webhooks still pending after a crash are delivered on restart.
+    Each attempt first re-resolves the webhook's host: one that now points
+    at a non-public address (see backend.egress) fails without retries.
+    """
+
+    def __init__(self, queue: JobQueue, run: Callable[[dict], Awaitable[dict]], workers: int = 4,
+                 poll: float = 1.0, webhook_timeout: float = 10.0, webhook_attempts: int = 4,
+                 allow_hosts: Collection[str] = ()):
+        self.queue = queue
+        self.run = run
+        self.workers = workers
+        self.poll = poll
+        self.webhook_attempts = webhook_attempts
+        self.allow_hosts = allow_hosts
+        self.client = httpx.AsyncClient(timeout=webhook_timeout, transport=PublicTransport(allow_hosts))
+        self._wake = asyncio.Event()
+        self._tasks: list = []
+        self._deliveries: set = set()
+        self.running: Dict[str, dict] = {}
+        self.recovered = 0
+        self.retried = 0
+        self.webhooks_sent = 0
+        self.webhooks_failed = 0
+
+    def start(self):
+        self.recovered = self.queue.recover()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        for job in self.queue.undelivered():
+            self._deliver_later(job)
+
+    def notify(self):
+        """Wake an idle worker; call after submitting a job."""
+        self._wake.set()
+
+    async def _idle(self):
+        due = self.queue.next_due()
+        timeout = self.poll if due is None else min(self.poll, max(0.0, due - time.time()))
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _worker(self):
+        while True:
+            job = self.queue.claim()
+            if job is None:
+                await self._idle()
+                continue
+            self.running[job["id"]] = job
+            try:
+                result = await self.run(job)
+            except asyncio.CancelledError:
+                raise  # shutdown: the job stays running and is recovered on restart
+            except HTTPException as e:
+                self._failed(job, {"status": e.status_code, "detail": e.detail}, retry=e.status_code >= 500)
+            except Exception as e:
+                self._failed(job, {"status": 500, "detail": f"{e.__class__.__name__}: {e}"}, retry=True)
+            else:
+                self.queue.complete(job["id"], result)
+                self._deliver_later(self.queue.get(job["id"]))
+            finally:
+                self.running.pop(job["id"], None)
+
+    def _failed(self, job: dict, error: dict, retry: bool):
+        if self.queue.fail(job["id"], error, retry):
+            self.retried += 1
+            self._wake.set()
+        else:
+            self._deliver_later(self.queue.get(job["id"]))
+
+    def _deliver_later(self, job: dict):
+        if not job["webhook"]:
+            return
+        self.queue.set_webhook_status(job["id"], "pending")
+        task = asyncio.create_task(self._deliver(job))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, job: dict):
+        payload = public_job(job)
+        payload.pop("webhook", None)
+        for attempt in range(self.webhook_attempts):
+            try:
+                await check_public(job["webhook"], self.allow_hosts)
+            except HTTPException:
+                break
+            try:
+                response = await self.client.post(job["webhook"], json=payload,
+                                                  headers={"X-Any2json-Job": job["id"]})
+                if response.status_code < 300:
+                    self.queue.set_webhook_status(job["id"], "delivered")
+                    self.webhooks_sent += 1
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(2 ** attempt * random.uniform(0.5, 1.0))
+        self.queue.set_webhook_status(job["id"], "failed")
+        self.webhooks_failed += 1
+
+    async def stop(self):
+        """Cancel workers and deliveries. Running jobs stay 'running' and resume on the next start."""
+        tasks = self._tasks + list(self._deliveries)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            **self.queue.stats(),
+            "workers": self.workers,
+            "busy": len(self.running),
+            "recovered": self.recovered,
+            "retried": self.retried,
+            "webhooks_sent": self.webhooks_sent,
+            "webhooks_failed": self.webhooks_failed,
+        }
@@ -0,0 +1,173 @@
+"""
+any2json usage ledger
+Append-only usage entries, one per billed request, committed before the
+request is answered (concurrent requests share a commit), with per-user
+totals readable in O(1).
+"""
+
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import sqlite3
+import time
+
+
+# Published prices (static/index.html): per request, per input MB, per output token
+PRICING = {
+    "image": {"base": 0.002, "per_mb": 0.001, "per_token": 0.000002},
+    "video": {"base": 0.01, "per_mb": 0.002, "per_token": 0.000003},
+    "audio": {"base": 0.005, "per_mb": 0.001, "per_token": 0.000002},
+    "document": {"base": 0.003, "per_mb": 0.0005, "per_token": 0.000001},
+}
+
+
+def usage_cost(media_type: str, size: int, tokens: int) -> float:
+    """Price of one conversion from its input size in bytes and the tokens it returned."""
+    p = PRICING.get(media_type, PRICING["image"])
+    return round(p["base"] + size / 2**20 * p["per_mb"] + tokens * p["per_token"], 6)
+
+
+# request_id, user_id, kind, cost, tokens, created_at
+Entry = Tuple[str, str, str, float, int, float]
+
+
+class UsageLedger:
+    """Usage entries in a SQLite file (":memory:" when not persisted).
+
+    `record()` returns once its entry is committed, so a charge that was
+    acknowledged survives a crash. Entries recorded while a commit is in
+    progress go into the next one: the writer takes whatever is pending,
+    inserts it and updates the balances in one transaction, on a thread.
+    Each request_id is charged at most once: the table's primary key drops
+    a repeat (e.g. a job rerun after a crash), and the in-memory totals
+    only ever count committed entries.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")  # money: a committed charge survives a power loss too
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS usage (
+                request_id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                cost REAL NOT NULL,
+                tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        # Running totals, updated in the same transaction as the entries they sum
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS balances (
+                user_id TEXT PRIMARY KEY,
+                used REAL NOT NULL,
+                requests INTEGER NOT NULL,
+                tokens INTEGER NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self._totals: Dict[str, List] = {
+            user_id: [used, requests, tokens]
+            for user_id, used, requests, tokens in self.conn.execute("SELECT * FROM balances")
+        }
+        self._pending: Dict[str, Tuple[Entry, asyncio.Future]] = {}
+        self._writer: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.written = 0
+        self.duplicates = 0
+        self.commits = 0
+        self.commit_seconds = 0.0
+
+    async def record(self, request_id: str, user_id: str, cost: float, tokens: int = 0,
+                     kind: str = "convert") -> bool:
+        """Charge `cost` to `user_id` and wait until it is committed; False if this
+        request_id was already charged.
+
+        Shielded: once called, the entry is written even if the caller is
+        cancelled (e.g. the client of a streamed batch went away).
+        """
+        if request_id in self._pending:
+            await asyncio.shield(self._pending[request_id][1])
+            self.duplicates += 1
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = ((request_id, user_id, kind, cost, tokens, time.time()), future)
+        self.recorded += 1
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending())
+        return await asyncio.shield(future)
+
+    def _add(self, user_id: str, cost: float, tokens: int, requests: int):
+        totals = self._totals.setdefault(user_id, [0.0, 0, 0])
+        totals[0] += cost
+        totals[1] += requests
+        totals[2] += tokens
+
+    def used(self, user_id: str) -> float:
+        totals = self._totals.get(user_id)
+        return round(totals[0], 6) if totals else 0.0
+
+    def usage(self, user_id: str) -> dict:
+        used, requests, tokens = self._totals.get(user_id, (0.0, 0, 0))
+        return {"used": round(used, 6), "requests": requests, "tokens": tokens}
+
+    async def _write_pending(self):
+        """Commit pending entries until none are left, then settle their record() calls."""
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            started = time.perf_counter()
+            try:
+                repeats = await asyncio.to_thread(self._write, [entry for entry, _ in batch.values()])
+            except Exception as e:
+                for _, future in batch.values():
+                    future.set_exception(e)
+                    future.exception()  # retrieved here too, in case its caller is gone
+                continue
+            repeated = {entry[0] for entry in repeats}
+            for request_id, (entry, future) in batch.items():
+                if request_id not in repeated:
+                    self._add(entry[1], entry[3], entry[4], 1)
+                future.set_result(request_id not in repeated)
+            self.duplicates += len(repeats)
+            self.written += len(batch) - len(repeats)
+            self.commits += 1
+            self.commit_seconds += time.perf_counter() - started
+
+    def _write(self, batch: List[Entry]) -> List[Entry]:
+        """One transaction: insert the entries, then add the new ones to the balances.
+        Returns the entries whose request_id was already in the ledger."""
+        repeats, sums = [], {}
+        with self.conn:
+            for entry in batch:
+                if self.conn.execute("INSERT OR IGNORE INTO usage VALUES (?, ?, ?, ?, ?, ?)", entry).rowcount:
+                    totals = sums.setdefault(entry[1], [0.0, 0, 0])
+                    totals[0] += entry[3]
+                    totals[1] += 1
+                    totals[2] += entry[4]
+                else:
+                    repeats.append(entry)
+            self.conn.executemany(
+                "INSERT INTO balances VALUES (?, ?, ?, ?) ON CONFLICT (user_id) DO UPDATE SET"
+                " used = used + excluded.used, requests = requests + excluded.requests,"
+                " tokens = tokens + excluded.tokens",
+                [(user_id, *totals) for user_id, totals in sums.items()]
+            )
+        return repeats
+
+    async def stop(self):
+        """Wait for the commit in progress, and any still pending."""
+        if self._writer:
+            await asyncio.gather(self._writer, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "pending": len(self._pending),
+            "written": self.written,
+            "duplicates": self.duplicates,
+            "commits": self.commits,
+            "avg_commit_ms": self.commit_seconds / self.commits * 1000 if self.commits else 0.0,
+        }
+
+    def close(self):
+        self.conn.close()
@@ -3,29 +3,88 @@ any2json Backend API
 FastAPI server with auth, payments, and convert endpoints
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, UploadFile, File, Form
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from fastapi.responses import HTMLResponse, FileResponse, Response, StreamingResponse
+from pydantic import BaseModel, EmailStr, Field
+from typing import Iterable, List, Optional
+from contextlib import asynccontextmanager
 import secrets
 import hashlib
 import pyotp
 import jwt
 import time
+import os
 from pathlib import Path
 
-app = FastAPI(title="any2json API", version="0.1.0")
+from backend.addresses import NETWORKS, AddressPool
+from backend.auth import API_KEY_PREFIX, CredentialCache
+from backend.batch import ConcurrencyLimiter, stream_batch
+from backend.egress import check_public
+from backend.jobs import JobQueue, JobRunner, public_job
+from backend.ledger import UsageLedger, usage_cost
+from backend.media import Media, is_url
+from backend.metrics import CONTENT_TYPE, Metrics, MetricsMiddleware, SlowRequestProfiler, label, stage
+from backend import pipeline
+from backend.pipeline import EGRESS_ALLOW
+from backend.ratelimit import RateLimiter, RateLimitMiddleware, SQLiteRateStore, bearer_token, limited_response
+from backend.responses import CompressionMiddleware, FastJSONResponse, body_format, document_response
+from backend.tokens import MIN_TOKENS
+from backend.users import User, UserRegistry, SQLiteUserStore
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics.start()
+    async with pipeline.running():  # the handlers' clients and worker pools
+        job_runner.start()
+        yield
+        await job_runner.stop()
+    job_queue.close()
+    await usage_ledger.stop()
+    usage_ledger.close()
+    address_pool.close()
+    await metrics.stop()
+
+
+app = FastAPI(title="any2json API", version="0.1.0", lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Accept-Encoding: zstd/br/gzip for bodies from ANY2JSON_COMPRESS_MIN_BYTES
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.environ.get("ANY2JSON_COMPRESS_MIN_BYTES", 1024)))
 
 # Config
 JWT_SECRET = secrets.token_hex(32)  # TODO: load from env
 JWT_ALGORITHM = "HS256"
 TOKEN_EXPIRY = 86400 * 7  # 7 days
+AUTH_CACHE_SIZE = int(os.environ.get("ANY2JSON_AUTH_CACHE_SIZE", 10_000))
+AUTH_CACHE_TTL = float(os.environ.get("ANY2JSON_AUTH_CACHE_TTL", 60))
 
-# In-memory store (TODO: PostgreSQL)
-users_db = {}
-addresses_pool = {}  # network -> [addresses]
-user_addresses = {}  # user_id -> {network: address}
+# User registry: in-memory indexes, persisted to SQLite when ANY2JSON_DB is set
+USERS_DB_PATH = os.environ.get("ANY2JSON_DB")
+users = UserRegistry(SQLiteUserStore(USERS_DB_PATH) if USERS_DB_PATH else None)
+credential_cache = CredentialCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
+# Pricing: conversions are billed by media type, input size and tokens returned (backend/ledger.py)
+CACHED_CONVERT_COST = 0.001  # cache hits skip the model call
+
+# Usage ledger: each billed request is committed before it is answered (SQLite file when ANY2JSON_LEDGER_DB is set)
+usage_ledger = UsageLedger(os.environ.get("ANY2JSON_LEDGER_DB", ":memory:"))
+
+# Batch fan-out: max concurrent conversions per user
+batch_limiter = ConcurrencyLimiter(int(os.environ.get("ANY2JSON_BATCH_CONCURRENCY", 8)))
+
+# Per-tier request limits; ANY2JSON_RATELIMIT_DB shares the counters across worker processes
+RATELIMIT_DB_PATH = os.environ.get("ANY2JSON_RATELIMIT_DB")
+rate_limiter = RateLimiter(SQLiteRateStore(RATELIMIT_DB_PATH) if RATELIMIT_DB_PATH else None)
+
+# Async jobs: persistent queue (SQLite file when ANY2JSON_JOBS_DB is set), worked in the background
+job_queue = JobQueue(os.environ.get("ANY2JSON_JOBS_DB", ":memory:"),
+                     max_attempts=int(os.environ.get("ANY2JSON_JOB_ATTEMPTS", 3)),
+                     backoff=float(os.environ.get("ANY2JSON_JOB_BACKOFF", 5)))
+
+# Payment addresses, one per user and network (SQLite file when ANY2JSON_ADDRESSES_DB is set);
+# bulk import with `python -m backend.addresses NETWORK FILE --db PATH`
+address_pool = AddressPool(os.environ.get("ANY2JSON_ADDRESSES_DB", ":memory:"),
+                           low_watermark=int(os.environ.get("ANY2JSON_ADDRESS_LOW_WATERMARK", 100)))
 
 
 # --- Models ---
@@ -41,9 +100,18 @@ class LoginRequest(BaseModel):
 
 class ConvertRequest(BaseModel):
     input: str
-    max_tokens: int = 500
+    max_tokens: int = Field(500, ge=MIN_TOKENS)
     type: str = "auto"
-    expand: Optional[list] = None
+    format: str = "nested"  # nested|flat|progressive, see backend.render
+    expand: Optional[List[str]] = None
+    handle: Optional[str] = None  # _handle from a previous response, reused by expand
+    cache: bool = True  # false = skip cache lookup, recompute and refresh
+
+class JobRequest(ConvertRequest):
+    webhook: Optional[str] = None  # POSTed the finished job (same body as GET /api/convert/jobs/{id})
+
+class BatchConvertRequest(BaseModel):
+    items: List[ConvertRequest]
 
 class PaymentAddressRequest(BaseModel):
     network: str  # trc20, erc20, dai, xdai
@@ -62,19 +130,50 @@ def create_token(user_id: str) -> str:
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 def verify_token(authorization: str = Header(None)) -> str:
+    """Resolve a Bearer JWT or a2j_ API key to a user id."""
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(401, "Missing or invalid token")
+    return resolve_credential(authorization.replace("Bearer ", ""))
+
+def resolve_credential(token: str) -> str:
+    """User id of a JWT or API key, through the credential cache."""
+    user_id = credential_cache.get(token)
+    if user_id:
+        return user_id
+    
+    if token.startswith(API_KEY_PREFIX):
+        user = users.get_by_api_key(token)
+        if not user:
+            raise HTTPException(401, "Invalid API key")
+        credential_cache.put(token, user.id)
+        return user.id
     
-    token = authorization.replace("Bearer ", "")
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         if payload["exp"] < time.time():
             raise HTTPException(401, "Token expired")
+        credential_cache.put(token, payload["user_id"], expires_at=payload["exp"])
         return payload["user_id"]
     except jwt.InvalidTokenError:
         raise HTTPException(401, "Invalid token")
 
 
+async def rate_limit_identity(scope: dict) -> Optional[tuple]:
+    """(user id, tier) of the request's credential; None lets it through to answer 401 itself."""
+    token = bearer_token(scope)
+    if not token:
+        return None
+    try:
+        user = users.get(resolve_credential(token))
+    except HTTPException:
+        return None
+    return (user.id, user.tier) if user else None
+
+# Tier limits on conversions (polling job status is not counted; batches are counted per item by the route)
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter, identify=rate_limit_identity,
+                   prefixes=("/api/convert",), methods=("POST",), exclude=("/api/convert/batch",))
+
+
 # --- Routes: Static ---
 
 @app.get("/", response_class=HTMLResponse)
@@ -107,23 +206,18 @@ async def cli_download():
 @app.post("/api/auth/register")
 async def register(req: RegisterRequest):
     """Register new user."""
-    if req.email in users_db:
+    if users.get_by_email(req.email):
         raise HTTPException(400, "Email already registered")
     
     user_id = secrets.token_hex(16)
-    api_key = f"a2j_{secrets.token_hex(24)}"
+    api_key = f"{API_KEY_PREFIX}{secrets.token_hex(24)}"
     
-    users_db[req.email] = {
-        "id": user_id,
-        "email": req.email,
-        "password_hash": hash_password(req.password),
-        "api_key": api_key,
-        "balance": 0.0,
-        "used": 0.0,
-        "tier": "free",
-        "totp_secret": None,
-        "totp_enabled": False
-    }
+    users.add(User(
+        id=user_id,
+        email=req.email,
+        password_hash=hash_password(req.password),
+        api_key=api_key
+    ))
     
     return {
         "token": create_token(user_id),
@@ -134,81 +228,83 @@ async def register(req: RegisterRequest):
 @app.post("/api/auth/login")
 async def login(req: LoginRequest):
     """Login user."""
-    user = users_db.get(req.email)
-    if not user or user["password_hash"] != hash_password(req.password):
+    user = users.get_by_email(req.email)
+    if not user or user.password_hash != hash_password(req.password):
         raise HTTPException(401, "Invalid credentials")
     
     # Check 2FA
-    if user["totp_enabled"]:
+    if user.totp_enabled:
         if not req.totp_code:
             return {"requires_2fa": True}
         
-        totp = pyotp.TOTP(user["totp_secret"])
+        totp = pyotp.TOTP(user.totp_secret)
         if not totp.verify(req.totp_code):
             raise HTTPException(401, "Invalid 2FA code")
     
     return {
-        "token": create_token(user["id"]),
-        "api_key": user["api_key"]
+        "token": create_token(user.id),
+        "api_key": user.api_key
     }
 
 
 # --- Routes: Account ---
 
+def get_user(user_id: str) -> User:
+    """Look up the authenticated user or fail with 404."""
+    user = users.get(user_id)
+    if not user:
+        raise HTTPException(404, "User not found")
+    return user
+
 @app.get("/api/account/balance")
 async def get_balance(user_id: str = Depends(verify_token)):
     """Get user balance."""
-    for user in users_db.values():
-        if user["id"] == user_id:
-            return {
-                "balance": user["balance"],
-                "used": user["used"],
-                "tier": user["tier"]
-            }
-    raise HTTPException(404, "User not found")
+    user = get_user(user_id)
+    return {
+        "balance": user.balance,
+        "used": round(user.used + usage_ledger.used(user.id), 6),  # User.used: usage from before the ledger
+        "tier": user.tier
+    }
 
 @app.post("/api/account/regenerate-key")
 async def regenerate_key(user_id: str = Depends(verify_token)):
     """Generate new API key."""
-    for user in users_db.values():
-        if user["id"] == user_id:
-            new_key = f"a2j_{secrets.token_hex(24)}"
-            user["api_key"] = new_key
-            return {"api_key": new_key}
-    raise HTTPException(404, "User not found")
+    user = get_user(user_id)
+    new_key = f"{API_KEY_PREFIX}{secrets.token_hex(24)}"
+    credential_cache.discard(user.api_key)
+    users.set_api_key(user, new_key)
+    return {"api_key": new_key}
 
 @app.post("/api/account/2fa/setup")
 async def setup_2fa(user_id: str = Depends(verify_token)):
     """Setup 2FA."""
-    for email, user in users_db.items():
-        if user["id"] == user_id:
-            secret = pyotp.random_base32()
-            user["totp_secret"] = secret
-            
-            totp = pyotp.TOTP(secret)
-            otpauth_url = totp.provisioning_uri(email, issuer_name="any2json")
-            
-            return {
-                "secret": secret,
-                "otpauth_url": otpauth_url
-            }
-    raise HTTPException(404, "User not found")
+    user = get_user(user_id)
+    secret = pyotp.random_base32()
+    user.totp_secret = secret
+    users.save(user)
+    
+    totp = pyotp.TOTP(secret)
+    otpauth_url = totp.provisioning_uri(user.email, issuer_name="any2json")
+    
+    return {
+        "secret": secret,
+        "otpauth_url": otpauth_url
+    }
 
 @app.post("/api/account/2fa/verify")
 async def verify_2fa(code: str, user_id: str = Depends(verify_token)):
     """Verify and enable 2FA."""
-    for user in users_db.values():
-        if user["id"] == user_id:
-            if not user["totp_secret"]:
-                raise HTTPException(400, "2FA not set up")
-            
-            totp = pyotp.TOTP(user["totp_secret"])
-            if totp.verify(code):
-                user["totp_enabled"] = True
-                return {"success": True}
-            else:
-                return {"success": False}
-    raise HTTPException(404, "User not found")
+    user = get_user(user_id)
+    if not user.totp_secret:
+        raise HTTPException(400, "2FA not set up")
+    
+    totp = pyotp.TOTP(user.totp_secret)
+    if totp.verify(code):
+        user.totp_enabled = True
+        users.save(user)
+        return {"success": True}
+    else:
+        return {"success": False}
 
 
 # --- Routes: Payments ---
@@ -217,79 +313,187 @@ async def verify_2fa(code: str, user_id: str = Depends(verify_token)):
 async def get_payment_address(req: PaymentAddressRequest, user_id: str = Depends(verify_token)):
     """Get unique payment address for user."""
     
-    network_names = {
-        "trc20": "USDT (TRC-20)",
-        "erc20": "USDT (ERC-20)",
-        "dai": "DAI (Ethereum)",
-        "xdai": "xDAI (Gnosis)"
-    }
-    
-    if req.network not in network_names:
-        raise HTTPException(400, f"Invalid network. Supported: {list(network_names.keys())}")
-    
-    # Check if user already has address for this network
-    if user_id in user_addresses and req.network in user_addresses[user_id]:
-        return {
-            "address": user_addresses[user_id][req.network],
-            "network": req.network,
-            "network_name": network_names[req.network]
-        }
+    if req.network not in NETWORKS:
+        raise HTTPException(400, f"Invalid network. Supported: {list(NETWORKS.keys())}")
     
-    # Assign new address from pool
-    if req.network not in addresses_pool or not addresses_pool[req.network]:
+    # The user's existing address for this network, else the next one from the pool
+    address = address_pool.assign(user_id, req.network)
+    if address is None:
         raise HTTPException(503, "No addresses available. Please try again later.")
     
-    address = addresses_pool[req.network].pop(0)
-    
-    if user_id not in user_addresses:
-        user_addresses[user_id] = {}
-    user_addresses[user_id][req.network] = address
-    
     return {
         "address": address,
         "network": req.network,
-        "network_name": network_names[req.network]
+        "network_name": NETWORKS[req.network]
     }
 
 
 # --- Routes: Convert ---
 
+async def run_convert(req: ConvertRequest, body: Optional[Media] = None) -> tuple:
+    """Run one conversion through the media handlers (backend/pipeline.py).
+    Returns (result, cost, cache status); billing is left to the caller.
+    
+    `body` carries uploaded media; otherwise `req.input` is fetched (URLs)
+    or decoded. A cache hit costs CACHED_CONVERT_COST; anything else is
+    priced by the detected media type, the size of the media read and the
+    tokens the result actually used.
+    """
+    result, cache_status, size = await pipeline.run_convert(pipeline.ConvertRequest(**req.model_dump()), body)
+    if cache_status == "HIT":
+        return result, CACHED_CONVERT_COST, cache_status
+    cost = usage_cost(result.get("type", "image"), size, result.get("_tokens_used", req.max_tokens))
+    return result, cost, cache_status
+
+
+async def bill(request_id: str, user: User, result: dict, cost: float, kind: str = "convert"):
+    """Record the request's charge in the usage ledger; returns once it is committed."""
+    await usage_ledger.record(request_id, user.id, cost, result.get("_tokens_used", 0), kind)
+
+
+def new_request_id() -> str:
+    return f"req_{secrets.token_urlsafe(12)}"
+
+
 @app.post("/api/convert")
-async def convert(req: ConvertRequest, user_id: str = Depends(verify_token)):
-    """Convert media to JSON."""
+async def convert(req: ConvertRequest, user_id: str = Depends(verify_token), accept: Optional[str] = Header(None)):
+    """Convert media to JSON (or MessagePack/CBOR, per Accept)."""
+    name = body_format(accept)
+    user = get_user(user_id)
+    result, cost, cache_status = await run_convert(req)
+    request_id = new_request_id()
+    await bill(request_id, user, result, cost)
     
-    # Check balance
-    for user in users_db.values():
-        if user["id"] == user_id:
-            # TODO: Calculate cost based on input type and max_tokens
-            estimated_cost = 0.01  # $0.01 per request for now
-            
-            if user["balance"] < estimated_cost and user["tier"] == "free":
-                # Allow some free requests
-                pass
-            
-            # TODO: Actual conversion logic
-            # For now, return mock response
-            result = {
-                "type": "image",
-                "summary": f"Mock response for {req.input}",
-                "elements": [
-                    {"id": "e1", "type": "mock", "content": "Integration pending"}
-                ],
-                "metadata": {
-                    "max_tokens": req.max_tokens,
-                    "input": req.input[:100]
-                },
-                "_expandable": ["e1"],
-                "_tokens_used": 85
-            }
-            
-            # Deduct balance
-            user["used"] += estimated_cost
-            
-            return result
+    with stage("serialize"):
+        return document_response(result, name, {"X-Cache": cache_status, "X-Request-Id": request_id})
+
+
+@app.post("/api/convert/upload")
+async def convert_upload(
+    file: UploadFile = File(...),
+    type: str = Form("auto"),
+    max_tokens: int = Form(500, ge=MIN_TOKENS),
+    format: str = Form("nested"),
+    expand: Optional[str] = Form(None),  # comma-separated ids
+    handle: Optional[str] = Form(None),
+    cache: bool = Form(True),
+    user_id: str = Depends(verify_token),
+    accept: Optional[str] = Header(None)
+):
+    """Convert a multipart upload without base64-encoding it."""
+    name = body_format(accept)
+    user = get_user(user_id)
+    req = ConvertRequest(input="", type=type, max_tokens=max_tokens, format=format,
+                         expand=expand.split(",") if expand else None, handle=handle, cache=cache)
+    result, cost, cache_status = await run_convert(req, Media.from_file(file.file, file.content_type))
+    request_id = new_request_id()
+    await bill(request_id, user, result, cost, "upload")
     
-    raise HTTPException(404, "User not found")
+    with stage("serialize"):
+        return document_response(result, name, {"X-Cache": cache_status, "X-Request-Id": request_id})
+
+
+@app.post("/api/convert/batch")
+async def convert_batch(batch: BatchConvertRequest, user_id: str = Depends(verify_token)):
+    """Convert many inputs; streams NDJSON lines in completion order."""
+    user = get_user(user_id)
+    label(modality="batch", tier="mixed")
+    # Each item is one request; a batch larger than the per-minute limit is refused outright (413)
+    decision = rate_limiter.check(user.id, user.tier, cost=max(len(batch.items), 1))
+    if not decision.allowed:
+        return limited_response(decision, user.tier)
+    
+    request_id = new_request_id()
+    charged = {"cost": 0.0, "tokens": 0}  # completed items; failed or cancelled ones cost nothing
+    
+    async def worker(item: ConvertRequest) -> dict:
+        result, cost, _ = await run_convert(item)
+        charged["cost"] += cost
+        charged["tokens"] += result.get("_tokens_used", 0)
+        return result
+    
+    async def charge():
+        # One ledger entry for the whole batch
+        if charged["cost"] and not charged.get("recorded"):
+            charged["recorded"] = True
+            await usage_ledger.record(request_id, user.id, round(charged["cost"], 6), charged["tokens"], "batch")
+    
+    async def lines():
+        sent = 0
+        try:
+            async for line in stream_batch(batch.items, worker, batch_limiter.checkout(user_id)):
+                sent += 1
+                if sent == len(batch.items):
+                    await charge()  # committed before the last line goes out
+                yield line
+        finally:
+            batch_limiter.checkin(user_id)
+            await charge()  # the client left early: the items that completed
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"X-Request-Id": request_id, **decision.headers()})
+
+
+# --- Routes: Jobs ---
+
+async def run_job(job: dict) -> dict:
+    """Run a queued conversion for its owner and bill it.
+    
+    Jobs go through the same media handlers as /api/convert. The job id
+    is the ledger's request id, and the charge is committed before the job
+    is marked done: a rerun after a crash is never billed twice.
+    """
+    user = get_user(job["user_id"])
+    req = ConvertRequest(**{k: v for k, v in job["request"].items() if k != "webhook"})
+    with metrics.context("job"):
+        result, cost, _ = await run_convert(req)
+    await bill(job["id"], user, result, cost, "job")
+    return result
+
+
+job_runner = JobRunner(job_queue, run_job, workers=int(os.environ.get("ANY2JSON_JOB_WORKERS", 4)),
+                       allow_hosts=EGRESS_ALLOW)
+
+# Prometheus /metrics: request and per-stage latency, in-flight, event loop lag, component counters.
+# ANY2JSON_PROFILE_SLOW_MS writes a sampled profile of every slower request to ANY2JSON_PROFILE_DIR.
+metrics = Metrics()
+if os.environ.get("ANY2JSON_PROFILE_SLOW_MS"):
+    metrics.profiler = SlowRequestProfiler(
+        os.environ.get("ANY2JSON_PROFILE_DIR", "profiles"),
+        threshold=float(os.environ["ANY2JSON_PROFILE_SLOW_MS"]) / 1000,
+        interval=float(os.environ.get("ANY2JSON_PROFILE_INTERVAL_MS", 5)) / 1000
+    )
+pipeline.collect(metrics)
+metrics.collect("ratelimit", rate_limiter.stats)
+metrics.collect("ledger", usage_ledger.stats)
+metrics.collect("jobs", job_runner.stats)
+metrics.collect("addresses", address_pool.stats, label="network")
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+
+@app.post("/api/convert/jobs", status_code=202)
+async def submit_job(req: JobRequest, user_id: str = Depends(verify_token)):
+    """Queue a conversion; poll GET /api/convert/jobs/{id} or wait for the webhook."""
+    user = get_user(user_id)
+    if req.webhook:
+        if not is_url(req.webhook):
+            raise HTTPException(400, "webhook must be an http(s) URL")
+        await check_public(req.webhook, EGRESS_ALLOW)
+    job = job_queue.submit(user.id, user.tier, req.model_dump(), req.webhook)
+    job_runner.notify()
+    return {**public_job(job), "position": job_queue.position(job)}
+
+
+@app.get("/api/convert/jobs/{job_id}")
+async def get_job(job_id: str, user_id: str = Depends(verify_token)):
+    """Job status, with the result once done."""
+    job = job_queue.get(job_id)
+    if not job or job["user_id"] != user_id:
+        raise HTTPException(404, "Job not found")
+    out = public_job(job)
+    if job["status"] == "queued":
+        out["position"] = job_queue.position(job)
+    return out
 
 
 # --- Health ---
@@ -299,15 +503,20 @@ async def health():
     return {"status": "ok", "version": "0.1.0"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text format."""
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+
 # --- Admin: Load addresses ---
 
-def load_addresses(network: str, addresses: list):
-    """Load addresses into pool (called on startup or via admin endpoint)."""
-    if network not in addresses_pool:
-        addresses_pool[network] = []
-    addresses_pool[network].extend(addresses)
+def load_addresses(network: str, addresses: Iterable[str]) -> dict:
+    """Load addresses into pool (called on startup or via admin endpoint); any iterable, e.g. an open file."""
+    return address_pool.add(network, addresses)
 
 
 if __name__ == "__main__":
+    # Run from the repo root: python -m backend.main
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,134 @@
+"""
+any2json media input helpers
+Decode ConvertRequest.input (data URI, raw base64 or URL) and hold media bodies
+"""
+
+from contextlib import contextmanager
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+from typing import Callable, Iterator, Optional
+from urllib.parse import urlsplit, urlunsplit
+import base64
+import binascii
+import hashlib
+import os
+import shutil
+
+
+def is_url(value: str) -> bool:
+    return value.startswith("http://") or value.startswith("https://")
+
+
+def normalize_url(url: str) -> str:
+    """Lower-case scheme and host and drop the fragment, which never reaches the server."""
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
+
+
+def decode_input(value: str) -> bytes:
+    """Decode base64 / data: URI input. URLs are returned as their UTF-8 bytes."""
+    if is_url(value):
+        return value.encode()
+    if value.startswith("data:"):
+        value = value.partition(",")[2]
+    try:
+        return base64.b64decode(value, validate=False)
+    except (binascii.Error, ValueError):
+        return value.encode()
+
+
+def decode_input_head(value: str, n: int) -> bytes:
+    """First `n` decoded bytes of base64 / data: URI input, decoding only a prefix."""
+    start = value.find(",") + 1 if value.startswith("data:") else 0
+    chars = "".join(value[start:start + 2 * n + 64].split())  # tolerate line-wrapped base64
+    chars = chars[:(n + 2) // 3 * 4]
+    try:
+        return base64.b64decode(chars + "=" * (-len(chars) % 4))[:n]
+    except (binascii.Error, ValueError):
+        return b""
+
+
+class Media:
+    """A media body held in a spooled temp file (memory first, disk past `spool_bytes`).
+
+    The SHA-256 digest is computed while writing, so hashing never needs
+    a second pass over the body.
+    """
+
+    def __init__(self, spool_bytes: int = 8 * 2**20, content_type: Optional[str] = None,
+                 on_close: Optional[Callable[[], None]] = None):
+        self.file = SpooledTemporaryFile(max_size=spool_bytes)
+        self.content_type = content_type
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._on_close = on_close
+
+    @classmethod
+    def from_bytes(cls, data: bytes, content_type: Optional[str] = None) -> "Media":
+        media = cls(spool_bytes=len(data) + 1, content_type=content_type)
+        media.write(data)
+        return media
+
+    @classmethod
+    def from_file(cls, file, content_type: Optional[str] = None, chunk_size: int = 2**20) -> "Media":
+        """Adopt an already spooled file (e.g. an UploadFile's), hashing it in one read pass."""
+        media = cls(spool_bytes=0, content_type=content_type)
+        media.file.close()
+        media.file = file
+        file.seek(0)
+        while chunk := file.read(chunk_size):
+            media._sha256.update(chunk)
+            media.size += len(chunk)
+        return media
+
+    @property
+    def in_memory(self) -> bool:
+        return not getattr(self.file, "_rolled", True)
+
+    @property
+    def digest(self) -> str:
+        return self._sha256.hexdigest()
+
+    def write(self, chunk: bytes):
+        self.file.write(chunk)
+        self._sha256.update(chunk)
+        self.size += len(chunk)
+
+    def rollover(self):
+        """Move the body to disk now."""
+        self.file.rollover()
+
+    def read(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def head(self, n: int) -> bytes:
+        self.file.seek(0)
+        return self.file.read(n)
+
+    def to_path(self) -> str:
+        """The body copied to a named temp file; the caller removes it."""
+        with NamedTemporaryFile(prefix="any2json-", delete=False) as out:
+            self.file.seek(0)
+            shutil.copyfileobj(self.file, out, 2**20)
+        return out.name
+
+    @contextmanager
+    def as_path(self) -> Iterator[str]:
+        """The body as a named file, for tools that need a path (e.g. ffmpeg); removed afterwards."""
+        path = self.to_path()
+        try:
+            yield path
+        finally:
+            os.unlink(path)
+
+    def close(self):
+        self.file.close()
+        if self._on_close:
+            self._on_close()
+            self._on_close = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
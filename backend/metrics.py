@@ -0,0 +1,407 @@
+"""
+any2json metrics
+Prometheus text exposition (no client library): request and per-stage
+latency histograms, in-flight gauges, event-loop lag, the components'
+stats() counters, and an opt-in sampling profiler for slow requests.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import functools
+import math
+import os
+import re
+import sys
+import threading
+import time
+import weakref
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --- Request context and stage timers ---
+
+class RequestTimings:
+    """Seconds spent per stage within one request (or job), and its labels."""
+
+    __slots__ = ("labels", "stages")
+
+    def __init__(self, **labels: str):
+        self.labels: Dict[str, str] = labels
+        self.stages: Dict[str, float] = {}
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("any2json_timings", default=None)
+_stages_in_flight: Counter = Counter()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as stage `name` of the current request. Stages that
+    overlap (parallel model calls) each count their own time."""
+    timings = _current.get()
+    _stages_in_flight[name] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stages_in_flight[name] -= 1
+        if timings is not None:
+            timings.stages[name] = timings.stages.get(name, 0.0) + time.perf_counter() - started
+
+
+def timed(name: str):
+    """Decorator: run an async function as stage `name`."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with stage(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def label(**labels: str):
+    """Label the current request (modality, tier); the first value set wins,
+    so a batch keeps what its route set rather than its last item's."""
+    timings = _current.get()
+    if timings is not None:
+        for key, value in labels.items():
+            timings.labels.setdefault(key, value)
+
+
+# --- Metric types ---
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # label values -> [count per bucket..., sum, count]
+
+    def observe(self, value: float, *labelvalues: str):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series[:len(self.buckets)] + [None]):
+                cumulative = series[-1] if count is None else cumulative + count
+                lines.append(f"{self.name}_bucket{format_labels(names, values + (format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, values)} {format_value(series[-2])}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, values)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """A value per label set, or computed at scrape time by `fn` returning {label values: value}."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 fn: Optional[Callable[[], Dict[tuple, float]]] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.fn = fn
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, *labelvalues: str):
+        self._values[labelvalues] = value
+
+    def inc(self, amount: float = 1, *labelvalues: str):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> List[str]:
+        values = self.fn() if self.fn else self._values
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"] + [
+            f"{self.name}{format_labels(self.labelnames, k)} {format_value(v)}" for k, v in values.items()
+        ]
+
+
+def keyed(value) -> bool:
+    return isinstance(value, dict) and bool(value) and all(isinstance(v, dict) for v in value.values())
+
+
+def flatten_stats(stats: dict, label: str, prefix: Tuple[str, ...] = (),
+                  labels: Tuple[tuple, ...] = ()) -> Iterator[Tuple[str, tuple, float]]:
+    """(name, ((label, value),), number) for every number in a stats() dict.
+
+    A dict of dicts is keyed by something (tier, provider, network): its
+    keys become `label` values rather than name parts. Strings are skipped.
+    """
+    if not labels and keyed(stats):
+        for name, sub in stats.items():
+            yield from flatten_stats(sub, label, prefix, ((label, str(name)),))
+        return
+    for key, value in stats.items():
+        if not labels and keyed(value):
+            for name, sub in value.items():
+                yield from flatten_stats(sub, label, prefix + (str(key),), ((label, str(name)),))
+        elif isinstance(value, dict):
+            yield from flatten_stats(value, label, prefix + (str(key),), labels)
+        elif isinstance(value, (bool, int, float)):
+            yield "_".join(prefix + (str(key),)), labels, float(value)
+
+
+# --- Registry ---
+
+class Metrics:
+    """Everything /metrics shows for one app.
+
+    Requests are timed by MetricsMiddleware; stage() blocks inside them add
+    up per request and are observed when the request ends, labeled with the
+    request's modality and budget tier.
+    """
+
+    def __init__(self, namespace: str = "any2json", lag_interval: float = 0.25):
+        self.namespace = namespace
+        self.lag_interval = lag_interval
+        labels = ("modality", "tier")
+        self.requests = Histogram(f"{namespace}_request_seconds", "Request latency, until the last body byte",
+                                  ("route", "method", "status") + labels)
+        self.stages = Histogram(f"{namespace}_stage_seconds", "Time per request spent in each stage",
+                                ("stage",) + labels)
+        self.in_flight = Gauge(f"{namespace}_requests_in_flight", "Requests being handled")
+        self.in_flight.set(0)
+        self.stages_in_flight = Gauge(f"{namespace}_stage_in_flight", "Stage blocks running now", ("stage",),
+                                      fn=lambda: {(k,): v for k, v in _stages_in_flight.items()})
+        self.loop_lag = Histogram(f"{namespace}_event_loop_lag_seconds",
+                                  "How late the event loop runs a timer", buckets=LAG_BUCKETS)
+        self.loop_lag_last = Gauge(f"{namespace}_event_loop_lag_last_seconds", "Latest event loop lag sample")
+        self.profiles = Gauge(f"{namespace}_slow_request_profiles", "Profiles written for slow requests")
+        self.profiles.set(0)
+        self.profiler: Optional[SlowRequestProfiler] = None
+        self._collectors: List[Tuple[str, Callable[[], dict], str]] = []
+        self._lag_task: Optional[asyncio.Task] = None
+
+    def collect(self, prefix: str, stats: Callable[[], dict], label: str = "name"):
+        """Expose a component's stats() numbers as `<namespace>_<prefix>_<key>`."""
+        self._collectors.append((prefix, stats, label))
+
+    @contextmanager
+    def context(self, route: str, method: str = "", **labels: str) -> Iterator[RequestTimings]:
+        """Time work outside a request (e.g. a queued job) as if it were one."""
+        timings = RequestTimings(**labels)
+        token = _current.set(timings)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield timings
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            _current.reset(token)
+            self.observe(timings, route, method, status, time.perf_counter() - started)
+
+    def observe(self, timings: RequestTimings, route: str, method: str, status: str, elapsed: float):
+        modality = timings.labels.get("modality", "")
+        tier = timings.labels.get("tier", "")
+        self.requests.observe(elapsed, route, method, status, modality, tier)
+        for name, seconds in timings.stages.items():
+            self.stages.observe(seconds, name, modality, tier)
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.requests, self.stages, self.in_flight, self.stages_in_flight,
+                       self.loop_lag, self.loop_lag_last, self.profiles):
+            lines += metric.render()
+        series: Dict[str, list] = {}
+        for prefix, stats, label in self._collectors:
+            try:
+                flat = list(flatten_stats(stats(), label))
+            except Exception:  # a failing component shouldn't take the endpoint down
+                continue
+            for name, labels, value in flat:
+                name = re.sub(r"[^a-zA-Z0-9_]", "_", f"{self.namespace}_{prefix}_{name}")
+                series.setdefault(name, []).append((labels, value))
+        for name, samples in series.items():
+            lines.append(f"# TYPE {name} untyped")
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(tuple(k for k, _ in labels), tuple(v for _, v in labels))} "
+                             f"{format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    async def _watch_loop(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, time.perf_counter() - started - self.lag_interval)
+            self.loop_lag.observe(lag)
+            self.loop_lag_last.set(lag)
+
+    def start(self):
+        """Start the loop-lag monitor (and the profiler, if set); call from the app's lifespan."""
+        self._lag_task = asyncio.create_task(self._watch_loop())
+        if self.profiler:
+            self.profiler.start(asyncio.get_running_loop())
+
+    async def stop(self):
+        if self._lag_task:
+            self._lag_task.cancel()
+            await asyncio.gather(self._lag_task, return_exceptions=True)
+        if self.profiler:
+            self.profiler.stop()
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request into `metrics`.
+
+    The route label is the matched path template (`/convert/jobs/{job_id}`),
+    so ids don't explode the series count; unmatched paths share one label.
+    """
+
+    def __init__(self, app, metrics: Metrics, skip: Tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.metrics = metrics
+        self.skip = skip
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip:
+            return await self.app(scope, receive, send)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profiler = self.metrics.profiler
+        profile = profiler.begin() if profiler and profiler.running else None
+        status = 500
+        started = time.perf_counter()
+        self.metrics.in_flight.inc(1)
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.in_flight.inc(-1)
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.metrics.observe(timings, route, scope["method"], str(status), elapsed)
+            if profile is not None and profiler.end(profile, elapsed, f"{scope['method']} {route}"):
+                self.metrics.profiles.inc(1)
+
+
+# --- Sampling profiler ---
+
+class SlowRequestProfiler:
+    """Samples the event loop thread's stack every `interval` seconds and
+    attributes each sample to the request whose task is running (tasks a
+    request spawns count as its own). Requests that take `threshold`
+    seconds or more get their samples written to `directory` as collapsed
+    stacks (one `frame;frame;frame count` line each), ready for
+    flamegraph.pl or speedscope.
+
+    Only the loop thread is sampled: time in worker pools shows up in the
+    stage histograms instead. Off unless constructed; sampling costs a
+    stack walk per interval while any request is in flight.
+    """
+
+    def __init__(self, directory: str, threshold: float, interval: float = 0.005, max_depth: int = 64):
+        self.directory = directory
+        self.threshold = threshold
+        self.interval = interval
+        self.max_depth = max_depth
+        self.running = False
+        self.written = 0
+        self._owners: "weakref.WeakKeyDictionary[asyncio.Task, Counter]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._thread_id = threading.get_ident()
+        previous = loop.get_task_factory()
+
+        def task_factory(loop, coro, **kwargs):
+            task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+            parent = asyncio.current_task(loop)
+            with self._lock:
+                if parent in self._owners:
+                    self._owners[task] = self._owners[parent]
+            return task
+
+        loop.set_task_factory(task_factory)
+        self.running = True
+        self._thread = threading.Thread(target=self._sample, name="any2json-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            self._thread.join()
+
+    def begin(self) -> Counter:
+        """Start collecting for the current task's request."""
+        samples = Counter()
+        with self._lock:
+            self._owners[asyncio.current_task()] = samples
+        return samples
+
+    def end(self, samples: Counter, elapsed: float, name: str) -> bool:
+        """Stop collecting; write the profile if the request was slow. True if written."""
+        with self._lock:
+            for task in [t for t, s in self._owners.items() if s is samples]:
+                del self._owners[task]
+        if elapsed < self.threshold or not samples:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r"[^a-zA-Z0-9]+", "-", name).strip("-")
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{slug}-{elapsed * 1000:.0f}ms.folded")
+        with open(path, "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in samples.most_common())
+        self.written += 1
+        return True
+
+    def _sample(self):
+        while self.running:
+            time.sleep(self.interval)
+            if not self._owners:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            task = asyncio.current_task(self._loop) if frame is not None else None
+            with self._lock:
+                samples = self._owners.get(task) if task is not None else None
+            if samples is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            with self._lock:
+                samples[";".join(reversed(stack))] += 1
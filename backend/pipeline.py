@@ -0,0 +1,615 @@
+"""
+any2json conversion pipeline
+The media handlers and everything they share, used by both the converter
+(app.py) and the account API (backend/main.py): fetching URL inputs, type
+sniffing, per-modality analysis, token fitting, the result cache, the
+analysis store for `expand`, and coalescing of identical requests.
+"""
+
+from contextlib import ExitStack, asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+import asyncio
+import os
+import subprocess
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+
+from backend.analysis import AnalysisState, AnalysisStore
+from backend.audio import (DECODE_RATE, TARGET_CHUNK_SEC, SilenceChunker, ffmpeg_blocks, is_wav,
+                           wav_blocks, wav_bytes, wav_info)
+from backend.cache import ResultCache, cache_key, content_digest
+from backend.coalesce import SingleFlight
+from backend import document
+from backend.document import DocumentAnalyzer, build_sections, section_budget
+from backend.fetch import MediaFetcher
+from backend.media import Media, decode_input, decode_input_head, is_url, normalize_url
+from backend.metrics import Metrics, label, stage
+from backend.preprocess import PROFILES, ImagePreprocessor, budget_tier
+from backend import render
+from backend.sniff import SNIFF_BYTES, sniff
+from backend.speech import speech_client_from_env
+from backend.streaming import collect_document, document_events
+from backend import tokens
+from backend.tokens import TokenCounter, fit_document, fit_events
+from backend.video import FFMPEG, FFPROBE, VideoAnalyzer, format_time, probe
+from backend.vision import client_from_env, get_expand_prompt, get_prompt_for_budget, to_document
+
+# URLs requested on a client's behalf (inputs, their redirects, job webhooks) must resolve to public
+# addresses; ANY2JSON_EGRESS_ALLOW lists hosts exempt, comma-separated (e.g. a local test server)
+EGRESS_ALLOW = frozenset(filter(None, os.environ.get("ANY2JSON_EGRESS_ALLOW", "").split(",")))
+
+# Shared pooled downloader for URL inputs
+fetcher = MediaFetcher(
+    max_bytes=int(os.environ.get("ANY2JSON_FETCH_MAX_MB", 200)) * 2**20,
+    spool_bytes=int(os.environ.get("ANY2JSON_FETCH_SPOOL_MB", 8)) * 2**20,
+    memory_limit=int(os.environ.get("ANY2JSON_FETCH_MEMORY_MB", 256)) * 2**20,
+    per_host=int(os.environ.get("ANY2JSON_FETCH_PER_HOST", 8)),
+    allow_hosts=EGRESS_ALLOW
+)
+
+# Budget-tier resize/recompress ahead of the vision call, on a worker pool
+PREPROCESS_WORKERS = int(os.environ.get("ANY2JSON_PREPROCESS_WORKERS", 4))
+preprocessor = ImagePreprocessor(
+    executor=ProcessPoolExecutor(PREPROCESS_WORKERS)
+    if os.environ.get("ANY2JSON_PREPROCESS_POOL") == "process"
+    else ThreadPoolExecutor(PREPROCESS_WORKERS, thread_name_prefix="preprocess")
+)
+
+# Vision model calls: OpenAI/Anthropic when keyed, else the offline stub (see backend/vision.py)
+vision = client_from_env()
+
+# Transcription: OpenAI Whisper when keyed, else the offline stub (see backend/speech.py)
+speech = speech_client_from_env()
+AUDIO_PARALLEL = int(os.environ.get("ANY2JSON_AUDIO_PARALLEL", 16))  # chunks in flight per recording
+
+# Video scene scoring and keyframe extraction: one ffmpeg per worker process
+video_analyzer = VideoAnalyzer(
+    ProcessPoolExecutor(int(os.environ.get("ANY2JSON_VIDEO_WORKERS", os.cpu_count() or 1))),
+    sample_fps=float(os.environ.get("ANY2JSON_VIDEO_SAMPLE_FPS", 4))
+)
+
+# PDF/DOCX outline and page extraction, pages spread over worker processes
+document_analyzer = DocumentAnalyzer(
+    ProcessPoolExecutor(int(os.environ.get("ANY2JSON_DOCUMENT_WORKERS", os.cpu_count() or 1)))
+)
+
+# Result cache: memory LRU, plus a disk tier when ANY2JSON_CACHE_DIR is set
+result_cache = ResultCache(
+    max_entries=int(os.environ.get("ANY2JSON_CACHE_ENTRIES", 1024)),
+    disk_dir=os.environ.get("ANY2JSON_CACHE_DIR"),
+    disk_max_bytes=int(os.environ.get("ANY2JSON_CACHE_DISK_MB", 1024)) * 2**20
+)
+
+# Analysis state kept for follow-up `expand` calls
+analysis_store = AnalysisStore(
+    ttl=float(os.environ.get("ANY2JSON_ANALYSIS_TTL", 1800)),
+    max_bytes=int(os.environ.get("ANY2JSON_ANALYSIS_MB", 256)) * 2**20,
+    max_entries=int(os.environ.get("ANY2JSON_ANALYSIS_ENTRIES", 1000))
+)
+
+# Concurrent identical conversions share one fetch + model call
+flights = SingleFlight()
+
+# Exact output token counts when a tiktoken encoding is named, else the estimator
+if os.environ.get("ANY2JSON_TOKENIZER"):
+    tokens.counter = TokenCounter.from_tiktoken(os.environ["ANY2JSON_TOKENIZER"])
+
+
+# --- Lifecycle ---
+
+_holders = 0  # apps inside running()
+
+
+@asynccontextmanager
+async def running():
+    """Keep the clients and worker pools open; the last app to leave closes them."""
+    global _holders
+    _holders += 1
+    try:
+        yield
+    finally:
+        _holders -= 1
+        if not _holders:
+            await fetcher.aclose()
+            await vision.aclose()
+            await speech.aclose()
+            preprocessor.shutdown()
+            video_analyzer.shutdown()
+            document_analyzer.shutdown()
+
+
+def collect(metrics: Metrics):
+    """Register the pipeline's component counters with an app's /metrics."""
+    metrics.collect("cache", result_cache.stats)
+    metrics.collect("flights", flights.stats)
+    metrics.collect("fetch", fetcher.stats)
+    metrics.collect("preprocess", preprocessor.stats, label="tier")
+    metrics.collect("vision", vision.stats, label="provider")
+    metrics.collect("speech", speech.stats, label="provider")
+    metrics.collect("video", video_analyzer.stats)
+    metrics.collect("document", document_analyzer.stats)
+    metrics.collect("analysis", analysis_store.stats)
+
+
+# --- Models ---
+
+class ConvertRequest(BaseModel):
+    input: str  # URL or base64
+    type: str = "auto"  # auto|image|video|audio|document
+    max_tokens: int = Field(500, ge=tokens.MIN_TOKENS)
+    format: str = "nested"  # nested|flat|progressive, see backend.render
+    expand: Optional[List[str]] = None
+    handle: Optional[str] = None  # _handle from a previous response, reused by expand
+    cache: bool = True  # false = skip cache lookup, recompute and refresh
+    stream: bool = False  # true = chunked JSON (or SSE with Accept: text/event-stream)
+
+
+# --- Handlers ---
+# A handler takes the input Media (and closes it), the token budget and a fresh
+# AnalysisState to fill with what `expand` needs later, and yields document events.
+
+async def image_events(source: Media, max_tokens: int, state: AnalysisState):
+    """Process image with vision model, yielding head, elements and trailer as produced."""
+    with source:
+        state.media = source.read()
+    
+    # Downscale/recompress for the budget tier before it goes to the model
+    image = await preprocessor.run(state.media, state.digest, max_tokens)
+    
+    raw = await vision.analyze(get_prompt_for_budget(max_tokens, "image"), image, max_tokens)
+    async for event in document_events(to_document(raw, "image", max_tokens)):
+        yield event
+
+
+async def video_events(source: Media, max_tokens: int, state: AnalysisState):
+    """Segment scenes, then describe one keyframe per scene; scenes stream out in order."""
+    if FFMPEG is None or FFPROBE is None:
+        source.close()
+        raise HTTPException(501, "Video support needs ffmpeg on the server")
+    
+    # Decode-heavy work runs on the video pool against a temp file; the body never loads into memory
+    with source, source.as_path() as path:
+        try:
+            analysis = await video_analyzer.scenes(path, max_tokens)
+            scenes = analysis["scenes"]
+            frames = await video_analyzer.keyframes(path, [at for _, _, at in scenes],
+                                                    PROFILES[budget_tier(max_tokens)]["max_side"])
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError):  # ffprobe/ffmpeg failed or hung
+            raise HTTPException(400, "Cannot read video")
+    
+    ids = [f"s{i}" for i in range(1, len(scenes) + 1)]
+    state.frames = dict(zip(ids, frames))
+    per_scene = max(60, max_tokens // len(scenes))
+    calls = [asyncio.create_task(vision.analyze(get_prompt_for_budget(per_scene, "video frame"), frame, per_scene))
+             for frame in frames]
+    try:
+        yield "head", {
+            "type": "video",
+            "duration_sec": round(analysis["duration"]),
+            "summary": f"{len(scenes)} scene(s) over {format_time(analysis['duration'])}"
+        }
+        for scene_id, (start, end, _), call in zip(ids, scenes, calls):
+            raw = await call
+            scene = {"id": scene_id, "time": f"{format_time(start)}-{format_time(end)}"}
+            if raw.get("label"):
+                scene["label"] = raw["label"]
+            scene["summary"] = raw.get("summary") or raw.get("raw") or ""
+            yield "element", scene
+        yield "trailer", {
+            "metadata": {
+                "width": analysis["width"],
+                "height": analysis["height"],
+                "fps": analysis["fps"],
+                "max_tokens_requested": max_tokens
+            },
+            "_expandable": ids
+        }
+    finally:
+        for call in calls:
+            call.cancel()
+
+
+async def audio_events(source: Media, max_tokens: int, state: AnalysisState):
+    """Cut at silences and transcribe chunks in parallel; segments stream out in order.
+    
+    Decoding runs ahead of transcription by at most AUDIO_PARALLEL chunks, so
+    memory stays flat however long the recording is. Segment text is cut to
+    share max_tokens across the whole recording; full text comes with `expand`.
+    """
+    with ExitStack() as stack:
+        stack.enter_context(source)
+        riff = is_wav(source.head(12))
+        wav = wav_info(source.file) if riff else None
+        if wav:
+            rate, duration = wav
+            blocks = wav_blocks(source.file)
+        elif FFMPEG and FFPROBE:
+            path = stack.enter_context(source.as_path())
+            try:
+                rate, duration = DECODE_RATE, (await asyncio.to_thread(probe, path))["duration"]
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError):
+                raise HTTPException(400, "Cannot decode audio")
+            blocks = ffmpeg_blocks(path, rate)
+        elif riff:
+            raise HTTPException(400, "Cannot decode audio: only 16-bit PCM WAV is read without ffmpeg")
+        else:
+            raise HTTPException(501, "Audio other than WAV needs ffmpeg on the server")
+        
+        chunker = SilenceChunker(rate)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=AUDIO_PARALLEL)
+        
+        def transcribe(chunk):
+            start, end, samples = chunk
+            return start, end, asyncio.create_task(speech.analyze("", wav_bytes(samples, rate), max_tokens))
+        
+        async def produce():
+            try:
+                async for block in blocks:
+                    for chunk in chunker.feed(block):
+                        await queue.put(transcribe(chunk))
+                for chunk in chunker.flush():
+                    await queue.put(transcribe(chunk))
+                await queue.put(None)
+            except ValueError as e:
+                await queue.put(HTTPException(400, f"Cannot decode audio: {e}"))
+            except Exception as e:
+                await queue.put(e)
+        
+        expected = max(1, round(duration / TARGET_CHUNK_SEC))
+        text_chars = max(40, int(((max_tokens - 80) / expected - 15) * tokens.counter.chars_per_token))
+        producer = asyncio.create_task(produce())
+        ids = []
+        try:
+            yield "head", {
+                "type": "audio",
+                "duration_sec": round(duration),
+                "summary": f"Transcript of {format_time(duration)} of audio"
+            }
+            while (item := await queue.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                start, end, call = item
+                text = (await call).get("text", "").strip()
+                segment = {"id": f"t{len(ids) + 1}", "time": f"{format_time(start)}-{format_time(end)}"}
+                state.expanded[segment["id"]] = {**segment, "text": text}
+                if len(text) > text_chars:
+                    text = text[:text_chars].rsplit(" ", 1)[0] + "…"
+                ids.append(segment["id"])
+                yield "element", {**segment, "text": text}
+            yield "trailer", {
+                "metadata": {
+                    "sample_rate": rate,
+                    "max_tokens_requested": max_tokens
+                },
+                "_expandable": ids
+            }
+        finally:
+            producer.cancel()
+            while not queue.empty():
+                item = queue.get_nowait()
+                if isinstance(item, tuple):
+                    item[2].cancel()
+
+
+async def doc_events(source: Media, max_tokens: int, state: AnalysisState):
+    """Outline a PDF/DOCX into sections; above OUTLINE_TOKENS each gets an excerpt of its first pages.
+    
+    Only the pages the response shows are extracted, so a long document at a
+    small budget costs about what a short one does. Full section text comes
+    with `expand`.
+    """
+    detected = sniff(source.head(SNIFF_BYTES))
+    format = detected[1] if detected and detected[0] == "document" else "unknown"
+    if format not in document.FORMATS:
+        source.close()
+        raise HTTPException(400, f"Document format '{format}' not supported. Supported: {', '.join(document.FORMATS)}")
+    if format == "pdf" and document.pypdf is None:
+        source.close()
+        raise HTTPException(501, "PDF support needs pypdf on the server")
+    
+    # The file stays with the analysis, so `expand` maps it again instead of holding the bytes
+    with source:
+        state.path = path = source.to_path()
+    try:
+        try:
+            outline = await document_analyzer.outline(path, format)
+        except Exception as e:  # encrypted, truncated or not really a PDF/zip
+            raise HTTPException(400, f"Cannot read document: {e.__class__.__name__}: {e}")
+        sections = build_sections(outline["units"], outline["marks"],
+                                  section_budget(max_tokens, outline["units"]))
+        
+        # Outline: untitled sections get a title from their first page; detail: enough pages for an excerpt
+        detail = max_tokens > document.OUTLINE_TOKENS
+        text_chars = int(((max_tokens - 80) / max(len(sections), 1) - 40) * tokens.counter.chars_per_token)
+        pages = -(-text_chars // document.CHARS_PER_PAGE)
+        ranges = [(first, min(last, first + pages if detail else first + 1)) for first, last, _ in sections]
+        wanted = [i for i, (_, _, title) in enumerate(sections) if detail or not title]
+        content = await document_analyzer.extract(path, outline, [ranges[i] for i in wanted])
+        excerpts = dict(zip(wanted, content))
+        
+        ids = [f"s{i}" for i in range(1, len(sections) + 1)]
+        state.context["format"] = format
+        state.context["sections"] = {i: [first, last] for i, (first, last, _) in zip(ids, sections)}
+        head = {"type": "document", "pages": outline["units"]} if format == "pdf" else {"type": "document"}
+        units = "page" if format == "pdf" else "section"
+        head["summary"] = f"{outline['title'] or 'Untitled'}: {outline['units']} {units}(s) in {len(sections)} part(s)"
+        yield "head", head
+        for n, (element_id, (first, last, title)) in enumerate(zip(ids, sections)):
+            parts = excerpts.get(n, [])
+            headings = [h for part in parts for h in part["headings"]]
+            element = {"id": element_id, "title": title or (headings[0] if headings else None)}
+            if format == "pdf":
+                element["pages"] = f"{first + 1}-{last}" if last - first > 1 else str(first + 1)
+            if detail:
+                text = "\n".join(part["text"] for part in parts if part["text"])
+                element["text"] = text[:text_chars].rsplit(" ", 1)[0] + "…" if len(text) > text_chars else text
+                tables = sum(len(part["tables"]) for part in parts)
+                if tables:
+                    element["tables"] = tables
+            elif element["title"] is None and parts and parts[0]["text"]:
+                element["title"] = parts[0]["text"].split("\n", 1)[0][:60]
+            yield "element", element
+    except BaseException:  # failed or abandoned before the trailer: the analysis is never stored
+        state.discard()
+        raise
+    yield "trailer", {
+        "metadata": {
+            "format": format,
+            "title": outline["title"],
+            "author": outline["author"],
+            "max_tokens_requested": max_tokens
+        },
+        "_expandable": ids
+    }
+
+
+# media type -> (handler, name of the document's list field)
+HANDLERS = {
+    "image": (image_events, "elements"),
+    "video": (video_events, "scenes"),
+    "audio": (audio_events, "segments"),
+    "document": (doc_events, "sections"),
+}
+
+
+def new_analysis(digest: str, media_type: str) -> AnalysisState:
+    return AnalysisState(digest=digest, media_type=media_type, media=b"", elements={}, context={})
+
+
+async def expand_elements(state: AnalysisState, ids: List[str], max_tokens: int, format: str = "nested") -> dict:
+    """Detail the requested elements of a stored analysis.
+
+    Only ids not expanded before cost a follow-up model call; the decoded
+    media (or the element's own frame) and model context come from the stored state.
+    """
+    list_key = HANDLERS[state.media_type][1]
+    unknown = [i for i in ids if i not in state.elements]
+    if unknown:
+        raise HTTPException(400, f"Unknown element ids: {unknown}. Expandable: {list(state.elements)}")
+    
+    async def detail(element_id: str):
+        element = state.elements[element_id]
+        image = state.frames.get(element_id) or media
+        raw = await vision.analyze(get_expand_prompt(element, state.context), image, max_tokens)
+        state.expanded[element_id] = {**element, "details": raw.get("details", raw.get("raw"))}
+    
+    missing = [i for i in dict.fromkeys(ids) if i not in state.expanded]
+    if missing and state.media_type == "document":
+        await expand_sections(state, missing)
+    elif missing:
+        media = await preprocessor.run(state.media, state.digest, max_tokens) if state.media else None
+        await asyncio.gather(*(detail(i) for i in missing))
+    analysis_store.touch(state)
+    
+    elements = [state.expanded[i] for i in ids]
+    if state.media_type == "document":
+        # A section can run to hundreds of pages; its text is cut to a share of the budget
+        share = (max_tokens - tokens.TRAILER_RESERVE - 40) / len(elements)
+        elements = [document.fit_section(element, share, tokens.counter) for element in elements]
+    
+    # progressive is the overview ids are picked from; what they expand to is sent in full
+    format = "nested" if format == "progressive" else format
+    return fit_document({
+        "type": state.media_type,
+        "summary": state.context["summary"],
+        list_key: elements,
+        "metadata": {
+            "max_tokens_requested": max_tokens
+        },
+        "_expandable": [i for i in state.elements if i not in ids],
+        "_handle": state.handle
+    }, max_tokens, list_key, format)
+
+
+async def expand_sections(state: AnalysisState, ids: List[str]):
+    """Extract every page of the requested document sections, in parallel on the document pool."""
+    if state.path is None:  # the file went with a state too large for the analysis store
+        raise HTTPException(413, "Document is too large to keep for expand (see ANY2JSON_ANALYSIS_MB)")
+    ranges = [tuple(state.context["sections"][i]) for i in ids]
+    outline = await document_analyzer.outline(state.path, state.context["format"])
+    content = await document_analyzer.extract(state.path, outline, ranges)
+    for element_id, parts in zip(ids, content):
+        state.expanded[element_id] = {
+            **state.elements[element_id],
+            "headings": [h for part in parts for h in part["headings"]],
+            "text": "\n\n".join(part["text"] for part in parts if part["text"]),
+            "tables": [table for part in parts for table in part["tables"]]
+        }
+
+
+def remember_analysis(state: AnalysisState, result: dict, max_tokens: int,
+                      list_key: str = "elements") -> AnalysisState:
+    """Persist a fresh conversion's analysis so `expand` can reuse it."""
+    state.elements = {e["id"]: e for e in result.get(list_key) or []}
+    state.context = {
+        **state.context,  # whatever the handler kept for expansion
+        "prompt": get_prompt_for_budget(max_tokens, state.media_type),
+        "summary": result.get("summary"),
+        "max_tokens": max_tokens
+    }
+    analysis_store.put(state)
+    return state
+
+
+async def remembered(events, state: AnalysisState, max_tokens: int, list_key: str = "elements"):
+    """Pass document events through; at the trailer, store the full analysis under a handle."""
+    document = {}
+    async for kind, data in events:
+        if kind == "head":
+            document.update(data)
+            document[list_key] = []
+        elif kind == "element":
+            document[list_key].append(data)
+        else:
+            document.update(data)
+            remember_analysis(state, document, max_tokens, list_key)
+            data = {**data, "_handle": state.handle}
+        yield kind, data
+
+
+async def caching(events, key: str, list_key: str = "elements"):
+    """Pass document events through; at the trailer, cache the document as sent."""
+    document = {}
+    async for kind, data in events:
+        if kind == "head":
+            document.update(data)
+            document[list_key] = []
+        elif kind == "element":
+            document[list_key].append(data)
+        else:
+            document.update(data)
+            await result_cache.put(key, document)
+        yield kind, data
+
+
+# --- Dispatch ---
+
+async def read_input(value: str) -> Media:
+    """Media for a request input: downloaded for URLs, decoded otherwise."""
+    if is_url(value):
+        return await fetcher.fetch(value)
+    with stage("decode"):
+        return Media.from_bytes(decode_input(value))
+
+
+async def detect_type(value: str, body: Optional[Media] = None) -> str:
+    """Media type from magic bytes; reads only the first few KB of the input."""
+    if body:
+        head = body.head(SNIFF_BYTES)
+    elif is_url(value):
+        head = await fetcher.fetch_head(value, SNIFF_BYTES)
+    else:
+        head = decode_input_head(value, SNIFF_BYTES)
+    detected = sniff(head)
+    # Unrecognized inputs keep the MVP default
+    return detected[0] if detected else "image"
+
+
+async def convert_events(request: ConvertRequest, body: Optional[Media] = None) -> tuple:
+    """Resolve one conversion to (cache status, list field name, document events, input size).
+    
+    `body` carries uploaded media; otherwise `request.input` is read. The
+    size is the bytes of media read for it (0 when a stored analysis is
+    expanded), which is what conversions are billed on.
+    """
+    
+    if request.type == "auto":
+        with stage("sniff"):
+            request.type = await detect_type(request.input, body)
+    
+    if request.type not in HANDLERS:
+        if body:
+            body.close()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Type '{request.type}' not yet supported. Supported: {', '.join(HANDLERS)}"
+        )
+    if request.format not in render.FORMATS:
+        if body:
+            body.close()
+        raise HTTPException(400, f"Format '{request.format}' not supported. Supported: {', '.join(render.FORMATS)}")
+    handler, list_key = HANDLERS[request.type]
+    label(modality=request.type, tier=budget_tier(request.max_tokens))
+    
+    # A live handle means the media was already decoded and analyzed
+    state = analysis_store.get(request.handle)
+    if state and (request.expand or state.media or state.path):
+        source, digest, size = None, state.digest, 0
+        if body:
+            body.close()
+    else:
+        state = None
+        source = body or await read_input(request.input)
+        digest, size = source.digest, source.size
+    
+    key = cache_key(digest, request.max_tokens, request.type, request.format, request.expand)
+    if request.cache:
+        cached = await result_cache.get(key)
+        if cached is not None:
+            if source:
+                source.close()
+            return "HIT", list_key, document_events(cached, list_key), size
+    status = "MISS" if request.cache else "BYPASS"
+    
+    if request.expand:
+        state = state or analysis_store.find(digest)
+        if state is None:
+            # Cold expand: run the full analysis once, then drill down
+            state = new_analysis(digest, request.type)
+            first = await collect_document(handler(source, request.max_tokens, state), list_key)
+            remember_analysis(state, first, request.max_tokens, list_key)
+        elif source:
+            source.close()
+        result = await expand_elements(state, request.expand, request.max_tokens, request.format)
+        await result_cache.put(key, result)
+        return status, list_key, document_events(result, list_key), size
+    
+    # Analysis keeps every element; the response is trimmed to max_tokens, then cached
+    if not source:
+        source = Media.from_file(open(state.path, "rb")) if state.path else Media.from_bytes(state.media)
+        size = source.size
+    fresh = new_analysis(digest, request.type)
+    events = remembered(handler(source, request.max_tokens, fresh), fresh, request.max_tokens, list_key)
+    events = fit_events(events, request.max_tokens, list_key, request.format)
+    return status, list_key, caching(events, key, list_key), size
+
+
+def flight_key(request: ConvertRequest, body: Optional[Media] = None) -> str:
+    """Identity of a conversion before its input is read: same source, same options."""
+    if body:
+        source = body.digest
+    elif is_url(request.input):
+        source = normalize_url(request.input)
+    else:
+        source = content_digest(request.input.encode())
+    key = cache_key(source, request.max_tokens, request.type, request.format, request.expand)
+    return f"{key}:{request.handle or ''}:{int(request.cache)}"
+
+
+async def coalesced_events(request: ConvertRequest, body: Optional[Media] = None) -> tuple:
+    """convert_events, computed once for concurrent identical requests.
+
+    Each caller gets its own replay of the shared document events.
+    """
+    async def start():
+        cache_status, list_key, events, size = await convert_events(request, body)
+        return (cache_status, list_key, size), events
+    
+    try:
+        (cache_status, list_key, size), events, shared = await flights.stream(flight_key(request, body), start)
+    except Exception:
+        if body:
+            body.close()
+        raise
+    # The leader's handler owns (and closes) its body; a waiter's own copy is unused
+    if body and shared:
+        body.close()
+    return cache_status, list_key, events, size
+
+
+async def run_convert(request: ConvertRequest, body: Optional[Media] = None) -> tuple:
+    """Run one conversion. Returns (result, cache status, input size)."""
+    cache_status, list_key, events, size = await coalesced_events(request, body)
+    return await collect_document(events, list_key), cache_status, size
@@ -0,0 +1,129 @@
+"""
+any2json image preprocessing
+Resize, recompress and strip metadata according to the max_tokens detail tier,
+off the event loop, before the vision call.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import asyncio
+import io
+import time
+
+from backend.metrics import timed
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it images pass through untouched
+    Image = None
+
+
+# Same thresholds as get_prompt_for_budget
+TIER_LIMITS = (
+    (200, "tldr"),
+    (500, "summary"),
+    (2000, "detailed"),
+)
+
+PROFILES = {
+    "tldr": {"max_side": 512, "quality": 60},
+    "summary": {"max_side": 1024, "quality": 75},
+    "detailed": {"max_side": 1568, "quality": 85},
+    "exhaustive": {"max_side": 2048, "quality": 90},
+}
+
+
+def budget_tier(max_tokens: int) -> str:
+    for limit, tier in TIER_LIMITS:
+        if max_tokens <= limit:
+            return tier
+    return "exhaustive"
+
+
+def preprocess_image(data: bytes, tier: str) -> Tuple[bytes, str]:
+    """Downscale to the tier's max side and re-encode without EXIF/ICC/XMP.
+
+    Returns (bytes, format). Opaque images become JPEG, images with alpha
+    PNG. The original is kept if it cannot be decoded or re-encoding would
+    make it larger without shrinking its dimensions.
+    """
+    if Image is None:
+        return data, "original"
+    profile = PROFILES[tier]
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.draft("RGB", (profile["max_side"], profile["max_side"]))  # JPEG DCT-domain downscale
+        image = ImageOps.exif_transpose(image)
+    except Exception:
+        return data, "original"
+
+    resized = max(image.size) > profile["max_side"]
+    if resized:
+        image.thumbnail((profile["max_side"], profile["max_side"]), Image.LANCZOS)
+
+    out = io.BytesIO()
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image.save(out, "PNG", optimize=True)
+        fmt = "png"
+    else:
+        image.convert("RGB").save(out, "JPEG", quality=profile["quality"], optimize=True)
+        fmt = "jpeg"
+
+    if not resized and out.tell() >= len(data):
+        return data, "original"
+    return out.getvalue(), fmt
+
+
+class ImagePreprocessor:
+    """Runs preprocess_image on an executor, caching results by (input digest, tier)."""
+
+    def __init__(self, executor: Optional[Executor] = None, cache_bytes: int = 64 * 2**20):
+        self.executor = executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="preprocess")
+        self.cache_bytes = cache_bytes
+        self._cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._cached_bytes = 0
+        self._stats: Dict[str, dict] = {}
+
+    @timed("preprocess")
+    async def run(self, data: bytes, digest: str, max_tokens: int) -> bytes:
+        tier = budget_tier(max_tokens)
+        key = (digest, tier)
+        stats = self._stats.setdefault(tier, {"images": 0, "cache_hits": 0, "bytes_in": 0,
+                                              "bytes_out": 0, "seconds": 0.0})
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            stats["cache_hits"] += 1
+            return cached
+
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        prepared, _ = await loop.run_in_executor(self.executor, preprocess_image, data, tier)
+        stats["images"] += 1
+        stats["bytes_in"] += len(data)
+        stats["bytes_out"] += len(prepared)
+        stats["seconds"] += time.perf_counter() - start
+
+        # A concurrent miss on the same key may have cached it while this one ran
+        if key not in self._cache and len(prepared) <= self.cache_bytes:
+            self._cache[key] = prepared
+            self._cached_bytes += len(prepared)
+            while self._cached_bytes > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+        return prepared
+
+    def stats(self) -> dict:
+        """Per tier: images processed, bytes saved and mean latency added."""
+        return {
+            tier: {
+                **s,
+                "bytes_saved": s["bytes_in"] - s["bytes_out"],
+                "mean_ms": s["seconds"] / s["images"] * 1000 if s["images"] else 0.0,
+            }
+            for tier, s in self._stats.items()
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,246 @@
+"""
+any2json rate limiting
+Per-tier request limits: a token bucket for the per-minute rate and a
+sliding-window counter for the daily quota, both O(1) per request, kept in
+memory or in a SQLite file shared by several server processes.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import math
+import sqlite3
+import time
+
+from fastapi.responses import JSONResponse
+
+
+# tier -> (requests per minute, requests per day), as documented in docs/API.md
+TIER_LIMITS: Dict[str, Tuple[int, int]] = {
+    "free": (10, 100),
+    "paid": (60, 10_000),
+}
+DEFAULT_TIER = "free"
+DAY = 86400.0
+
+# tokens, bucket updated at, current day window start, previous window count, current window count
+State = Tuple[float, float, float, float, float]
+
+
+@dataclass(slots=True)
+class RateDecision:
+    allowed: bool
+    limit: int  # per minute
+    remaining: int
+    reset: float  # seconds until the minute bucket is full again
+    day_limit: int
+    day_remaining: int
+    retry_after: float = 0.0
+    cost: int = 1
+    fits: bool = True  # False: `cost` is more than the limits allow at all, so waiting won't help
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(min(self.remaining, self.day_remaining)),
+            "X-RateLimit-Reset": str(math.ceil(self.reset)),
+            "X-RateLimit-Limit-Day": str(self.day_limit),
+            "X-RateLimit-Remaining-Day": str(self.day_remaining),
+        }
+        if not self.allowed and self.fits:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def take(state: Optional[State], now: float, per_minute: int, per_day: int,
+         cost: int = 1) -> Tuple[State, RateDecision]:
+    """Charge `cost` requests against a key's state if both limits allow it.
+
+    The bucket holds `per_minute` tokens and refills continuously. The day
+    count is a sliding window approximated from two fixed windows: the
+    previous day's count, weighted by how much of it still overlaps, plus
+    the current one's. A cost above either limit is refused without
+    charging anything (`fits` is False).
+    """
+    if state is None:
+        state = (float(per_minute), now, now // DAY * DAY, 0.0, 0.0)
+    tokens, updated, window, prev, count = state
+    tokens = min(float(per_minute), tokens + (now - updated) * per_minute / 60)
+    start = now // DAY * DAY
+    if start != window:
+        prev, count, window = (count if start - window == DAY else 0.0), 0.0, start
+    overlap = 1 - (now - window) / DAY
+    used = prev * overlap + count
+
+    fits = cost <= per_minute and cost <= per_day
+    allowed = fits and tokens >= cost and used + cost <= per_day
+    retry_after = 0.0
+    if allowed:
+        tokens -= cost
+        count += cost
+        used += cost
+    elif fits:
+        if tokens < cost:
+            retry_after = (cost - tokens) * 60 / per_minute
+        if used + cost > per_day:
+            # Until enough of the previous window slides out, or the next window starts
+            excess = used + cost - per_day
+            wait = excess / prev * DAY if prev and excess <= prev * overlap else window + DAY - now
+            retry_after = max(retry_after, wait)
+    decision = RateDecision(
+        allowed=allowed,
+        limit=per_minute,
+        remaining=int(tokens),
+        reset=(per_minute - tokens) * 60 / per_minute,
+        day_limit=per_day,
+        day_remaining=max(0, int(per_day - used)),
+        retry_after=retry_after,
+        cost=cost,
+        fits=fits,
+    )
+    return (tokens, now, window, prev, count), decision
+
+
+# --- Stores ---
+
+class MemoryRateStore:
+    """Per-process state: an LRU of at most `max_keys` keys (an evicted key starts fresh)."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._states: "OrderedDict[str, State]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def update(self, key: str, fn: Callable[[Optional[State]], Tuple[State, RateDecision]]) -> RateDecision:
+        state, decision = fn(self._states.get(key))
+        self._states[key] = state
+        self._states.move_to_end(key)
+        if len(self._states) > self.max_keys:
+            self._states.popitem(last=False)
+        return decision
+
+
+class SQLiteRateStore:
+    """State shared by every process opening the same file, e.g. uvicorn --workers N.
+
+    Each check is one short IMMEDIATE transaction, so concurrent processes
+    serialize on the key's read-modify-write.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # counters, not money: an OS crash may lose the last few
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                window REAL NOT NULL,
+                prev REAL NOT NULL,
+                count REAL NOT NULL
+            )
+        """)
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+    def update(self, key: str, fn: Callable[[Optional[State]], Tuple[State, RateDecision]]) -> RateDecision:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("SELECT tokens, updated, window, prev, count FROM rate_limits WHERE key = ?",
+                                    (key,)).fetchone()
+            state, decision = fn(row)
+            self.conn.execute("INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?, ?, ?)", (key, *state))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return decision
+
+    def close(self):
+        self.conn.close()
+
+
+class RateLimiter:
+    """Tier limits (TIER_LIMITS) for keys such as user ids."""
+
+    def __init__(self, store=None, limits: Optional[Dict[str, Tuple[int, int]]] = None):
+        self.store = store if store is not None else MemoryRateStore()
+        self.limits = limits or TIER_LIMITS
+        self.allowed = 0
+        self.limited = 0
+
+    def check(self, key: str, tier: str, cost: int = 1) -> RateDecision:
+        per_minute, per_day = self.limits.get(tier) or self.limits[DEFAULT_TIER]
+        now = time.time()
+        decision = self.store.update(key, lambda state: take(state, now, per_minute, per_day, cost))
+        if decision.allowed:
+            self.allowed += 1
+        else:
+            self.limited += 1
+        return decision
+
+    def stats(self) -> dict:
+        return {"allowed": self.allowed, "limited": self.limited, "keys": len(self.store)}
+
+
+def limited_response(decision: RateDecision, tier: str) -> JSONResponse:
+    if not decision.fits:
+        detail = (f"Batch of {decision.cost} items exceeds the per-minute limit of {decision.limit} requests "
+                  f"on the {tier} tier. Split it into smaller batches.")
+        return JSONResponse({"detail": detail}, status_code=413, headers=decision.headers())
+    detail = (f"Rate limit exceeded: {decision.limit} requests/min and {decision.day_limit}/day "
+              f"on the {tier} tier. Retry in {max(1, math.ceil(decision.retry_after))} s.")
+    return JSONResponse({"detail": detail}, status_code=429, headers=decision.headers())
+
+
+class RateLimitMiddleware:
+    """ASGI middleware limiting requests whose path starts with one of `prefixes`.
+
+    `identify(scope)` returns (key, tier), or None to let the request through
+    unlimited (e.g. no or bad credentials: the route itself answers 401).
+    Limited requests get a 429; every checked response carries the
+    X-RateLimit-* headers. Paths in `exclude` are left to the route, which
+    knows what they cost (a batch counts each item).
+    """
+
+    def __init__(self, app, limiter: RateLimiter, identify: Callable[[dict], Awaitable[Optional[Tuple[str, str]]]],
+                 prefixes: Tuple[str, ...] = ("/",), methods: Tuple[str, ...] = ("POST",),
+                 exclude: Tuple[str, ...] = ()):
+        self.app = app
+        self.limiter = limiter
+        self.identify = identify
+        self.prefixes = prefixes
+        self.methods = methods
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in self.methods or \
+                not scope["path"].startswith(self.prefixes) or scope["path"] in self.exclude:
+            return await self.app(scope, receive, send)
+        identity = await self.identify(scope)
+        if identity is None:
+            return await self.app(scope, receive, send)
+        key, tier = identity
+        decision = self.limiter.check(key, tier)
+        if not decision.allowed:
+            return await limited_response(decision, tier)(scope, receive, send)
+        extra = [(k.lower().encode(), v.encode()) for k, v in decision.headers().items()]
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+def bearer_token(scope: dict) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            value = value.decode("latin-1")
+            return value[7:] if value.startswith("Bearer ") else None
+    return None
@@ -0,0 +1,94 @@
+"""
+any2json output formats
+Renders a document's events in the requested `format`, one event at a time
+and without copying element values, so streamed, buffered and cached
+responses share one shape:
+- nested: one object per element (the shape handlers produce)
+- flat: a `columns` list, then one row (array) per element
+- progressive: [id, gist] per element, to `expand` the ones worth reading
+"""
+
+from typing import Iterator, List, Optional
+
+from backend.streaming import Event
+
+
+FORMATS = ("nested", "flat", "progressive")
+GIST_CHARS = 60  # progressive: characters of an element's gist
+GIST_FIELDS = ("label", "title", "content", "summary", "text", "type")
+
+
+def element_id(data) -> Optional[str]:
+    """Id of an element in any format: a row's or pair's first value."""
+    if isinstance(data, dict):
+        return data.get("id")
+    return data[0] if data else None
+
+
+def gist(element: dict) -> str:
+    """The element's first non-empty GIST_FIELDS string, cut at a word to GIST_CHARS."""
+    for key in GIST_FIELDS:
+        value = element.get(key)
+        if isinstance(value, str) and value.strip():
+            # Only the part that can show is normalized: a transcript segment may be long
+            text = " ".join(value[:GIST_CHARS + 1].split())
+            if len(value) > GIST_CHARS:
+                text = text[:GIST_CHARS + 1].rsplit(" ", 1)[0] + "…"
+            return text
+    return ""
+
+
+class Renderer:
+    """Event-by-event renderer for one document.
+
+    `feed()` takes the handler's events in order and returns the rendered
+    ones. `flat` holds the head back until the first element (or the
+    trailer) arrives, because that element's keys become the `columns`,
+    sent in the head just before the list. Later rows follow the same
+    columns: a missing field is null (trailing nulls are dropped) and
+    fields outside the columns go in an object after the last column.
+    """
+
+    def __init__(self, format: str = "nested"):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format '{format}'")
+        self.format = format
+        self.columns: Optional[List[str]] = None
+        self._known = set()
+        self._head: Optional[dict] = None
+
+    def feed(self, kind: str, data: dict) -> List[Event]:
+        if self.format == "nested":
+            return [(kind, data)]
+        if kind == "head":
+            if self.format == "progressive":
+                return [(kind, data)]
+            self._head = data
+            return []
+        if kind == "element":
+            if self.format == "progressive":
+                return [(kind, [element_id(data), gist(data)])]
+            out = []
+            if self.columns is None:
+                self.columns = sorted(data, key=lambda k: k != "id")  # stable: id first, then the element's order
+                self._known = set(self.columns)
+                out.append(("head", {**self._head, "columns": self.columns}))
+            out.append((kind, self.row(data)))
+            return out
+        if self.format == "flat" and self.columns is None:  # no elements at all
+            self.columns = []
+            return [("head", {**self._head, "columns": []}), (kind, data)]
+        return [(kind, data)]
+
+    def row(self, element: dict) -> list:
+        """Values in column order; a row with extra fields is one longer than `columns`."""
+        values = [element.get(column) for column in self.columns]
+        if not element.keys() <= self._known:
+            return values + [{k: v for k, v in element.items() if k not in self._known}]
+        while values and values[-1] is None:
+            values.pop()
+        return values
+
+    def events(self, events: Iterator[Event]) -> Iterator[Event]:
+        for kind, data in events:
+            yield from self.feed(kind, data)
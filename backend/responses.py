@@ -0,0 +1,224 @@
+"""
+any2json response encoding
+Compact JSON bodies (orjson when installed), optional MessagePack/CBOR
+bodies chosen by Accept, and zstd/br/gzip compression chosen by
+Accept-Encoding for bodies above a size threshold, streamed ones included.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import zlib
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
+
+from backend.streaming import dumpb
+
+try:
+    import brotli
+except ImportError:  # optional: br is offered only when installed
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import msgpack
+except ImportError:  # optional binary body formats
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+MIN_COMPRESS_BYTES = 1024  # smaller bodies aren't worth a Content-Encoding
+OFFLOAD_BYTES = 128 * 1024  # compress bodies at least this big off the event loop
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "application/msgpack", "application/cbor",
+                "text/")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the same encoder as the streamed body (backend.streaming.dumpb)."""
+
+    def render(self, content) -> bytes:
+        return dumpb(content)
+
+
+# --- Body format (Accept) ---
+
+FORMATS: Dict[str, Tuple[str, Optional[Callable[[object], bytes]]]] = {
+    "json": ("application/json", dumpb),
+    "msgpack": ("application/msgpack", msgpack.packb if msgpack else None),
+    "cbor": ("application/cbor", cbor2.dumps if cbor2 else None),
+}
+ALIASES = {"application/x-msgpack": "application/msgpack", "application/vnd.msgpack": "application/msgpack"}
+
+
+def parse_accept(value: str) -> List[Tuple[str, float]]:
+    """(token, q) pairs of an Accept or Accept-Encoding header."""
+    items = []
+    for part in value.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, number = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        if token:
+            items.append((token.strip().lower(), q))
+    return items
+
+
+def negotiate_format(accept: Optional[str]) -> Optional[str]:
+    """The body format the client prefers among those available; JSON on ties
+    or without an Accept header. None if none is acceptable."""
+    if not accept:
+        return "json"
+    ranges = [(ALIASES.get(token, token), q) for token, q in parse_accept(accept)]
+    best, best_q = None, 0.0
+    for name, (media_type, encode) in FORMATS.items():
+        if encode is None:
+            continue
+        # The most specific matching range decides the quality
+        matches = [(token.count("*"), q) for token, q in ranges
+                   if token in (media_type, media_type.split("/")[0] + "/*", "*/*")]
+        q = min(matches)[1] if matches else 0.0
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def body_format(accept: Optional[str]) -> str:
+    """negotiate_format, or a 406; check before doing the work."""
+    name = negotiate_format(accept)
+    if name is None:
+        available = [media_type for media_type, encode in FORMATS.values() if encode]
+        raise HTTPException(406, f"Not acceptable. Available: {', '.join(available)}")
+    return name
+
+
+def document_response(content: dict, name: str, headers: Optional[dict] = None) -> Response:
+    """A conversion result as JSON, MessagePack or CBOR (a body_format name)."""
+    headers = {**(headers or {}), "Vary": "Accept"}
+    if name == "json":
+        return FastJSONResponse(content, headers=headers)
+    media_type, encode = FORMATS[name]
+    return Response(encode(content), media_type=media_type, headers=headers)
+
+
+# --- Compression (Accept-Encoding) ---
+
+class Compressor:
+    """Incremental compressor; `chunk()` output is decodable as soon as it is sent."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        elif encoding == "br":
+            self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "zstd":
+            return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.encoding == "br":
+            return self._obj.process(data) + self._obj.flush()
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "zstd":
+            return self._obj.compress(data) + self._obj.flush()
+        if self.encoding == "br":
+            return self._obj.process(data) + self._obj.finish()
+        return self._obj.compress(data) + self._obj.flush()
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """Server preference order: better ratio at similar speed first."""
+    return tuple(e for e, ok in (("zstd", zstandard), ("br", brotli), ("gzip", True)) if ok)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Highest-q available encoding; server preference on ties. None for identity."""
+    if not accept_encoding:
+        return None
+    offered = dict(parse_accept(accept_encoding))
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = offered.get(encoding, offered.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing compressible responses.
+
+    A body sent in one piece is compressed whole if it is at least
+    `minimum_size` bytes (off the event loop when large). A streamed body
+    (chunked JSON, NDJSON, SSE) is compressed chunk by chunk with a flush
+    after each, so clients still see every event as soon as it is sent.
+    """
+
+    def __init__(self, app, minimum_size: int = MIN_COMPRESS_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor: Optional[Compressor] = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                start = message  # held until the first body part shows whether to compress
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+            body, more = message.get("body", b""), message.get("more_body", False)
+            if start is None:  # past the first body part
+                if compressor is None:
+                    return await send(message)
+                out = compressor.chunk(body) if more else compressor.finish(body)
+                return await send({**message, "body": out})
+
+            response_start, start = start, None
+            headers = MutableHeaders(raw=list(response_start["headers"]))
+            media_type = headers.get("content-type", "")
+            if "content-encoding" in headers or not media_type.startswith(COMPRESSIBLE) or \
+                    (not more and len(body) < self.minimum_size):
+                await send(response_start)
+                return await send(message)
+
+            compressor = Compressor(encoding)
+            headers["Content-Encoding"] = encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more:
+                del headers["Content-Length"]
+                out = compressor.chunk(body)
+            elif len(body) >= OFFLOAD_BYTES:
+                out = await asyncio.to_thread(compressor.finish, body)  # zlib/brotli/zstd release the GIL
+            else:
+                out = compressor.finish(body)
+            if not more:
+                headers["Content-Length"] = str(len(out))
+            await send({**response_start, "headers": headers.raw})
+            await send({**message, "body": out})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,86 @@
+"""
+any2json content sniffing
+Detect media type and container format from the first few KB of an input
+"""
+
+from typing import Optional, Tuple
+
+
+SNIFF_BYTES = 4096  # enough for every signature below, including zip entry names
+
+FTYP_BRANDS = {
+    b"M4A ": ("audio", "m4a"),
+    b"M4B ": ("audio", "m4a"),
+    b"M4P ": ("audio", "m4a"),
+    b"heic": ("image", "heic"),
+    b"heix": ("image", "heic"),
+    b"mif1": ("image", "heic"),
+    b"msf1": ("image", "heic"),
+    b"avif": ("image", "avif"),
+    b"qt  ": ("video", "mov"),
+}
+
+OOXML_PARTS = (
+    (b"word/", "docx"),
+    (b"xl/", "xlsx"),
+    (b"ppt/", "pptx"),
+)
+
+
+def sniff(head: bytes) -> Optional[Tuple[str, str]]:
+    """(media type, format) from the leading bytes of a file, or None if unknown.
+
+    Media types match ConvertRequest.type: image|video|audio|document.
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image", "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image", "png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image", "gif"
+    if head.startswith(b"BM") and head[6:10] == b"\x00\x00\x00\x00":
+        return "image", "bmp"
+    if head.startswith((b"II*\x00", b"MM\x00*")):
+        return "image", "tiff"
+
+    if head.startswith(b"RIFF") and len(head) >= 12:
+        kind = head[8:12]
+        if kind == b"WEBP":
+            return "image", "webp"
+        if kind == b"WAVE":
+            return "audio", "wav"
+        if kind == b"AVI ":
+            return "video", "avi"
+
+    if head[4:8] == b"ftyp":
+        return FTYP_BRANDS.get(head[8:12], ("video", "mp4"))
+    if head.startswith(b"\x1a\x45\xdf\xa3"):  # EBML
+        return "video", "webm" if b"webm" in head[:64] else "mkv"
+
+    if head.startswith(b"ID3"):
+        return "audio", "mp3"
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        # MPEG frame sync; layer bits 00 mean ADTS AAC
+        return ("audio", "aac") if head[1] & 0x06 == 0 else ("audio", "mp3")
+    if head.startswith(b"OggS"):
+        return "audio", "ogg"
+    if head.startswith(b"fLaC"):
+        return "audio", "flac"
+
+    if head.startswith(b"%PDF-"):
+        return "document", "pdf"
+    if head.startswith(b"{\\rtf"):
+        return "document", "rtf"
+    if head.startswith(b"PK\x03\x04"):
+        return _sniff_zip(head)
+    return None
+
+
+def _sniff_zip(head: bytes) -> Optional[Tuple[str, str]]:
+    """Office Open XML files are zips; look at the entry names in the local headers."""
+    if b"[Content_Types].xml" not in head:
+        return None
+    for marker, fmt in OOXML_PARTS:
+        if marker in head:
+            return "document", fmt
+    return "document", "ooxml"
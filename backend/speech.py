@@ -0,0 +1,88 @@
+"""
+any2json speech backends
+Transcription providers (OpenAI Whisper, offline stub) plugged into the same
+VisionClient machinery as the vision models: pooled client, per-provider
+semaphores, jittered retries, hedging and latency/error stats.
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import random
+import wave
+
+import httpx
+
+from backend.vision import VisionBackend, VisionClient, VisionError
+
+STUB_WORDS = ("so", "the", "next", "slide", "shows", "revenue", "growth", "we", "expect", "users",
+              "to", "launch", "in", "march", "and", "then", "questions", "thanks", "everyone", "okay")
+
+
+def stub_transcript(audio: bytes, words_per_sec: float = 2.5) -> str:
+    """Deterministic fake transcript, as long as the WAV's speech would be."""
+    try:
+        with wave.open(io.BytesIO(audio)) as reader:
+            seconds = reader.getnframes() / reader.getframerate()
+    except (wave.Error, EOFError):
+        seconds = len(audio) / 32000
+    rng = random.Random(hashlib.sha256(audio[:4096] + audio[-4096:]).digest())
+    return " ".join(rng.choice(STUB_WORDS) for _ in range(max(1, int(seconds * words_per_sec))))
+
+
+class OpenAISpeechBackend(VisionBackend):
+    """Audio transcriptions API (also served by backend/stub_server.py)."""
+
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str = "whisper-1",
+                 base_url: str = "https://api.openai.com/v1", concurrency: int = 8):
+        super().__init__(api_key, model, base_url, concurrency)
+
+    async def complete(self, client: httpx.AsyncClient, prompt: str, audio: bytes, max_tokens: int) -> dict:
+        try:
+            response = await client.post(
+                f"{self.base_url}/audio/transcriptions",
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                data={"model": self.model, "response_format": "json", "prompt": prompt},
+                files={"file": ("chunk.wav", audio, "audio/wav")}
+            )
+        except httpx.HTTPError as e:
+            raise VisionError(None, f"{e.__class__.__name__}: {e}")
+        if response.status_code >= 400:
+            raise VisionError.from_response(response)
+        return {"text": response.json().get("text", "")}
+
+
+class StubSpeechBackend(VisionBackend):
+    """In-process fake transcriber: no network, deterministic text, optional latency."""
+
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0, concurrency: int = 64):
+        super().__init__("", "stub", "", concurrency)
+        self.latency = latency
+
+    async def complete(self, client, prompt, audio, max_tokens):
+        if self.latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+        return {"text": stub_transcript(audio)}
+
+
+def speech_client_from_env() -> VisionClient:
+    """Transcription client: OpenAI when OPENAI_API_KEY (or ANY2JSON_OPENAI_BASE_URL) is set,
+    always the offline stub, defaulting to ANY2JSON_SPEECH_PROVIDER or the first real one."""
+    env = os.environ.get
+    concurrency = int(env("ANY2JSON_SPEECH_CONCURRENCY", 8))
+    speech = VisionClient(retries=int(env("ANY2JSON_VISION_RETRIES", 2)),
+                          timeout=float(env("ANY2JSON_VISION_TIMEOUT", 60)), stage="transcribe")
+    if env("OPENAI_API_KEY") or env("ANY2JSON_OPENAI_BASE_URL"):
+        speech.add(OpenAISpeechBackend(env("OPENAI_API_KEY", "stub"),
+                                       model=env("ANY2JSON_SPEECH_MODEL", "whisper-1"),
+                                       base_url=env("ANY2JSON_OPENAI_BASE_URL", "https://api.openai.com/v1"),
+                                       concurrency=concurrency))
+    speech.add(StubSpeechBackend(latency=float(env("ANY2JSON_STUB_LATENCY_MS", 0)) / 1000))
+    if env("ANY2JSON_SPEECH_PROVIDER"):
+        speech.default = env("ANY2JSON_SPEECH_PROVIDER")
+    return speech
@@ -0,0 +1,144 @@
+"""
+any2json response streaming
+Documents are produced as events: ("head", {...}), ("element", {...})*, ("trailer", {...}),
+where the elements make up the document's list field (`elements` by default).
+They are encoded either as chunked JSON (byte-identical to the buffered
+response body) or as Server-Sent Events.
+"""
+
+from collections import deque
+from typing import AsyncIterator, Iterable, Tuple
+import json
+import time
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is slower (and spells exponents 1e+16)
+    orjson = None
+
+
+Event = Tuple[str, dict]
+
+
+def dumpb(obj) -> bytes:
+    """Compact UTF-8 JSON: no whitespace, non-ASCII kept as is. Used for every
+    response body and for token counting, so all of them agree byte for byte."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:  # e.g. ints beyond 64 bits: let the stdlib handle it
+            pass
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def dumps(obj) -> str:
+    return dumpb(obj).decode()
+
+
+async def document_events(document: dict, list_key: str = "elements") -> AsyncIterator[Event]:
+    """Replay a finished document (e.g. a cache hit) as events."""
+    keys = list(document)
+    split = keys.index(list_key)
+    yield "head", {k: document[k] for k in keys[:split]}
+    for element in document[list_key]:
+        yield "element", element
+    yield "trailer", {k: document[k] for k in keys[split + 1:]}
+
+
+async def collect_document(events: AsyncIterator[Event], list_key: str = "elements") -> dict:
+    """Assemble events into the buffered document."""
+    document = {}
+    async for kind, data in events:
+        if kind == "head":
+            document.update(data)
+            document[list_key] = []
+        elif kind == "element":
+            document[list_key].append(data)
+        else:
+            document.update(data)
+    return document
+
+
+async def started(events: AsyncIterator[Event]) -> AsyncIterator[Event]:
+    """`events`, with its first event already awaited.
+
+    A stream's status line goes out with its first chunk, so errors raised
+    before the head (bad input, unsupported media) must surface here to
+    get their own status instead of cutting a 200 response short.
+    """
+    first = await anext(events, None)
+
+    async def replay():
+        if first is not None:
+            yield first
+        async for event in events:
+            yield event
+
+    return replay()
+
+
+def _members(data: dict) -> Iterable[str]:
+    return (f"{dumps(k)}:{dumps(v)}" for k, v in data.items())
+
+
+async def encode_json_stream(events: AsyncIterator[Event], list_key: str = "elements") -> AsyncIterator[bytes]:
+    """Chunked JSON: concatenated chunks equal dumps(collect_document(events))."""
+    async for kind, data in events:
+        if kind == "head":
+            head = ",".join(_members(data))
+            yield ("{" + head + ("," if head else "") + dumps(list_key) + ":[").encode()
+            first = True
+        elif kind == "element":
+            yield (("" if first else ",") + dumps(data)).encode()
+            first = False
+        else:
+            trailer = ",".join(_members(data))
+            yield ("]" + ("," if trailer else "") + trailer + "}").encode()
+
+
+async def encode_sse(events: AsyncIterator[Event]) -> AsyncIterator[bytes]:
+    """Server-Sent Events: one `head`, `element` and `trailer` event each."""
+    async for kind, data in events:
+        yield f"event: {kind}\ndata: {dumps(data)}\n\n".encode()
+
+
+class LatencyTracker:
+    """Recent time-to-first-byte and total latency samples, per response mode."""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples = {}  # mode -> (ttfb deque, total deque)
+
+    def record(self, mode: str, ttfb: float, total: float):
+        if mode not in self._samples:
+            self._samples[mode] = (deque(maxlen=self.window), deque(maxlen=self.window))
+        ttfbs, totals = self._samples[mode]
+        ttfbs.append(ttfb)
+        totals.append(total)
+
+    async def track(self, mode: str, chunks: AsyncIterator[bytes],
+                    start: float = None) -> AsyncIterator[bytes]:
+        """Pass chunks through, timing the first one and the whole stream
+        from `start` (a time.perf_counter() value, defaults to now)."""
+        start = time.perf_counter() if start is None else start
+        ttfb = None
+        async for chunk in chunks:
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            yield chunk
+        total = time.perf_counter() - start
+        self.record(mode, total if ttfb is None else ttfb, total)
+
+    def summary(self) -> dict:
+        def pct(samples, q):
+            ordered = sorted(samples)
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+        return {
+            mode: {
+                "count": len(totals),
+                "ttfb_p50": pct(ttfbs, 0.5), "ttfb_p99": pct(ttfbs, 0.99),
+                "total_p50": pct(totals, 0.5), "total_p99": pct(totals, 0.99),
+            }
+            for mode, (ttfbs, totals) in self._samples.items()
+        }
@@ -0,0 +1,133 @@
+"""
+any2json stub model server
+Offline stand-in for the model providers: OpenAI-style /v1/chat/completions and
+/v1/audio/transcriptions, and Anthropic-style /v1/messages, answering with
+deterministic output after a configurable delay. Point ANY2JSON_OPENAI_BASE_URL
+at it for load tests. /webhook is a local receiver for job webhooks.
+Run from the repo root: python -m backend.stub_server
+"""
+
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse
+import asyncio
+import json
+import os
+import random
+import time
+
+from backend.speech import stub_transcript
+from backend.vision import stub_completion
+
+app = FastAPI(title="any2json stub model", version="0.1.0")
+
+# Config
+LATENCY_MS = float(os.environ.get("ANY2JSON_STUB_LATENCY_MS", 50))  # mean; uniform ±50%
+ERROR_RATE = float(os.environ.get("ANY2JSON_STUB_ERROR_RATE", 0))  # share of 503 answers
+
+stats = {"requests": 0, "errors": 0}
+webhooks = []  # last deliveries received on /webhook
+
+
+async def answer(prompt: str, image_size: int, max_tokens: int):
+    """Delay like a model would, then (content, usage) or None for an injected failure."""
+    stats["requests"] += 1
+    await asyncio.sleep(random.uniform(0.5, 1.5) * LATENCY_MS / 1000)
+    if random.random() < ERROR_RATE:
+        stats["errors"] += 1
+        return None
+    content = json.dumps(stub_completion(prompt, image_size, max_tokens))
+    return content, {"input": len(prompt) // 4 + image_size // 750, "output": len(content) // 4}
+
+
+def overloaded() -> JSONResponse:
+    return JSONResponse({"error": {"message": "stub overloaded"}}, status_code=503)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt, image_size = "", 0
+    for message in body.get("messages", []):
+        if message.get("role") != "user":
+            continue
+        for part in message.get("content") or []:
+            if part.get("type") == "text":
+                prompt = part["text"]
+            elif part.get("type") == "image_url":
+                image_size = len(part["image_url"]["url"]) * 3 // 4
+    result = await answer(prompt, image_size, body.get("max_tokens", 500))
+    if result is None:
+        return overloaded()
+    content, usage = result
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                     "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": usage["input"], "completion_tokens": usage["output"],
+                  "total_tokens": usage["input"] + usage["output"]}
+    }
+
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    body = await request.json()
+    prompt, image_size = "", 0
+    for message in body.get("messages", []):
+        for part in message.get("content") or []:
+            if part.get("type") == "text":
+                prompt = part["text"]
+            elif part.get("type") == "image":
+                image_size = len(part["source"].get("data", "")) * 3 // 4
+    result = await answer(prompt, image_size, body.get("max_tokens", 500))
+    if result is None:
+        return overloaded()
+    content, usage = result
+    return {
+        "id": "msg_stub",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "stub"),
+        "content": [{"type": "text", "text": content}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": usage["input"], "output_tokens": usage["output"]}
+    }
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(file: UploadFile = File(...), model: str = Form("whisper-1"),
+                         prompt: str = Form("")):
+    audio = await file.read()
+    stats["requests"] += 1
+    await asyncio.sleep(random.uniform(0.5, 1.5) * LATENCY_MS / 1000)
+    if random.random() < ERROR_RATE:
+        stats["errors"] += 1
+        return overloaded()
+    return {"text": stub_transcript(audio)}
+
+
+@app.post("/webhook")
+async def receive_webhook(request: Request):
+    """Record a job webhook; fails like the models do at ANY2JSON_STUB_ERROR_RATE."""
+    if random.random() < ERROR_RATE:
+        return overloaded()
+    webhooks.append({"received_at": time.time(), "job": request.headers.get("x-any2json-job"),
+                     "body": await request.json()})
+    del webhooks[:-1000]
+    return {"ok": True}
+
+
+@app.get("/webhook")
+async def list_webhooks():
+    return webhooks
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", **stats}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.environ.get("ANY2JSON_STUB_PORT", 8400)))
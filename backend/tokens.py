@@ -0,0 +1,202 @@
+"""
+any2json token accounting
+Count the tokens of output JSON and make documents fit `max_tokens` by pruning
+elements into `_expandable`, one event at a time so streamed and buffered
+responses are trimmed identically. Elements are counted as rendered (see
+backend.render), so a compact format fits more of them.
+"""
+
+from typing import AsyncIterator, Callable, Iterable, List, Optional
+import math
+
+from backend.metrics import stage
+from backend.render import Renderer, element_id
+from backend.streaming import Event, dumps
+
+
+# Room kept for the trailer (text, metadata, _expandable, _handle, _tokens_used)
+TRAILER_RESERVE = 40
+# Smallest max_tokens accepted: the widest head (type, a short summary, columns,
+# the empty list) plus TRAILER_RESERVE
+MIN_TOKENS = 100
+
+
+class TokenCounter:
+    """Tokens in a piece of text.
+
+    Uses `exact` (text -> int, e.g. a tiktoken encoder) when set, otherwise a
+    cheap estimate: ASCII characters / `chars_per_token`, plus
+    `multibyte_weight` per extra UTF-8 byte, so CJK text lands near one
+    token per character. `calibrate` fits `chars_per_token` to an exact
+    tokenizer on sample outputs.
+    """
+
+    def __init__(self, chars_per_token: float = 3.6, multibyte_weight: float = 0.4,
+                 exact: Optional[Callable[[str], int]] = None):
+        self.chars_per_token = chars_per_token
+        self.multibyte_weight = multibyte_weight
+        self.exact = exact
+
+    @classmethod
+    def from_tiktoken(cls, encoding: str = "cl100k_base") -> "TokenCounter":
+        import tiktoken  # optional dependency
+        encoder = tiktoken.get_encoding(encoding)
+        return cls(exact=lambda text: len(encoder.encode(text, disallowed_special=())))
+
+    def __call__(self, text: str) -> float:
+        if self.exact:
+            return self.exact(text)
+        if text.isascii():
+            return len(text) / self.chars_per_token
+        extra = len(text.encode()) - len(text)
+        return len(text) / self.chars_per_token + extra * self.multibyte_weight
+
+    def calibrate(self, samples: Iterable[str], exact: Callable[[str], int]) -> float:
+        """Fit chars_per_token to `exact` on ASCII samples; returns the new ratio."""
+        chars = tokens = 0
+        for text in samples:
+            if text.isascii():
+                chars += len(text)
+                tokens += exact(text)
+        if tokens:
+            self.chars_per_token = chars / tokens
+        return self.chars_per_token
+
+
+counter = TokenCounter()
+
+
+def count_tokens(obj, tokens: Optional[TokenCounter] = None) -> int:
+    """Tokens in `obj` serialized as the API sends it."""
+    return math.ceil((tokens or counter)(dumps(obj)))
+
+
+def shrink(data: dict, allowance: float, tokens: TokenCounter, protect: tuple = ("type",)) -> dict:
+    """Cut `data`'s public string fields (longest first, marked with "…"), then null
+    its public fields, leaving `protect` whole, until it serializes within `allowance` tokens."""
+    data = dict(data)
+    cost = tokens(dumps(data))
+    strings = sorted((k for k, v in data.items() if not k.startswith("_") and k not in protect and isinstance(v, str)),
+                     key=lambda k: -len(data[k]))
+    for key in strings:
+        for _ in range(3):
+            if cost <= allowance or not data[key]:
+                break
+            value = data[key]
+            keep = int(len(value) * (1 - (cost - allowance) / max(tokens(value), 1))) - 1
+            data[key] = value[:max(keep, 0)].rstrip() + "…" if keep > 0 else ""
+            cost = tokens(dumps(data))
+    for key in reversed([k for k in data if not k.startswith("_")]):
+        if cost <= allowance:
+            break
+        if data[key] is not None and key not in protect:
+            data[key] = None
+            cost = tokens(dumps(data))
+    return data
+
+
+class BudgetFitter:
+    """Greedy, in-order fit of a document's events to `max_tokens`.
+
+    The head (type, summary) is always sent, shortened if it alone would
+    not leave TRAILER_RESERVE. Each element is admitted if it still fits
+    with TRAILER_RESERVE left over; the ones that don't are dropped and
+    their ids appended to the trailer's `_expandable`, so the client can
+    fetch them with `expand`. Elements come in the model's order, which is
+    also their priority. The trailer's public fields are shortened to what
+    is left, and it gets the real `_tokens_used`.
+    """
+
+    def __init__(self, max_tokens: int, tokens: Optional[TokenCounter] = None,
+                 list_key: str = "elements", reserve: int = TRAILER_RESERVE):
+        self.max_tokens = max_tokens
+        self.tokens = tokens or counter
+        self.list_key = list_key
+        self.limit = max_tokens - reserve
+        self.used = 0.0
+        self.kept = 0
+        self.pruned: List[str] = []
+        self.ids_cost = 0.0  # _expandable entries, charged up front and counted again with the trailer
+
+    def head(self, data: dict) -> dict:
+        empty_list = self.tokens(dumps({self.list_key: []})) - self.tokens("{}")
+        data = shrink(data, self.limit - empty_list, self.tokens, protect=("type", "columns"))
+        self.used += self.tokens(dumps({**data, self.list_key: []}))
+        return data
+
+    def element(self, data) -> bool:
+        """Whether to send this element (an object, or a row in the compact formats)."""
+        # Its id will be listed in _expandable, whether it is sent or not
+        data_id = element_id(data)
+        id_cost = self.tokens(dumps(data_id) + ",") if data_id is not None else 0.0
+        cost = self.tokens(dumps(data)) + (self.tokens(",") if self.kept else 0)
+        if self.used + cost + id_cost <= self.limit:
+            self.used += cost + id_cost
+            self.ids_cost += id_cost
+            self.kept += 1
+            return True
+        if data_id is not None:
+            self.pruned.append(data_id)
+            self.used += id_cost
+            self.ids_cost += id_cost
+        return False
+
+    def trailer(self, data: dict) -> dict:
+        data = dict(data)
+        if self.pruned:
+            expandable = list(data.get("_expandable") or [])
+            data["_expandable"] = expandable + [i for i in self.pruned if i not in expandable]
+        data.pop("_tokens_used", None)
+        data["_tokens_used"] = self.max_tokens  # placeholder of about the final width
+        used = self.used - self.ids_cost
+        data = shrink(data, self.max_tokens - used, self.tokens)
+        total = used + self.tokens(dumps(data))
+        data["_tokens_used"] = math.ceil(total)
+        return data
+
+
+def _fit(fitter: BudgetFitter, kind: str, data):
+    """One rendered event trimmed by `fitter`; None if it is dropped."""
+    if kind == "head":
+        return fitter.head(data)
+    if kind == "element":
+        return data if fitter.element(data) else None
+    return fitter.trailer(data)
+
+
+async def fit_events(events: AsyncIterator[Event], max_tokens: int,
+                     list_key: str = "elements", format: str = "nested") -> AsyncIterator[Event]:
+    """Render a document's events in `format` and trim them to `max_tokens` as they pass through."""
+    renderer = Renderer(format)
+    fitter = BudgetFitter(max_tokens, list_key=list_key)
+    async for event in events:
+        with stage("render"):
+            rendered = renderer.feed(*event)
+        for kind, data in rendered:
+            with stage("tokens"):
+                data = _fit(fitter, kind, data)
+            if data is not None:
+                yield kind, data
+
+
+def fit_document(document: dict, max_tokens: int, list_key: str = "elements", format: str = "nested") -> dict:
+    """Render and trim a finished document; same result as fit_events."""
+    renderer = Renderer(format)
+    fitter = BudgetFitter(max_tokens, list_key=list_key)
+    keys = list(document)
+    split = keys.index(list_key)
+    events = [("head", {k: document[k] for k in keys[:split]}),
+              *(("element", element) for element in document[list_key]),
+              ("trailer", {k: document[k] for k in keys[split + 1:]})]
+    fitted = {}
+    with stage("tokens"):
+        for kind, data in renderer.events(events):
+            data = _fit(fitter, kind, data)
+            if kind == "head":
+                fitted.update(data)
+                fitted[list_key] = []
+            elif kind == "element" and data is not None:
+                fitted[list_key].append(data)
+            elif kind == "trailer":
+                fitted.update(data)
+    return fitted
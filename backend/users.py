@@ -0,0 +1,159 @@
+"""
+any2json user registry
+Indexed user records (by id, email, api_key) with pluggable persistence
+"""
+
+from dataclasses import dataclass, fields
+from typing import Dict, Iterator, Optional
+import sqlite3
+
+from backend.auth import credential_digest
+
+
+# --- Records ---
+
+@dataclass(slots=True)
+class User:
+    id: str
+    email: str
+    password_hash: str
+    api_key: str
+    balance: float = 0.0
+    used: float = 0.0
+    tier: str = "free"
+    totp_secret: Optional[str] = None
+    totp_enabled: bool = False
+
+
+USER_FIELDS = tuple(f.name for f in fields(User))
+
+
+# --- Persistence backends ---
+
+class UserStore:
+    """Persistence interface. The registry keeps every record in memory and
+    writes through to the store on each mutation."""
+
+    def load(self) -> Iterator[User]:
+        return iter(())
+
+    def save(self, user: User):
+        pass
+
+    def delete(self, user_id: str):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteUserStore(UserStore):
+    """Reference store: one row per user in a local SQLite file."""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY,
+                email TEXT NOT NULL UNIQUE,
+                password_hash TEXT NOT NULL,
+                api_key TEXT NOT NULL UNIQUE,
+                balance REAL NOT NULL DEFAULT 0,
+                used REAL NOT NULL DEFAULT 0,
+                tier TEXT NOT NULL DEFAULT 'free',
+                totp_secret TEXT,
+                totp_enabled INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.commit()
+
+    def load(self) -> Iterator[User]:
+        cursor = self.conn.execute(f"SELECT {', '.join(USER_FIELDS)} FROM users")
+        for row in cursor:
+            user = User(*row)
+            user.totp_enabled = bool(user.totp_enabled)
+            yield user
+
+    def save(self, user: User):
+        placeholders = ", ".join("?" for _ in USER_FIELDS)
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO users ({', '.join(USER_FIELDS)}) VALUES ({placeholders})",
+            tuple(getattr(user, name) for name in USER_FIELDS)
+        )
+        self.conn.commit()
+
+    def delete(self, user_id: str):
+        self.conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+# --- Registry ---
+
+class UserRegistry:
+    """In-memory user index with O(1) lookups by id, email and api_key.
+
+    The api_key index is keyed by the key's SHA-256 digest.
+    """
+
+    def __init__(self, store: Optional[UserStore] = None):
+        self.store = store or UserStore()
+        self._by_id: Dict[str, User] = {}
+        self._by_email: Dict[str, User] = {}
+        self._by_api_key: Dict[bytes, User] = {}
+        for user in self.store.load():
+            self._index(user)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._by_id
+
+    def __iter__(self) -> Iterator[User]:
+        return iter(self._by_id.values())
+
+    def _index(self, user: User):
+        self._by_id[user.id] = user
+        self._by_email[user.email] = user
+        self._by_api_key[credential_digest(user.api_key)] = user
+
+    def get(self, user_id: str) -> Optional[User]:
+        return self._by_id.get(user_id)
+
+    def get_by_email(self, email: str) -> Optional[User]:
+        return self._by_email.get(email)
+
+    def get_by_api_key(self, api_key: str) -> Optional[User]:
+        return self._by_api_key.get(credential_digest(api_key))
+
+    def add(self, user: User) -> User:
+        if user.id in self._by_id:
+            raise ValueError(f"User id already registered: {user.id}")
+        if user.email in self._by_email:
+            raise ValueError(f"Email already registered: {user.email}")
+        self._index(user)
+        self.store.save(user)
+        return user
+
+    def set_api_key(self, user: User, api_key: str):
+        """Replace a user's API key, keeping the secondary index in sync."""
+        self._by_api_key.pop(credential_digest(user.api_key), None)
+        user.api_key = api_key
+        self._by_api_key[credential_digest(api_key)] = user
+        self.store.save(user)
+
+    def save(self, user: User):
+        """Persist in-place changes to a record's non-indexed fields."""
+        self.store.save(user)
+
+    def remove(self, user_id: str):
+        user = self._by_id.pop(user_id, None)
+        if user is None:
+            return
+        self._by_email.pop(user.email, None)
+        self._by_api_key.pop(credential_digest(user.api_key), None)
+        self.store.delete(user_id)
@@ -0,0 +1,227 @@
+"""
+any2json video analysis
+Scene segmentation and keyframe extraction: ffmpeg decodes small grayscale
+frames through a pipe, NumPy scores frame differences block by block, and
+time segments of the video are processed in parallel on a process pool.
+"""
+
+from concurrent.futures import Executor
+from typing import List, Optional, Tuple
+import asyncio
+import json
+import shutil
+import subprocess
+import time
+
+import numpy as np
+
+from backend.metrics import timed
+
+
+FFMPEG = shutil.which("ffmpeg")
+FFPROBE = shutil.which("ffprobe")
+
+SAMPLE_FPS = 4.0  # frames per second scored for cuts
+THUMB_SIZE = (64, 36)  # width, height of the frames that are compared
+BLOCK_FRAMES = 256  # frames read from the pipe and differenced per step
+MIN_CUT = 27.0  # mean absolute gray-level difference that always counts as a cut
+MIN_SCENE_SEC = 1.0
+TOKENS_PER_SCENE = 120  # budget one described scene costs
+
+
+def format_time(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60}:{rest % 60:02d}"
+
+
+def scene_budget(max_tokens: int, cap: int = 48) -> int:
+    """How many scenes (and keyframes) `max_tokens` can describe."""
+    return max(1, min(cap, max_tokens // TOKENS_PER_SCENE))
+
+
+def probe(path: str) -> dict:
+    """Duration, dimensions and frame rate from ffprobe."""
+    out = subprocess.run(
+        [FFPROBE, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height,avg_frame_rate:format=duration", "-of", "json", path],
+        capture_output=True, check=True, timeout=60
+    ).stdout
+    info = json.loads(out)
+    stream = (info.get("streams") or [{}])[0]
+    num, _, den = stream.get("avg_frame_rate", "0/1").partition("/")
+    return {
+        "duration": float(info.get("format", {}).get("duration") or 0),
+        "width": stream.get("width"),
+        "height": stream.get("height"),
+        "fps": float(num) / float(den) if den and float(den) else None,
+    }
+
+
+# --- Frame scoring (runs in pool workers) ---
+
+def block_scores(block: np.ndarray, prev: Optional[np.ndarray]) -> np.ndarray:
+    """Mean absolute difference of each frame in `block` (n, h, w) to the one before it."""
+    frames = block.astype(np.int16)
+    if prev is not None:
+        frames = np.concatenate([prev.astype(np.int16)[None], frames])
+    return np.abs(np.diff(frames, axis=0)).mean(axis=(1, 2), dtype=np.float32)
+
+
+def score_segment(path: str, start: float, length: float, sample_fps: float = SAMPLE_FPS,
+                  size: Tuple[int, int] = THUMB_SIZE) -> dict:
+    """Decode one time segment and score every sampled frame against the previous one.
+
+    Only BLOCK_FRAMES thumbnails are in memory at a time. The first frame has
+    no predecessor here (score 0); its frame is returned so the caller can
+    score the boundary with the previous segment's last frame.
+    """
+    width, height = size
+    frame_bytes = width * height
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [FFMPEG, "-v", "error", "-threads", "1", "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", path,
+         "-an", "-vf", f"fps={sample_fps},scale={width}:{height},format=gray",
+         "-f", "rawvideo", "pipe:1"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    scores = []
+    first = prev = None
+    try:
+        while True:
+            buf = proc.stdout.read(frame_bytes * BLOCK_FRAMES)
+            n = len(buf) // frame_bytes
+            if not n:
+                break
+            block = np.frombuffer(buf[:n * frame_bytes], np.uint8).reshape(n, height, width)
+            if first is None:
+                first = block[0].copy()
+                scores.append(np.zeros(1, np.float32))
+                scores.append(block_scores(block[1:], block[0]) if n > 1 else np.zeros(0, np.float32))
+            else:
+                scores.append(block_scores(block, prev))
+            prev = block[-1].copy()
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    scores = np.concatenate(scores) if scores else np.zeros(0, np.float32)
+    return {
+        "start": start,
+        "times": start + np.arange(len(scores), dtype=np.float32) / sample_fps,
+        "scores": scores,
+        "first": first,
+        "last": prev,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def extract_frame(path: str, at: float, max_side: int = 1024) -> bytes:
+    """One JPEG frame at `at` seconds, longest side at most `max_side`."""
+    scale = f"scale='min({max_side},iw)':'min({max_side},ih)':force_original_aspect_ratio=decrease"
+    return subprocess.run(
+        [FFMPEG, "-v", "error", "-threads", "1", "-ss", f"{at:.3f}", "-i", path, "-frames:v", "1",
+         "-vf", scale, "-f", "image2pipe", "-c:v", "mjpeg", "-q:v", "3", "pipe:1"],
+        capture_output=True, check=True, timeout=60
+    ).stdout
+
+
+# --- Scenes ---
+
+def find_cuts(times: np.ndarray, scores: np.ndarray, min_cut: float = MIN_CUT,
+              min_scene: float = MIN_SCENE_SEC) -> List[Tuple[float, float]]:
+    """(time, score) of scene cuts: scores over an adaptive threshold, at least
+    `min_scene` seconds apart (the stronger cut wins)."""
+    if not len(scores):
+        return []
+    threshold = max(min_cut, float(scores.mean() + 3 * scores.std()))
+    cuts: List[Tuple[float, float]] = []
+    for i in np.flatnonzero(scores >= threshold):
+        t, s = float(times[i]), float(scores[i])
+        if cuts and t - cuts[-1][0] < min_scene:
+            if s > cuts[-1][1]:
+                cuts[-1] = (t, s)
+            continue
+        cuts.append((t, s))
+    return cuts
+
+
+def build_scenes(cuts: List[Tuple[float, float]], duration: float, max_scenes: int) -> List[Tuple[float, float]]:
+    """Scene (start, end) ranges, merging across the weakest cuts until at most `max_scenes` remain."""
+    cuts = [c for c in cuts if 0 < c[0] < duration]
+    while len(cuts) + 1 > max_scenes:
+        cuts.pop(min(range(len(cuts)), key=lambda i: cuts[i][1]))
+    bounds = [0.0] + [t for t, _ in cuts] + [duration]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def keyframe_time(times: np.ndarray, scores: np.ndarray, start: float, end: float) -> float:
+    """Steadiest sampled frame in the middle half of a scene (least motion, least blur)."""
+    lo, hi = start + (end - start) / 4, end - (end - start) / 4
+    window = np.flatnonzero((times >= lo) & (times <= hi))
+    if not len(window):
+        return (start + end) / 2
+    return float(times[window[np.argmin(scores[window])]])
+
+
+class VideoAnalyzer:
+    """Runs segment scoring and keyframe extraction on a process pool.
+
+    The video is cut into `segment_sec` pieces; each worker decodes its
+    piece with its own single-threaded ffmpeg, so throughput scales with
+    the pool size and no process ever holds more than a block of
+    thumbnails.
+    """
+
+    def __init__(self, executor: Executor, sample_fps: float = SAMPLE_FPS, segment_sec: float = 120.0):
+        self.executor = executor
+        self.sample_fps = sample_fps
+        self.segment_sec = segment_sec
+        self.videos = 0
+        self.frames = 0
+        self.worker_seconds = 0.0
+
+    @timed("scenes")
+    async def scenes(self, path: str, max_tokens: int) -> dict:
+        """Probe, score and segment. Returns {duration, width, height, fps, scenes: [(start, end, keyframe_at)]}."""
+        loop = asyncio.get_running_loop()
+        info = await loop.run_in_executor(self.executor, probe, path)
+        duration = info["duration"]
+        starts = np.arange(0, max(duration, 1e-3), self.segment_sec)
+        segments = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, score_segment, path, float(s),
+                                 min(self.segment_sec, duration - float(s)), self.sample_fps)
+            for s in starts
+        ))
+
+        # Score each segment boundary: previous segment's last frame vs this one's first
+        for before, after in zip(segments, segments[1:]):
+            if before["last"] is not None and after["first"] is not None and len(after["scores"]):
+                after["scores"][0] = block_scores(after["first"][None], before["last"])[0]
+        times = np.concatenate([s["times"] for s in segments])
+        scores = np.concatenate([s["scores"] for s in segments])
+
+        self.videos += 1
+        self.frames += len(scores)
+        self.worker_seconds += sum(s["seconds"] for s in segments)
+
+        ranges = build_scenes(find_cuts(times, scores), duration, scene_budget(max_tokens))
+        return {**info, "scenes": [(start, end, keyframe_time(times, scores, start, end))
+                                   for start, end in ranges]}
+
+    @timed("keyframes")
+    async def keyframes(self, path: str, times: List[float], max_side: int = 1024) -> List[bytes]:
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(
+            loop.run_in_executor(self.executor, extract_frame, path, t, max_side) for t in times
+        ))
+
+    def stats(self) -> dict:
+        """Videos analyzed, frames scored, and sampled frames per second per busy worker."""
+        return {
+            "videos": self.videos,
+            "frames": self.frames,
+            "fps_per_core": self.frames / self.worker_seconds if self.worker_seconds else 0.0,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,445 @@
+"""
+any2json vision backends
+Provider clients (OpenAI, Anthropic, offline stub) behind one pooled httpx
+client, with per-provider concurrency limits, jittered retries, optional
+hedged requests and latency/error accounting.
+"""
+
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple, Union
+import asyncio
+import base64
+import hashlib
+import importlib.util
+import json
+import os
+import random
+import time
+
+from fastapi import HTTPException
+import httpx
+
+from backend import metrics
+from backend.preprocess import budget_tier
+from backend.sniff import sniff
+
+
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+Image = Union[bytes, str]  # media bytes, or a URL the provider fetches itself
+
+
+# --- Prompts ---
+
+DETAIL_BY_TIER = {
+    "tldr": "极简：1-2 sentences, key facts only",
+    "summary": "summary: main elements, structure, key text",
+    "detailed": "detailed: all visible elements, full text, relationships",
+    "exhaustive": "exhaustive: every detail, spatial relationships, colors, fonts"
+}
+
+
+def get_prompt_for_budget(max_tokens: int, media_type: str) -> str:
+    """Generate prompt based on token budget."""
+
+    detail = DETAIL_BY_TIER[budget_tier(max_tokens)]
+
+    return f"""Analyze this {media_type} and return JSON.
+Detail level: {detail}
+Target: ~{max_tokens} tokens output.
+
+Return valid JSON with:
+- "summary": brief description
+- "elements": array of detected items (id, type, content)
+- "text": any text found (if applicable)
+- "metadata": dimensions, colors, etc.
+
+Be concise but complete within the token budget."""
+
+
+def get_expand_prompt(element: dict, context: dict) -> str:
+    """Prompt for detailing one element of an earlier analysis."""
+    return f"""Earlier analysis of this media: {context.get("summary")}
+Describe this element in detail: {json.dumps(element, ensure_ascii=False)}
+
+Return valid JSON with:
+- "details": everything visible about the element (text, attributes, relationships)"""
+
+
+def to_document(raw: dict, media_type: str, max_tokens: int) -> dict:
+    """Model JSON -> response document (head, elements, trailer in API order)."""
+    elements = []
+    for i, element in enumerate(raw.get("elements") or [], 1):
+        if not isinstance(element, dict):
+            element = {"type": "item", "content": element}
+        elements.append({"id": str(element.get("id") or f"e{i}"), **element})
+    return {
+        "type": media_type,
+        "summary": raw.get("summary") or raw.get("raw") or "",
+        "elements": elements,
+        "text": raw.get("text"),
+        "metadata": {
+            **(raw.get("metadata") if isinstance(raw.get("metadata"), dict) else {}),
+            "max_tokens_requested": max_tokens
+        },
+        "_expandable": [e["id"] for e in elements]
+    }
+
+
+def parse_model_json(text: str) -> dict:
+    """Model output as a dict; tolerates ```json fences, keeps unparseable text as `raw`."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return {"raw": text}
+    return parsed if isinstance(parsed, dict) else {"raw": parsed}
+
+
+def image_mime(image: bytes) -> str:
+    detected = sniff(image[:64])
+    return f"image/{detected[1]}" if detected and detected[0] == "image" else "image/jpeg"
+
+
+# --- Stub model ---
+
+STUB_WORDS = ("button", "header", "chart", "table", "logo", "photo", "caption", "price",
+              "laptop", "desk", "window", "person", "label", "icon", "footer", "menu")
+
+
+def stub_completion(prompt: str, image_size: int, max_tokens: int) -> dict:
+    """Deterministic fake model output, sized to the budget like a real answer."""
+    rng = random.Random(hashlib.sha256(f"{prompt}:{image_size}:{max_tokens}".encode()).digest())
+
+    def words(n):
+        return " ".join(rng.choice(STUB_WORDS) for _ in range(n))
+
+    if prompt.startswith("Earlier analysis"):
+        return {"details": words(max(8, max_tokens // 8))}
+    return {
+        "summary": words(12),
+        "elements": [
+            {"id": f"e{i}", "type": rng.choice(("object", "text", "region")), "content": words(6)}
+            for i in range(1, max(2, max_tokens // 40) + 1)
+        ],
+        "text": words(max(4, max_tokens // 20)),
+        "metadata": {"bytes": image_size, "colors": [words(1), words(1)]}
+    }
+
+
+# --- Providers ---
+
+def retry_after(value: Optional[str], default: float = 0.0) -> float:
+    """Seconds to wait per a Retry-After header (delta-seconds or an HTTP date); `default` if missing or invalid."""
+    if not value:
+        return default
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when.tzinfo is None:  # obsolete date forms carry no zone; HTTP dates are GMT
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class VisionError(Exception):
+    """A failed provider call; `status` is None for transport errors and timeouts."""
+
+    def __init__(self, status: Optional[int], detail: str, retry_after: float = 0.0):
+        super().__init__(f"HTTP {status}: {detail}" if status else detail)
+        self.status = status
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_response(cls, response: httpx.Response) -> "VisionError":
+        return cls(response.status_code, response.text[:200], retry_after(response.headers.get("retry-after")))
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status == 429 or self.status >= 500
+
+    @property
+    def kind(self) -> str:
+        if self.status is None:
+            return "transport"
+        return "429" if self.status == 429 else f"{self.status // 100}xx"
+
+
+class VisionBackend:
+    """One provider. `request` builds the HTTP call, `parse` reads (text, usage) back."""
+
+    name = "base"
+
+    def __init__(self, api_key: str, model: str, base_url: str, concurrency: int = 8):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+
+    def request(self, prompt: str, image: Image, max_tokens: int) -> Tuple[str, dict, dict]:
+        raise NotImplementedError
+
+    def parse(self, data: dict) -> Tuple[str, dict]:
+        raise NotImplementedError
+
+    async def complete(self, client: httpx.AsyncClient, prompt: str, image: Image,
+                       max_tokens: int) -> dict:
+        """Model JSON for `prompt` + `image`, with `_usage` token counts."""
+        url, headers, body = self.request(prompt, image, max_tokens)
+        try:
+            response = await client.post(url, headers=headers, json=body)
+        except httpx.HTTPError as e:
+            raise VisionError(None, f"{e.__class__.__name__}: {e}")
+        if response.status_code >= 400:
+            raise VisionError.from_response(response)
+        text, usage = self.parse(response.json())
+        return {**parse_model_json(text), "_usage": usage}
+
+
+class OpenAIBackend(VisionBackend):
+    """Chat Completions API (also any compatible server, e.g. backend/stub_server.py)."""
+
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str = "gpt-4o-mini",
+                 base_url: str = "https://api.openai.com/v1", concurrency: int = 8):
+        super().__init__(api_key, model, base_url, concurrency)
+
+    def request(self, prompt, image, max_tokens):
+        if isinstance(image, str):
+            url = image
+        else:
+            url = f"data:{image_mime(image)};base64,{base64.b64encode(image).decode()}"
+        body = {
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "messages": [
+                {"role": "system", "content": "You convert media to JSON. Output ONLY valid JSON."},
+                {"role": "user", "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": url}}
+                ]}
+            ],
+            "response_format": {"type": "json_object"}
+        }
+        return f"{self.base_url}/chat/completions", {"Authorization": f"Bearer {self.api_key}"}, body
+
+    def parse(self, data):
+        usage = data.get("usage") or {}
+        return data["choices"][0]["message"]["content"], {
+            "input_tokens": usage.get("prompt_tokens", 0),
+            "output_tokens": usage.get("completion_tokens", 0)
+        }
+
+
+class AnthropicBackend(VisionBackend):
+    """Messages API."""
+
+    name = "anthropic"
+
+    def __init__(self, api_key: str, model: str = "claude-3-5-haiku-latest",
+                 base_url: str = "https://api.anthropic.com/v1", concurrency: int = 8):
+        super().__init__(api_key, model, base_url, concurrency)
+
+    def request(self, prompt, image, max_tokens):
+        if isinstance(image, str):
+            source = {"type": "url", "url": image}
+        else:
+            source = {"type": "base64", "media_type": image_mime(image),
+                      "data": base64.b64encode(image).decode()}
+        body = {
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "system": "You convert media to JSON. Output ONLY valid JSON.",
+            "messages": [{"role": "user", "content": [
+                {"type": "image", "source": source},
+                {"type": "text", "text": prompt}
+            ]}]
+        }
+        headers = {"x-api-key": self.api_key, "anthropic-version": "2023-06-01"}
+        return f"{self.base_url}/messages", headers, body
+
+    def parse(self, data):
+        text = "".join(block.get("text", "") for block in data.get("content") or [])
+        return text, dict(data.get("usage") or {})
+
+
+class StubBackend(VisionBackend):
+    """In-process fake model: no network, deterministic output, optional latency."""
+
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0, concurrency: int = 64):
+        super().__init__("", "stub", "", concurrency)
+        self.latency = latency
+
+    async def complete(self, client, prompt, image, max_tokens):
+        if self.latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+        raw = stub_completion(prompt, len(image), max_tokens)
+        return {**raw, "_usage": {"input_tokens": len(prompt) // 4, "output_tokens": max_tokens // 2}}
+
+
+# --- Client ---
+
+class ProviderStats:
+    def __init__(self, window: int = 1000):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors: Dict[str, int] = {}
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def summary(self) -> dict:
+        ordered = sorted(self.latencies)
+
+        def pct(q):
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+        return {
+            "requests": self.requests,
+            "errors": dict(self.errors),
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p50": pct(0.5),
+            "p99": pct(0.99),
+        }
+
+
+class VisionClient:
+    """Routes model calls to registered providers over one pooled AsyncClient.
+
+    Each provider has its own semaphore (its `concurrency`). Retryable
+    failures (transport errors, 429, 5xx) are retried up to `retries` times
+    with full-jitter exponential backoff. With `hedge_after` set, a call
+    still running after that many seconds gets a second identical request
+    if the provider has a free slot; the first answer wins.
+    """
+
+    def __init__(self, retries: int = 2, backoff: float = 0.25, hedge_after: Optional[float] = None,
+                 timeout: float = 60.0, max_connections: int = 100, stage: str = "model"):
+        self.retries = retries
+        self.stage = stage  # what its calls are timed as in /metrics
+        self.backoff = backoff
+        self.hedge_after = hedge_after
+        self.default: Optional[str] = None
+        self._backends: Dict[str, VisionBackend] = {}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, ProviderStats] = {}
+        self.client = httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                keepalive_expiry=60),
+            headers={"User-Agent": "any2json/0.1"}
+        )
+
+    def add(self, backend: VisionBackend, default: bool = False):
+        self._backends[backend.name] = backend
+        self._slots[backend.name] = asyncio.Semaphore(backend.concurrency)
+        self._stats[backend.name] = ProviderStats()
+        if default or self.default is None:
+            self.default = backend.name
+
+    async def analyze(self, prompt: str, image: Image, max_tokens: int,
+                      provider: Optional[str] = None) -> dict:
+        """Model JSON for `prompt` + `image` from `provider` (default: the default provider)."""
+        with metrics.stage(self.stage):
+            return await self._analyze(prompt, image, max_tokens, provider)
+
+    async def _analyze(self, prompt: str, image: Image, max_tokens: int, provider: Optional[str]) -> dict:
+        name = provider or self.default
+        if name not in self._backends:
+            raise HTTPException(400, f"Unknown vision provider '{name}'. Available: {list(self._backends)}")
+        stats = self._stats[name]
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._hedged(name, prompt, image, max_tokens)
+            except VisionError as e:
+                if not e.retryable or attempt == self.retries:
+                    raise HTTPException(502, f"Vision backend '{name}' failed: {e}")
+                stats.retries += 1
+                await asyncio.sleep(max(e.retry_after, random.uniform(0, self.backoff * 2 ** attempt)))
+
+    async def _attempt(self, name: str, prompt: str, image: Image, max_tokens: int) -> dict:
+        stats = self._stats[name]
+        async with self._slots[name]:
+            stats.requests += 1
+            start = time.perf_counter()
+            try:
+                result = await self._backends[name].complete(self.client, prompt, image, max_tokens)
+            except VisionError as e:
+                stats.errors[e.kind] = stats.errors.get(e.kind, 0) + 1
+                raise
+            stats.latencies.append(time.perf_counter() - start)
+            return result
+
+    async def _hedged(self, name: str, prompt: str, image: Image, max_tokens: int) -> dict:
+        if not self.hedge_after:
+            return await self._attempt(name, prompt, image, max_tokens)
+        first = asyncio.create_task(self._attempt(name, prompt, image, max_tokens))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if done or self._slots[name].locked():
+                # Finished in time, or no spare capacity to hedge with
+                return await first
+            self._stats[name].hedges += 1
+            tasks.append(asyncio.create_task(self._attempt(name, prompt, image, max_tokens)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self._stats[name].hedge_wins += 1
+                        return task.result()
+            raise first.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        """Per provider: requests, errors by kind, retries, hedges, p50/p99 seconds."""
+        return {name: stats.summary() for name, stats in self._stats.items()}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def client_from_env() -> VisionClient:
+    """VisionClient for the environment: OpenAI and/or Anthropic when their keys are set,
+    always the offline stub, defaulting to ANY2JSON_VISION_PROVIDER or the first real one.
+
+    ANY2JSON_OPENAI_BASE_URL alone (e.g. http://127.0.0.1:8400/v1, backend/stub_server.py)
+    also enables the openai provider, for load tests over real HTTP.
+    """
+    env = os.environ.get
+    hedge_ms = float(env("ANY2JSON_VISION_HEDGE_MS", 0))
+    concurrency = int(env("ANY2JSON_VISION_CONCURRENCY", 8))
+    vision = VisionClient(
+        retries=int(env("ANY2JSON_VISION_RETRIES", 2)),
+        hedge_after=hedge_ms / 1000 if hedge_ms else None,
+        timeout=float(env("ANY2JSON_VISION_TIMEOUT", 60))
+    )
+    if env("OPENAI_API_KEY") or env("ANY2JSON_OPENAI_BASE_URL"):
+        vision.add(OpenAIBackend(env("OPENAI_API_KEY", "stub"),
+                                 model=env("ANY2JSON_OPENAI_MODEL", "gpt-4o-mini"),
+                                 base_url=env("ANY2JSON_OPENAI_BASE_URL", "https://api.openai.com/v1"),
+                                 concurrency=concurrency))
+    if env("ANTHROPIC_API_KEY"):
+        vision.add(AnthropicBackend(env("ANTHROPIC_API_KEY"),
+                                    model=env("ANY2JSON_ANTHROPIC_MODEL", "claude-3-5-haiku-latest"),
+                                    concurrency=concurrency))
+    vision.add(StubBackend(latency=float(env("ANY2JSON_STUB_LATENCY_MS", 0)) / 1000))
+    if env("ANY2JSON_VISION_PROVIDER"):
+        vision.default = env("ANY2JSON_VISION_PROVIDER")
+    return vision
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark: payment address allocation vs pool size
+1. Streaming import of --size addresses from a file (python -m backend.addresses)
+2. Per-allocation time, AddressPool.assign vs the old list.pop(0), as the
+   pool grows: the pool's cost should stay flat, the list's grows linearly
+Usage: python benchmarks/bench_addresses.py [--sizes 10000,100000,1000000] [--allocations 2000]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from backend.addresses import AddressPool
+
+
+def write_addresses(path: str, n: int):
+    with open(path, "w") as f:
+        f.writelines(f"T{i:033d}\n" for i in range(n))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--allocations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'pool':>9} {'import s':>9} {'rows/s':>9} {'assign us':>10} {'pop(0) us':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.sizes.split(",")):
+            source, db = os.path.join(tmp, f"{size}.txt"), os.path.join(tmp, f"{size}.db")
+            write_addresses(source, size)
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-m", "backend.addresses", "trc20", source, "--db", db],
+                           cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+            imported = time.perf_counter() - start
+
+            pool = AddressPool(db)
+            start = time.perf_counter()
+            for i in range(args.allocations):
+                pool.assign(f"user{i}", "trc20")
+            assign_us = (time.perf_counter() - start) / args.allocations * 1e6
+            assert pool.available("trc20") == size - args.allocations
+            pool.close()
+
+            with open(source) as f:
+                addresses = [line.strip() for line in f]
+            start = time.perf_counter()
+            for _ in range(args.allocations):
+                addresses.pop(0)
+            pop_us = (time.perf_counter() - start) / args.allocations * 1e6
+            print(f"{size:>9,} {imported:9.1f} {size / imported:9,.0f} {assign_us:10.1f} {pop_us:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
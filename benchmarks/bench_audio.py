@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark: audio transcription wall time vs transcription workers
+Generates a synthetic 16 kHz WAV (tone bursts between short pauses), converts
+it through /convert/upload with a stub speech backend of --model-ms latency
+per chunk, and reports wall time and realtime factor for each worker count.
+With enough workers, wall time tracks one chunk's latency, not the length.
+Usage: python benchmarks/bench_audio.py [--minutes 30] [--model-ms 2000] [--workers 1,4,16,64]
+"""
+
+import argparse
+import io
+import sys
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.testclient import TestClient
+
+import app as server
+from backend import pipeline
+from backend.audio import SilenceChunker
+from backend.speech import StubSpeechBackend
+
+RATE = 16000
+
+
+def make_wav(seconds: float, seed: int = 0) -> bytes:
+    """Talk-like bursts of 2-12 s separated by 0.4-1.5 s of near silence."""
+    rng = np.random.default_rng(seed)
+    parts, total = [], 0.0
+    while total < seconds:
+        talk, pause = rng.uniform(2, 12), rng.uniform(0.4, 1.5)
+        t = np.arange(int(talk * RATE)) / RATE
+        parts.append(np.sin(2 * np.pi * 220 * t) * 8000 * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t)))
+        parts.append(rng.normal(0, 50, int(pause * RATE)))
+        total += talk + pause
+    pcm = np.concatenate(parts)[:int(seconds * RATE)].astype("<i2")
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(RATE)
+        writer.writeframes(pcm.tobytes())
+    return out.getvalue()
+
+
+def bench_chunking(audio: bytes) -> float:
+    """Seconds of audio the VAD chunker gets through per second, decoding included."""
+    with wave.open(io.BytesIO(audio), "rb") as reader:
+        pcm = np.frombuffer(reader.readframes(reader.getnframes()), "<i2")
+    chunker = SilenceChunker(RATE)
+    start = time.perf_counter()
+    for i in range(0, len(pcm), RATE * 5):
+        chunker.feed(pcm[i:i + RATE * 5])
+    chunker.flush()
+    return len(pcm) / RATE / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=30)
+    parser.add_argument("--model-ms", type=float, default=2000)
+    parser.add_argument("--workers", default="1,4,16,64")
+    args = parser.parse_args()
+
+    audio = make_wav(args.minutes * 60)
+    print(f"{args.minutes:g} min WAV, {len(audio) / 2**20:.1f} MB; "
+          f"VAD chunking alone: {bench_chunking(audio):,.0f}x realtime")
+
+    print(f"{'workers':>7} {'segments':>8} {'wall s':>8} {'x realtime':>11}")
+    with TestClient(server.app) as client:
+        for workers in sorted({int(w) for w in args.workers.split(",")}):
+            pipeline.speech.add(StubSpeechBackend(latency=args.model_ms / 1000, concurrency=workers), default=True)
+            pipeline.AUDIO_PARALLEL = max(workers, 1)
+            start = time.perf_counter()
+            r = client.post("/convert/upload", files={"file": ("bench.wav", audio, "audio/wav")},
+                            data={"max_tokens": "10000", "cache": "false"})
+            r.raise_for_status()
+            wall = time.perf_counter() - start
+            print(f"{workers:>7} {len(r.json()['segments']):>8} {wall:8.2f} {args.minutes * 60 / wall:10.0f}x")
+
+
+if __name__ == "__main__":
+    main()
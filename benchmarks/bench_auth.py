@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request cost of backend.main.verify_token
+Compares a full jwt.decode against the credential cache and API-key lookups.
+Usage: python benchmarks/bench_auth.py [--iterations 100000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend import main as api
+from backend.users import User
+
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    user = api.users.add(User(
+        id="bench-user",
+        email="bench@example.com",
+        password_hash=api.hash_password("bench"),
+        api_key="a2j_" + "0" * 48
+    ))
+    jwt_header = f"Bearer {api.create_token(user.id)}"
+    key_header = f"Bearer {user.api_key}"
+
+    def uncached(header):
+        api.credential_cache.clear()
+        return api.verify_token(header)
+
+    rows = [
+        ("jwt, uncached", lambda: uncached(jwt_header)),
+        ("jwt, cached", lambda: api.verify_token(jwt_header)),
+        ("api key, uncached", lambda: uncached(key_header)),
+        ("api key, cached", lambda: api.verify_token(key_header)),
+    ]
+    print(f"{'path':<20} {'us/request':>12}")
+    for label, fn in rows:
+        fn()  # warm up / populate cache
+        print(f"{label:<20} {per_call_us(fn, args.iterations):12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark: document conversion time vs page count and budget
+Generates text PDFs (a heading, paragraphs and a small table per page) with
+5..500 pages and converts each at several max_tokens through /convert/upload,
+then expands one section. At outline budgets the time should stay flat as
+the page count grows; only the pages a response shows are extracted.
+Needs pypdf. Usage: python benchmarks/bench_document.py [--pages 5,50,500] [--budgets 200,2000]
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.testclient import TestClient
+
+import app as server
+from backend import pipeline
+from backend import document
+
+WORDS = ("revenue", "growth", "quarter", "users", "launch", "market", "report", "results", "team",
+         "product", "costs", "margin", "region", "forecast", "sales", "plan", "risk", "data")
+
+
+def sentence(rng: random.Random, words: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def page_stream(rng: random.Random, number: int) -> bytes:
+    lines = [(16, f"Chapter {number} {rng.choice(WORDS).title()} {rng.choice(WORDS).title()}")]
+    lines += [(10, sentence(rng)) for _ in range(30)]
+    lines += [(10, f"{rng.choice(WORDS):<12}  {rng.randint(1, 999):>6}  {rng.randint(1, 999):>6}") for _ in range(5)]
+    ops, y = [], 750
+    for size, text in lines:
+        ops.append(f"BT /F1 {size} Tf 1 0 0 1 50 {y} Tm ({text}) Tj ET")
+        y -= size + 6
+    return "\n".join(ops).encode()
+
+
+def make_pdf(pages: int, seed: int = 0) -> bytes:
+    """A plain PDF with one Helvetica text page per `pages`, written by hand (no PDF library)."""
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>"]
+    kids = []
+    for n in range(1, pages + 1):
+        stream = page_stream(rng, n)
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{k} 0 R" for k in kids).encode(), pages)
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.writelines(b"%010d 00000 n \n" % o for o in offsets)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def make_docx(sections: int, seed: int = 0) -> bytes:
+    """Minimal DOCX: a Heading1 and a few paragraphs per section."""
+    rng = random.Random(seed)
+    ns = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    body = []
+    for n in range(1, sections + 1):
+        body.append(f'<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr><w:r><w:t>Section {n}</w:t></w:r></w:p>')
+        body += [f"<w:p><w:r><w:t>{sentence(rng, 40)}</w:t></w:r></w:p>" for _ in range(8)]
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", "<Types/>")
+        docx.writestr("word/document.xml", f"<w:document {ns}><w:body>{''.join(body)}</w:body></w:document>")
+    return out.getvalue()
+
+
+def timed(client: TestClient, data: bytes, name: str, **fields) -> tuple:
+    start = time.perf_counter()
+    r = client.post("/convert/upload", files={"file": (name, data)},
+                    data={"cache": "false", **{k: str(v) for k, v in fields.items()}})
+    r.raise_for_status()
+    return (time.perf_counter() - start) * 1000, r.json()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", default="5,50,200,500")
+    parser.add_argument("--budgets", default="200,2000")
+    args = parser.parse_args()
+    if document.pypdf is None:
+        print("pypdf not installed; nothing to benchmark")
+        return
+
+    budgets = [int(b) for b in args.budgets.split(",")]
+    print(f"{'input':>12} {'MB':>5} " + " ".join(f"{f'{b} tok ms':>11}" for b in budgets) + f" {'expand ms':>10}")
+    with TestClient(server.app) as client:
+        timed(client, make_pdf(2), "warmup.pdf")  # spawn the pool workers
+        inputs = [(f"{n} pages", make_pdf(n), "doc.pdf") for n in (int(p) for p in args.pages.split(","))]
+        inputs.append(("docx 200 sec", make_docx(200), "doc.docx"))
+        for label, data, name in inputs:
+            row = []
+            for budget in budgets:
+                ms, result = timed(client, data, name, max_tokens=budget)
+                row.append(ms)
+            ms, _ = timed(client, data, name, max_tokens=2000, expand=result["_expandable"][0],
+                          handle=result["_handle"])
+            print(f"{label:>12} {len(data) / 2**20:5.1f} " + " ".join(f"{t:11.0f}" for t in row) + f" {ms:10.0f}")
+    print(pipeline.document_analyzer.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark: `expand` latency with a stored analysis vs a cold conversion
+Usage: python benchmarks/bench_expand.py [--size-mb 8] [--model-ms 800]
+
+--model-ms is the latency of the stub vision backend, so every model call
+(analysis and expansion) costs a realistic round trip.
+"""
+
+import argparse
+import base64
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.testclient import TestClient
+
+import app as server
+from backend import pipeline
+from backend.vision import StubBackend
+
+
+def timed(client: TestClient, body: dict) -> float:
+    start = time.perf_counter()
+    r = client.post("/convert", json=body)
+    r.raise_for_status()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--model-ms", type=float, default=800)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    pipeline.vision.add(StubBackend(latency=args.model_ms / 1000), default=True)
+    client = TestClient(server.app)
+
+    cold, by_handle, by_content = [], [], []
+    for _ in range(args.runs):
+        payload = base64.b64encode(os.urandom(int(args.size_mb * 2**20))).decode()
+        pipeline.analysis_store = type(pipeline.analysis_store)()
+
+        cold.append(timed(client, {"input": payload, "expand": ["e1"], "cache": False}))
+
+        pipeline.analysis_store = type(pipeline.analysis_store)()
+        first = client.post("/convert", json={"input": payload, "cache": False}).json()
+        by_handle.append(timed(client, {"input": payload, "expand": ["e1"],
+                                        "handle": first["_handle"], "cache": False}))
+        by_content.append(timed(client, {"input": payload, "expand": ["e1"], "cache": False}))
+
+    print(f"input {args.size_mb} MB, simulated model call {args.model_ms} ms, {args.runs} runs")
+    for label, samples in [("cold expand", cold), ("expand via _handle", by_handle),
+                           ("expand via content", by_content)]:
+        print(f"{label:<22} median {statistics.median(samples):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark: output formats (nested, flat, progressive)
+For documents shaped like each handler's output (image elements, video
+scenes, audio segments, document sections) with --elements elements:
+1. Size of the whole document in each format: bytes and tokens (the
+   server's estimate, and tiktoken cl100k_base when installed)
+2. Render time (Renderer over the events) and render + fit time
+   (fit_document at a budget large enough to keep every element)
+3. Elements kept at --budget tokens
+Usage: python benchmarks/bench_formats.py [--elements 200] [--budget 1000]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.render import FORMATS, Renderer
+from backend.streaming import dumps
+from backend.tokens import TokenCounter, count_tokens, fit_document
+from backend.vision import STUB_WORDS
+
+try:
+    exact = TokenCounter.from_tiktoken()
+except ImportError:
+    exact = None
+
+
+def words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(STUB_WORDS) for _ in range(n))
+
+
+def documents(n: int, seed: int = 0) -> dict:
+    """media type -> (list field, document) in each handler's shape."""
+    rng = random.Random(seed)
+
+    def clock(i):
+        return f"{i * 12 // 60}:{i * 12 % 60:02d}-{(i + 1) * 12 // 60}:{(i + 1) * 12 % 60:02d}"
+
+    return {
+        "image": ("elements", [{"id": f"e{i}", "type": rng.choice(("object", "text", "region")),
+                                "content": words(rng, 6)} for i in range(1, n + 1)]),
+        "video": ("scenes", [{"id": f"s{i}", "time": clock(i), "label": words(rng, 2),
+                              "summary": words(rng, 14)} for i in range(1, n + 1)]),
+        "audio": ("segments", [{"id": f"t{i}", "time": clock(i), "text": words(rng, 25)}
+                               for i in range(1, n + 1)]),
+        "document": ("sections", [{"id": f"s{i}", "title": words(rng, 4), "pages": f"{i * 3 + 1}-{i * 3 + 3}"}
+                                  for i in range(1, n + 1)]),
+    }
+
+
+def build(media_type: str, list_key: str, elements: list) -> dict:
+    return {"type": media_type, "summary": "A benchmark document", list_key: elements,
+            "metadata": {"max_tokens_requested": 10_000}, "_expandable": [e["id"] for e in elements]}
+
+
+def events(document: dict, list_key: str):
+    keys = list(document)
+    split = keys.index(list_key)
+    yield "head", {k: document[k] for k in keys[:split]}
+    for element in document[list_key]:
+        yield "element", element
+    yield "trailer", {k: document[k] for k in keys[split + 1:]}
+
+
+def timed(fn, repeat: int) -> float:
+    """Best-of-3 microseconds per call."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best * 1e6
+
+
+def bench(n: int, budget: int, repeat: int):
+    print(f"{n} elements per document; tokens: estimate" + (" / tiktoken" if exact else " (tiktoken not installed)"))
+    for media_type, (list_key, elements) in documents(n).items():
+        document = build(media_type, list_key, elements)
+        print(f"\n{media_type} ({list_key})")
+        print(f"  {'format':<12} {'bytes':>8} {'tokens':>15} {'render':>10} {'render+fit':>11} {'kept@' + str(budget):>9}")
+        baseline = None
+        for format in FORMATS:
+            full = fit_document(document, 10**9, list_key, format)
+            text = dumps(full)
+            estimate = count_tokens(full)
+            baseline = baseline or estimate
+            tokens = f"{estimate}" + (f" / {exact(text)}" if exact else "")
+            render_us = timed(lambda: list(Renderer(format).events(events(document, list_key))), repeat)
+            fit_us = timed(lambda: fit_document(document, 10**9, list_key, format), repeat)
+            kept = len(fit_document(document, budget, list_key, format)[list_key])
+            print(f"  {format:<12} {len(text):>8} {tokens:>15} {render_us:>8.0f}us {fit_us:>9.0f}us {kept:>9}"
+                  f"   ({estimate / baseline:.0%} of nested)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--elements", type=int, default=200)
+    parser.add_argument("--budget", type=int, default=1000, help="max_tokens for the elements-kept column")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    bench(args.elements, args.budget, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: billing cost per request, inline vs usage ledger
+1. Inline: `user.used += cost` and a SQLiteUserStore write per request
+2. Ledger: UsageLedger.record per request, committed before it returns
+   (concurrent requests share a commit)
+Both run --concurrency coroutines over --users users in a SQLite file; the
+ledger run also replays every 10th request id (as a rerun job would) and
+checks after a reopen that each request was charged exactly once.
+Usage: python benchmarks/bench_ledger.py [--requests 20000] [--users 100] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.ledger import UsageLedger
+from backend.users import SQLiteUserStore, User, UserRegistry
+
+COST = 0.002
+
+
+async def run(concurrency: int, requests: int, charge) -> float:
+    """Microseconds per request with `concurrency` coroutines charging in turn."""
+    queue = list(range(requests))
+
+    async def client():
+        while queue:
+            await charge(queue.pop())
+            await asyncio.sleep(0)  # the rest of the request
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def bench(args, tmp: str):
+    registry = UserRegistry(SQLiteUserStore(os.path.join(tmp, "users.db")))
+    users = [registry.add(User(id=f"u{i}", email=f"u{i}@bench", password_hash="", api_key=f"key{i}"))
+             for i in range(args.users)]
+
+    async def inline(n: int):
+        user = users[n % len(users)]
+        user.used += COST
+        registry.save(user)
+
+    inline_us = await run(args.concurrency, args.requests, inline)
+
+    path = os.path.join(tmp, "ledger.db")
+    ledger = UsageLedger(path)
+
+    async def record(n: int):
+        await ledger.record(f"req{n}", f"u{n % args.users}", COST, 100)
+        if n % 10 == 0:
+            await ledger.record(f"req{n}", f"u{n % args.users}", COST, 100)  # replayed id
+
+    ledger_us = await run(args.concurrency, args.requests, record)
+    await ledger.stop()
+    stats = ledger.stats()
+    ledger.close()
+
+    reopened = UsageLedger(path)
+    charged = sum(reopened.usage(f"u{i}")["requests"] for i in range(args.users))
+    expected = args.requests * COST
+    total = sum(reopened.used(f"u{i}") for i in range(args.users))
+    reopened.close()
+
+    print(f"inline user write: {inline_us:7.1f} us/request")
+    print(f"usage ledger:      {ledger_us:7.1f} us/request "
+          f"({stats['commits']} commits, {stats['avg_commit_ms']:.1f} ms each)")
+    print(f"after reopen: {charged} of {args.requests} requests charged, ${total:.3f} of ${expected:.3f}, "
+          f"{stats['duplicates']} replayed ids dropped")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(bench(args, tmp))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark: budget-tier image preprocessing
+Bytes saved and latency added per tier for a 12 MP JPEG, plus the longest
+event-loop stall observed while the pool does the work.
+Usage: python benchmarks/bench_preprocess.py [--megapixels 12]
+"""
+
+import argparse
+import asyncio
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+from PIL import Image
+
+from backend.cache import content_digest
+from backend.preprocess import PROFILES, ImagePreprocessor
+
+
+def sample_photo(megapixels: float) -> bytes:
+    """Photo-like JPEG: smooth gradients plus sensor-style noise, with EXIF."""
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width, y / height, (x + y) / (width + height)], axis=-1) * 200
+    noise = np.random.default_rng(0).normal(0, 12, base.shape)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    out = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = "BenchCam"  # Make
+    Image.fromarray(pixels).save(out, "JPEG", quality=92, exif=exif)
+    return out.getvalue()
+
+
+async def max_loop_stall(stop: asyncio.Event) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst = max(worst, time.perf_counter() - start - 0.001)
+    return worst
+
+
+async def run(data: bytes):
+    preprocessor = ImagePreprocessor()
+    digest = content_digest(data)
+    budgets = {"tldr": 100, "summary": 500, "detailed": 2000, "exhaustive": 5000}
+
+    print(f"input {len(data) / 2**20:.1f} MB")
+    print(f"{'tier':<11} {'max side':>8} {'out KB':>8} {'saved %':>8} {'ms':>8} {'loop stall ms':>14}")
+    for tier, max_tokens in budgets.items():
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(max_loop_stall(stop))
+        start = time.perf_counter()
+        out = await preprocessor.run(data, digest, max_tokens)
+        elapsed = (time.perf_counter() - start) * 1000
+        stop.set()
+        stall = await watcher
+        saved = 100 * (1 - len(out) / len(data))
+        print(f"{tier:<11} {PROFILES[tier]['max_side']:>8} {len(out) / 1024:8.0f} {saved:8.1f} "
+              f"{elapsed:8.1f} {stall * 1000:14.2f}")
+
+    start = time.perf_counter()
+    await preprocessor.run(data, digest, 100)
+    print(f"cached repeat: {(time.perf_counter() - start) * 1e6:.0f} us")
+    preprocessor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megapixels", type=float, default=12)
+    args = parser.parse_args()
+    asyncio.run(run(sample_photo(args.megapixels)))
+
+
+if __name__ == "__main__":
+    main()
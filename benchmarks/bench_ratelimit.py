@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark: rate limiter overhead per request
+1. RateLimiter.check alone, memory vs shared SQLite store, over many keys
+2. Per-request cost of RateLimitMiddleware in front of a trivial ASGI route
+3. --processes N processes hammering one key through one SQLite file:
+   together they must admit exactly the tier's per-minute limit
+Usage: python benchmarks/bench_ratelimit.py [--checks 100000] [--keys 10000] [--processes 4]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+from fastapi import FastAPI
+
+from backend.ratelimit import MemoryRateStore, RateLimiter, RateLimitMiddleware, SQLiteRateStore
+
+UNLIMITED = {"free": (10**9, 10**12)}
+
+
+def bench_checks(limiter: RateLimiter, checks: int, keys: int) -> float:
+    start = time.perf_counter()
+    for i in range(checks):
+        limiter.check(f"user{i % keys}", "free")
+    return (time.perf_counter() - start) / checks * 1e6
+
+
+def make_app(limiter=None) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/convert")
+    async def convert():
+        return {"ok": True}
+
+    if limiter:
+        async def identify(scope):
+            return "bench-user", "free"
+        app.add_middleware(RateLimitMiddleware, limiter=limiter, identify=identify, prefixes=("/convert",))
+    return app
+
+
+async def bench_requests(app: FastAPI, requests: int) -> float:
+    """Median of 5 runs, microseconds per request."""
+    runs = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(requests):
+                (await client.post("/convert")).raise_for_status()
+            runs.append((time.perf_counter() - start) / requests * 1e6)
+    return statistics.median(runs)
+
+
+def hammer(path: str) -> int:
+    limiter = RateLimiter(SQLiteRateStore(path))
+    return sum(limiter.check("shared-key", "free").allowed for _ in range(200))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checks", type=int, default=100_000)
+    parser.add_argument("--keys", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = bench_checks(RateLimiter(MemoryRateStore(), limits=UNLIMITED), args.checks, args.keys)
+        sqlite = bench_checks(RateLimiter(SQLiteRateStore(os.path.join(tmp, "rl.db")), limits=UNLIMITED),
+                              args.checks // 10, args.keys)
+        print(f"check(), {args.keys:,} keys: memory {memory:.2f} us, sqlite {sqlite:.1f} us")
+
+        base = asyncio.run(bench_requests(make_app(), args.requests))
+        with_memory = asyncio.run(bench_requests(make_app(RateLimiter(limits=UNLIMITED)), args.requests))
+        with_sqlite = asyncio.run(bench_requests(
+            make_app(RateLimiter(SQLiteRateStore(os.path.join(tmp, "mw.db")), limits=UNLIMITED)), args.requests))
+        print(f"request through ASGI: {base:.0f} us bare, {with_memory:.0f} us with the memory limiter, "
+              f"{with_sqlite:.0f} us with the sqlite limiter")
+
+        path = os.path.join(tmp, "shared.db")
+        SQLiteRateStore(path).close()  # create the table before the processes race for it
+        with Pool(args.processes) as pool:
+            admitted = pool.map(hammer, [path] * args.processes)
+        print(f"{args.processes} processes x 200 requests on one key, free tier: admitted {sum(admitted)} "
+              f"(limit 10/min) {admitted}")
+
+
+if __name__ == "__main__":
+    main()
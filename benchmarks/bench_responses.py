@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: response body cost, serialization and compression
+1. Serialization: stdlib JSONResponse.render vs FastJSONResponse (orjson when
+   installed), and the MessagePack/CBOR bodies picked by Accept
+2. Compression: gzip, br and zstd at the levels CompressionMiddleware uses:
+   encode time, ratio, and encode + transfer time at --mbps
+Payloads are conversion documents of roughly 1-500 KB (flat element lists).
+Usage: python benchmarks/bench_responses.py [--sizes 1,10,100,500] [--mbps 20]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.responses import JSONResponse
+
+from backend.responses import FORMATS, Compressor, FastJSONResponse, available_encodings
+from backend.streaming import orjson
+
+WORDS = ("button", "header", "chart", "table", "logo", "photo", "caption", "price", "menu", "footer",
+         "sidebar", "link", "form", "input", "label", "icon", "banner", "card", "list", "title")
+
+
+def document(kb: int, seed: int = 0) -> dict:
+    """A flat conversion result of about `kb` KB of JSON."""
+    rng = random.Random(seed)
+    elements = []
+    size = 0
+    while size < kb * 1024:
+        element = {
+            "id": f"e{len(elements)}",
+            "type": rng.choice(WORDS),
+            "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))),
+            "bbox": [rng.randint(0, 1920), rng.randint(0, 1080), rng.randint(10, 400), rng.randint(10, 200)],
+            "confidence": round(rng.random(), 3),
+        }
+        elements.append(element)
+        size += len(JSONResponse(element).body) + 1
+    return {"type": "image", "summary": "A page with " + ", ".join(WORDS[:8]), "elements": elements,
+            "_tokens_used": len(elements) * 20}
+
+
+def timed(fn, repeat: int) -> float:
+    """Best-of-3 microseconds per call."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best * 1e6
+
+
+def bench(sizes, mbps: float):
+    print(f"json encoder: {'orjson ' + orjson.__version__ if orjson else 'stdlib'}; "
+          f"encodings: {', '.join(available_encodings())}; link: {mbps:g} Mbit/s")
+    for kb in sizes:
+        doc = document(kb)
+        repeat = max(3, 2000 // kb)
+        body = FastJSONResponse(doc).body
+        print(f"\n{len(body) / 1024:.0f} KB document, {len(doc['elements'])} elements")
+
+        stdlib_us = timed(lambda: JSONResponse(doc).body, repeat)
+        fast_us = timed(lambda: FastJSONResponse(doc).body, repeat)
+        print(f"  serialize  stdlib JSONResponse {stdlib_us:9.0f} us")
+        print(f"             FastJSONResponse    {fast_us:9.0f} us  ({stdlib_us / fast_us:.1f}x)")
+        for name, (media_type, encode) in FORMATS.items():
+            if name == "json":
+                continue
+            if encode is None:
+                print(f"             {name:<19} (not installed)")
+                continue
+            packed = encode(doc)
+            us = timed(lambda: encode(doc), repeat)
+            print(f"             {name:<19} {us:9.0f} us  {len(packed) / len(body):6.1%} of JSON")
+
+        def transfer_ms(n: int) -> float:
+            return n * 8 / (mbps * 1e6) * 1000
+
+        print(f"  compress   identity  {0:7.0f} us  {100:5.0f}%  {transfer_ms(len(body)):7.1f} ms total")
+        for encoding in available_encodings():
+            out = Compressor(encoding).finish(body)
+            us = timed(lambda: Compressor(encoding).finish(body), repeat)
+            print(f"             {encoding:<9} {us:7.0f} us  {len(out) / len(body):5.1%}  "
+                  f"{us / 1000 + transfer_ms(len(out)):7.1f} ms total")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1,10,100,500", help="document sizes in KB")
+    parser.add_argument("--mbps", type=float, default=20.0, help="link bandwidth for the transfer estimate")
+    args = parser.parse_args()
+    bench([int(kb) for kb in args.sizes.split(",")], args.mbps)
+
+
+if __name__ == "__main__":
+    main()
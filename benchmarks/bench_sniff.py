@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Benchmark: `type: "auto"` detection cost vs input size
+Prefix-only sniffing (decode_input_head + sniff) against decoding the whole
+base64 input first.
+Usage: python benchmarks/bench_sniff.py
+"""
+
+import base64
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.media import decode_input, decode_input_head
+from backend.sniff import SNIFF_BYTES, sniff
+
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    print(f"{'input':>10} {'prefix sniff us':>16} {'full decode us':>16}")
+    for size in (2**10, 2**16, 2**20, 16 * 2**20, 64 * 2**20):
+        payload = base64.b64encode(b"\x89PNG\r\n\x1a\n" + os.urandom(size)).decode()
+        prefix = per_call_us(lambda: sniff(decode_input_head(payload, SNIFF_BYTES)), 2000)
+        full = per_call_us(lambda: sniff(decode_input(payload)[:SNIFF_BYTES]), 3 if size > 2**20 else 200)
+        print(f"{size // 1024:>8}KB {prefix:16.1f} {full:16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: token accounting cost on large nested outputs
+Time to count and fit a document to max_tokens, next to the cost of just
+serializing it. With tiktoken installed, also reports the exact tokenizer's
+time and the estimator's error after calibration.
+Usage: python benchmarks/bench_tokens.py [--elements 2000]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.streaming import dumps
+from backend.tokens import TokenCounter, count_tokens, fit_document
+
+WORDS = ("invoice", "total", "amount", "shipping", "address", "laptop", "desk", "chart",
+         "revenue", "quarter", "header", "footer", "table", "row", "column", "日本語", "données")
+
+
+def make_document(n: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+
+    def text(k):
+        return " ".join(rng.choice(WORDS) for _ in range(k))
+
+    return {
+        "type": "document",
+        "summary": text(40),
+        "elements": [
+            {
+                "id": f"e{i}",
+                "type": rng.choice(("text", "table", "figure")),
+                "content": text(rng.randint(5, 60)),
+                "bbox": [rng.randint(0, 2000) for _ in range(4)],
+                "children": [{"id": f"e{i}.{j}", "content": text(8), "score": rng.random()}
+                             for j in range(rng.randint(0, 4))]
+            }
+            for i in range(n)
+        ],
+        "text": text(200),
+        "metadata": {"pages": n // 20 + 1, "language": "en"},
+        "_expandable": []
+    }
+
+
+def per_call_ms(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--elements", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    exact = None
+    try:
+        exact = TokenCounter.from_tiktoken()
+    except Exception as e:  # not installed, or the encoding can't be loaded
+        print(f"tiktoken unavailable ({e.__class__.__name__}); estimator only\n")
+
+    print(f"{'elements':>8} {'bytes':>10} {'dumps ms':>9} {'count ms':>9} "
+          f"{'fit(500) ms':>12} {'fit(5000) ms':>13} {'exact ms':>9} {'est err':>8}")
+    for n in (10, 100, args.elements // 2, args.elements):
+        doc = make_document(n)
+        body = dumps(doc)
+        dump_ms = per_call_ms(lambda: dumps(doc), args.iterations)
+        count_ms = per_call_ms(lambda: count_tokens(doc), args.iterations)
+        fit_small = per_call_ms(lambda: fit_document(doc, 500), args.iterations)
+        fit_large = per_call_ms(lambda: fit_document(doc, 5000), args.iterations)
+        exact_ms, error = "-", "-"
+        if exact:
+            exact_ms = f"{per_call_ms(lambda: exact(body), args.iterations):.2f}"
+            estimator = TokenCounter()
+            estimator.calibrate([dumps(make_document(50, seed=1))], exact.exact)
+            error = f"{(estimator(body) - exact(body)) / exact(body):+.1%}"
+        print(f"{n:>8} {len(body.encode()):>10} {dump_ms:9.2f} {count_ms:9.2f} "
+              f"{fit_small:12.2f} {fit_large:13.2f} {exact_ms:>9} {error:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: server peak RSS for one large upload through each input path
+  json    POST /convert with base64 `input`
+  upload  POST /convert/upload (multipart)
+  raw     POST /convert/raw (application/octet-stream)
+Each path runs against a fresh `uvicorn app:app` process; peak RSS is the
+server's VmHWM from /proc (Linux only).
+Usage: python benchmarks/bench_upload.py [--size-mb 50]
+"""
+
+import argparse
+import base64
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+PORT = 8017
+
+
+def peak_rss_mb(pid: int) -> float:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def start_server() -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=ROOT
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/health")
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+def send(path: str, sample: Path):
+    url = f"http://127.0.0.1:{PORT}"
+    with httpx.Client(timeout=300) as client:
+        if path == "json":
+            payload = base64.b64encode(sample.read_bytes()).decode()
+            r = client.post(f"{url}/convert", json={"input": payload, "cache": False})
+        elif path == "upload":
+            with sample.open("rb") as f:
+                r = client.post(f"{url}/convert/upload", files={"file": ("sample.bin", f)},
+                                data={"cache": "false"})
+        else:
+            with sample.open("rb") as f:
+                r = client.post(f"{url}/convert/raw?cache=false", content=f,
+                                headers={"Content-Type": "application/octet-stream"})
+        r.raise_for_status()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sample = Path(tmp) / "sample.bin"
+        sample.write_bytes(os.urandom(args.size_mb * 2**20))
+
+        print(f"{args.size_mb} MB upload")
+        print(f"{'path':<8} {'idle MB':>9} {'peak MB':>9} {'delta MB':>9} {'seconds':>8}")
+        for path in ("json", "upload", "raw"):
+            proc = start_server()
+            try:
+                idle = peak_rss_mb(proc.pid)
+                start = time.perf_counter()
+                send(path, sample)
+                elapsed = time.perf_counter() - start
+                peak = peak_rss_mb(proc.pid)
+            finally:
+                proc.terminate()
+                proc.wait()
+            print(f"{path:<8} {idle:9.1f} {peak:9.1f} {peak - idle:9.1f} {elapsed:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark: user lookups by id / email / api_key at increasing registry sizes
+Usage: python benchmarks/bench_users.py [--max-users 1000000]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.users import User, UserRegistry
+
+
+def linear_scan(users: dict, user_id: str):
+    """The pre-registry lookup: for user in users_db.values()."""
+    for user in users.values():
+        if user["id"] == user_id:
+            return user
+
+
+def time_lookups(fn, keys, repeat: int = 3) -> float:
+    """Best-of-N mean lookup time in nanoseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for key in keys:
+            fn(key)
+        best = min(best, (time.perf_counter_ns() - start) / len(keys))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-users", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--scan-limit", type=int, default=100_000,
+                        help="skip the linear-scan baseline above this size")
+    args = parser.parse_args()
+
+    registry = UserRegistry()
+    legacy = {}
+    password_hash = "0" * 64  # shared string keeps the benchmark's RSS down
+    sizes = [n for n in (1_000, 10_000, 100_000, 1_000_000, 10_000_000) if n <= args.max_users]
+
+    print(f"{'users':>10} {'by_id':>10} {'by_email':>10} {'by_key':>10} {'scan':>12}   (ns/lookup)")
+    for size in sizes:
+        for i in range(len(registry), size):
+            user = User(
+                id=f"{i:032x}",
+                email=f"user{i}@example.com",
+                password_hash=password_hash,
+                api_key=f"a2j_{i:048x}"
+            )
+            registry.add(user)
+            if size <= args.scan_limit:
+                legacy[user.email] = {"id": user.id}
+
+        rng = random.Random(size)
+        picks = [rng.randrange(size) for _ in range(args.lookups)]
+        ids = [f"{i:032x}" for i in picks]
+        emails = [f"user{i}@example.com" for i in picks]
+        keys = [f"a2j_{i:048x}" for i in picks]
+
+        by_id = time_lookups(registry.get, ids)
+        by_email = time_lookups(registry.get_by_email, emails)
+        by_key = time_lookups(registry.get_by_api_key, keys)
+        if size <= args.scan_limit:
+            scan = time_lookups(lambda k: linear_scan(legacy, k), ids[:20], repeat=1)
+            scan_col = f"{scan:12.0f}"
+        else:
+            scan_col = f"{'skipped':>12}"
+        print(f"{size:>10} {by_id:10.0f} {by_email:10.0f} {by_key:10.0f} {scan_col}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: video scene analysis throughput, frames per second per core
+Generates a synthetic video with ffmpeg (lavfi test sources, a cut every
+--scene-sec seconds), runs VideoAnalyzer.scenes with 1..N pool workers and
+reports wall time, sampled frames/s and frames/s per core. The NumPy
+differencing step alone is measured too (no ffmpeg needed).
+Usage: python benchmarks/bench_video.py [--minutes 10] [--workers 1,2,4]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.video import BLOCK_FRAMES, FFMPEG, THUMB_SIZE, VideoAnalyzer, block_scores
+
+SOURCES = ("testsrc2", "smptebars", "rgbtestsrc", "mandelbrot")
+
+
+def make_video(path: str, seconds: float, scene_sec: float):
+    scenes = max(1, int(seconds // scene_sec))
+    inputs, labels = [], []
+    for i in range(scenes):
+        inputs += ["-f", "lavfi", "-i", f"{SOURCES[i % len(SOURCES)]}=size=1280x720:rate=30:duration={scene_sec}"]
+        labels.append(f"[{i}:v]")
+    subprocess.run(
+        [FFMPEG, "-v", "error", "-y", *inputs,
+         "-filter_complex", f"{''.join(labels)}concat=n={scenes}:v=1:a=0[v]", "-map", "[v]",
+         "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", path],
+        check=True
+    )
+
+
+def bench_differencing(frames: int = 20_000) -> float:
+    width, height = THUMB_SIZE
+    thumbs = np.random.default_rng(0).integers(0, 255, (frames, height, width), dtype=np.uint8)
+    start = time.perf_counter()
+    prev = None
+    for i in range(0, frames, BLOCK_FRAMES):
+        block = thumbs[i:i + BLOCK_FRAMES]
+        block_scores(block, prev)
+        prev = block[-1]
+    return frames / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--scene-sec", type=float, default=30)
+    parser.add_argument("--workers", default=",".join(str(n) for n in (1, 2, 4, os.cpu_count()) if n <= os.cpu_count()))
+    parser.add_argument("--sample-fps", type=float, default=4)
+    args = parser.parse_args()
+
+    print(f"NumPy differencing alone: {bench_differencing():,.0f} thumbnails/s ({THUMB_SIZE[0]}x{THUMB_SIZE[1]})")
+    if FFMPEG is None:
+        print("ffmpeg not found; skipping the decode benchmark")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.mp4")
+        print(f"generating {args.minutes:g} min 720p30 test video...")
+        make_video(path, args.minutes * 60, args.scene_sec)
+        print(f"{'workers':>7} {'wall s':>8} {'scenes':>7} {'sampled fps':>12} {'fps/core':>9} {'video x realtime':>17}")
+        for workers in sorted({int(w) for w in args.workers.split(",")}):
+            with ProcessPoolExecutor(workers) as pool:
+                analyzer = VideoAnalyzer(pool, sample_fps=args.sample_fps, segment_sec=60)
+                start = time.perf_counter()
+                result = asyncio.run(analyzer.scenes(path, max_tokens=10_000))
+                wall = time.perf_counter() - start
+                stats = analyzer.stats()
+            print(f"{workers:>7} {wall:8.2f} {len(result['scenes']):>7} {stats['frames'] / wall:12.0f} "
+                  f"{stats['fps_per_core']:9.0f} {result['duration'] / wall:16.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: offline load test of both servers, plus micro-benchmarks
+1. Starts `app.py` and `backend/main.py` (uvicorn, one process each) on the
+   offline stub model (ANY2JSON_STUB_LATENCY_MS per call), with the tier
+   rate limits lifted unless --rate-limits is given
+2. Drives each scenario with an async load generator: --concurrency
+   clients back to back (closed loop), or --rate arrivals/s (open loop;
+   latency counts from the scheduled send, so queueing shows up)
+     convert          app.py  POST /convert, cache off (sniff, preprocess, model, fit)
+     convert_cached   app.py  POST /convert, cache hits
+     api_convert      main.py POST /api/convert with an API key, cache off
+     auth_register    main.py POST /api/auth/register, a new email each time
+     auth_login       main.py POST /api/auth/login
+     account_balance  main.py GET /api/account/balance with a JWT
+   and reports throughput, p50/p95/p99 latency, errors and server RSS
+3. Times hot functions in process: verify_token, get_prompt_for_budget,
+   serialization, token fitting and rendering
+Results go to --out as JSON; --compare OLD.json prints the change from an
+earlier run and exits 1 if anything regressed by more than --threshold.
+The load generator shares the machine with the servers: compare runs made
+on the same hardware.
+Usage: python benchmarks/run.py [--duration 10] [--concurrency 16] [--rate 0]
+                                [--scenarios convert,auth_login] [--skip-load] [--skip-micro]
+                                [--out bench-results.json] [--compare OLD.json]
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import httpx
+
+SERVERS = {"app": "app:app", "api": "backend.main:app"}
+# Metrics where a higher value is better; every other number is a cost
+HIGHER_IS_BETTER = ("rps",)
+
+
+# --- Servers ---
+
+def serve(target: str, port: int, rate_limits: bool):
+    """Run one server in this process (the suite starts it as a subprocess)."""
+    import importlib
+    import uvicorn
+    module = importlib.import_module(SERVERS[target].split(":")[0])
+    if not rate_limits and getattr(module, "rate_limiter", None) is not None:
+        module.rate_limiter.limits = {tier: (10**9, 10**9) for tier in module.rate_limiter.limits}
+    uvicorn.run(module.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int) -> dict:
+    """Current (VmRSS) and peak (VmHWM) resident memory; empty off Linux."""
+    try:
+        lines = Path(f"/proc/{pid}/status").read_text().splitlines()
+    except OSError:
+        return {}
+    fields = {"VmRSS:": "rss_mb", "VmHWM:": "peak_rss_mb"}
+    return {fields[line.split()[0]]: round(int(line.split()[1]) / 1024, 1)
+            for line in lines if line.split() and line.split()[0] in fields}
+
+
+class Server:
+    """A server subprocess on a free port, with the stub model and no provider keys."""
+
+    def __init__(self, target: str, args):
+        self.target = target
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = {k: v for k, v in os.environ.items()
+               if k not in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "ANY2JSON_OPENAI_BASE_URL")}
+        env.update({"ANY2JSON_VISION_PROVIDER": "stub", "ANY2JSON_STUB_LATENCY_MS": str(args.stub_latency_ms),
+                    "PYTHONPATH": str(ROOT)})
+        command = [sys.executable, __file__, "--serve", target, "--port", str(self.port)]
+        if args.rate_limits:
+            command.append("--rate-limits")
+        self.proc = subprocess.Popen(command, cwd=ROOT, env=env)
+        for _ in range(300):
+            try:
+                httpx.get(f"{self.url}/health")
+                return
+            except httpx.HTTPError:
+                if self.proc.poll() is not None:
+                    break
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError(f"{target} server did not start")
+
+    def memory(self) -> dict:
+        return rss_mb(self.proc.pid)
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+# --- Load generator ---
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def summarize(latencies: list, statuses: dict, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    ok = sum(n for status, n in statuses.items() if isinstance(status, int) and status < 400)
+    return {
+        "requests": len(latencies),
+        "errors": len(latencies) - ok,
+        "statuses": {str(status): n for status, n in sorted(statuses.items(), key=str)},
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+
+
+async def drive(client: httpx.AsyncClient, send, duration: float, concurrency: int, rate: float = 0) -> dict:
+    """Call `send(client)` for `duration` seconds; latency and status per call.
+
+    Closed loop (rate 0): `concurrency` workers, each sending as soon as its
+    last response came back. Open loop: sends are scheduled at `rate` per
+    second whatever the responses do, at most `concurrency` in flight; a
+    send waiting for a slot is late, and its latency counts from when it
+    was due.
+    """
+    latencies, statuses = [], {}
+
+    async def one(due: float):
+        try:
+            status = (await send(client)).status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        latencies.append(time.perf_counter() - due)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    deadline = start + duration
+    if not rate:
+        async def worker():
+            while time.perf_counter() < deadline:
+                await one(time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    else:
+        slots = asyncio.Semaphore(concurrency)
+        tasks = []
+
+        async def scheduled(due: float):
+            async with slots:
+                await one(due)
+
+        for i in itertools.count():
+            due = start + i / rate
+            if due >= deadline:
+                break
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            tasks.append(asyncio.create_task(scheduled(due)))
+        await asyncio.gather(*tasks)
+    return summarize(latencies, statuses, time.perf_counter() - start)
+
+
+def sample_image() -> str:
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("RGB", (640, 480), (90, 140, 200)).save(buf, "JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode()
+
+
+async def scenarios(app_url: str, api_url: str, max_tokens: int) -> dict:
+    """scenario name -> (base url, send(client)); sets up the account the api scenarios use."""
+    image = sample_image()
+    run_id = os.urandom(4).hex()
+    signups = itertools.count()
+    async with httpx.AsyncClient() as client:
+        r = await client.post(f"{api_url}/api/auth/register",
+                              json={"email": f"bench-{run_id}@example.com", "password": "bench-password"})
+        r.raise_for_status()
+        account = r.json()
+    jwt_auth = {"Authorization": f"Bearer {account['token']}"}
+    key_auth = {"Authorization": f"Bearer {account['api_key']}"}
+    convert = {"input": image, "max_tokens": max_tokens}
+
+    return {
+        "convert": (app_url, lambda c: c.post("/convert", json={**convert, "cache": False})),
+        "convert_cached": (app_url, lambda c: c.post("/convert", json=convert)),
+        "api_convert": (api_url, lambda c: c.post("/api/convert", json={**convert, "cache": False},
+                                                  headers=key_auth)),
+        "auth_register": (api_url, lambda c: c.post("/api/auth/register", json={
+            "email": f"load-{run_id}-{next(signups)}@example.com", "password": "bench-password"})),
+        "auth_login": (api_url, lambda c: c.post("/api/auth/login", json={
+            "email": f"bench-{run_id}@example.com", "password": "bench-password"})),
+        "account_balance": (api_url, lambda c: c.get("/api/account/balance", headers=jwt_auth)),
+    }
+
+
+async def load(args) -> dict:
+    servers = {name: Server(name, args) for name in SERVERS}
+    try:
+        results = {"servers": {name: {"idle": server.memory()} for name, server in servers.items()},
+                   "scenarios": {}}
+        available = await scenarios(servers["app"].url, servers["api"].url, args.max_tokens)
+        names = args.scenarios.split(",") if args.scenarios else list(available)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        for name in names:
+            url, send = available[name]
+            async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+                await drive(client, send, args.warmup, args.concurrency)
+                result = await drive(client, send, args.duration, args.concurrency, args.rate)
+            result["server"] = "app" if url == servers["app"].url else "api"
+            results["scenarios"][name] = result
+            print(f"  {name:<16} {result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.1f}  "
+                  f"p95 {result['p95_ms']:7.1f}  p99 {result['p99_ms']:7.1f} ms  {result['errors']} errors")
+        for name, server in servers.items():
+            results["servers"][name]["after"] = server.memory()
+    finally:
+        for server in servers.values():
+            server.stop()
+    for name, memory in results["servers"].items():
+        print(f"  {name} server RSS: {memory['idle'].get('rss_mb', '-')} MB idle, "
+              f"{memory['after'].get('rss_mb', '-')} MB after, peak {memory['after'].get('peak_rss_mb', '-')} MB")
+    return results
+
+
+# --- Micro-benchmarks ---
+
+def per_call_us(fn, seconds: float) -> float:
+    """Best-of-3 microseconds per call, each round running for about `seconds`/3."""
+    fn()
+    n = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        if time.perf_counter() - start > seconds / 30:
+            break
+        n *= 2
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(n * 10):
+            fn()
+        best = min(best, (time.perf_counter() - start) / (n * 10))
+    return round(best * 1e6, 3)
+
+
+def micro(seconds: float) -> dict:
+    from backend import main as api
+    from backend.render import Renderer
+    from backend.responses import FastJSONResponse
+    from backend.streaming import dumpb
+    from backend.tokens import count_tokens, fit_document
+    from backend.users import User
+    from backend.vision import get_prompt_for_budget, stub_completion, to_document
+
+    user = api.users.add(User(id="bench-micro", email="bench-micro@example.com",
+                              password_hash=api.hash_password("bench"), api_key="a2j_" + "1" * 48))
+    jwt_header = f"Bearer {api.create_token(user.id)}"
+    key_header = f"Bearer {user.api_key}"
+
+    def uncached(header):
+        api.credential_cache.clear()
+        return api.verify_token(header)
+
+    document = to_document(stub_completion("bench", 50_000, 4000), "image", 4000)
+    events = [("head", {"type": "image", "summary": document["summary"]}),
+              *(("element", e) for e in document["elements"]), ("trailer", {"_expandable": []})]
+
+    cases = {
+        "verify_token.jwt_uncached": lambda: uncached(jwt_header),
+        "verify_token.jwt_cached": lambda: api.verify_token(jwt_header),
+        "verify_token.api_key_uncached": lambda: uncached(key_header),
+        "verify_token.api_key_cached": lambda: api.verify_token(key_header),
+        "get_prompt_for_budget": lambda: get_prompt_for_budget(500, "image"),
+        "serialize.json_stdlib": lambda: json.dumps(document),
+        "serialize.dumpb": lambda: dumpb(document),
+        "serialize.response": lambda: FastJSONResponse(document).body,
+        "tokens.count": lambda: count_tokens(document),
+        "tokens.fit_document": lambda: fit_document(document, 1000),
+        "render.flat": lambda: list(Renderer("flat").events(events)),
+        "render.progressive": lambda: list(Renderer("progressive").events(events)),
+    }
+    results = {}
+    for name, fn in cases.items():
+        results[name] = {"us": per_call_us(fn, seconds)}
+        print(f"  {name:<32} {results[name]['us']:10.2f} us")
+    return results
+
+
+# --- Results ---
+
+def metadata(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("serve", "port", "out", "compare")},
+    }
+
+
+def numbers(tree: dict, prefix: str = ""):
+    """(dotted path, value) for every comparable number in a results tree."""
+    for key, value in tree.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            if key not in ("statuses", "args", "idle"):
+                yield from numbers(value, path + ".")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in ("requests", "cpus"):
+            yield path, value
+
+
+def compare(old: dict, new: dict, threshold: float) -> list:
+    """Print the change of every metric in both runs; returns the regressed ones."""
+    before = dict(numbers({"load": old.get("load") or {}, "micro": old.get("micro") or {}}))
+    regressions = []
+    print(f"\nvs {old.get('meta', {}).get('commit')} ({old.get('meta', {}).get('timestamp')}):")
+    changed = {k for k in set(old["meta"]["args"]) | set(new["meta"]["args"])
+               if old["meta"]["args"].get(k) != new["meta"]["args"].get(k)}
+    if changed:
+        print(f"  note: run with different settings ({', '.join(sorted(changed))}); not like for like")
+    for path, value in numbers({"load": new.get("load") or {}, "micro": new.get("micro") or {}}):
+        if path not in before or not before[path]:
+            continue
+        change = (value - before[path]) / before[path]
+        worse = -change if path.endswith(HIGHER_IS_BETTER) else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        if path.endswith(".errors"):
+            flag = "  REGRESSION" if value > before[path] else ""
+        if flag:
+            regressions.append(path)
+        print(f"  {path:<52} {before[path]:>10} -> {value:>10}  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test and micro-benchmarks")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per load scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of unrecorded load first")
+    parser.add_argument("--concurrency", type=int, default=16, help="clients (closed loop) or max in flight")
+    parser.add_argument("--rate", type=float, default=0, help="requests/s, open loop (0: closed loop)")
+    parser.add_argument("--scenarios", help="comma-separated subset of the load scenarios")
+    parser.add_argument("--max-tokens", type=int, default=500)
+    parser.add_argument("--stub-latency-ms", type=float, default=50.0, help="stub model delay per call")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--rate-limits", action="store_true", help="keep the tier rate limits on")
+    parser.add_argument("--micro-seconds", type=float, default=1.0, help="time per micro-benchmark")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--out", default="bench-results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    parser.add_argument("--serve", choices=sorted(SERVERS), help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.port, args.rate_limits)
+
+    results = {"meta": metadata(args)}
+    if not args.skip_load:
+        mode = f"{args.rate:g} req/s open loop" if args.rate else "closed loop"
+        print(f"load: {args.duration:g} s per scenario, {args.concurrency} concurrent, {mode}, "
+              f"stub model {args.stub_latency_ms:g} ms")
+        results["load"] = asyncio.run(load(args))
+    if not args.skip_micro:
+        print("micro-benchmarks:")
+        results["micro"] = micro(args.micro_seconds)
+
+    Path(args.out).write_text(json.dumps(results, indent=2) + "\n")
+    print(f"results: {args.out}")
+    if args.compare:
+        regressions = compare(json.loads(Path(args.compare).read_text()), results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,26 @@
 #!/usr/bin/env python3
 """
 any2json CLI — TUI client for any2json API
+Bulk mode: any2json convert PATH_OR_GLOB... [--concurrency N] [--max-tokens M] [--out DIR|FILE.jsonl]
 """
 
 import os
 import sys
 import json
 import httpx
+import argparse
+import asyncio
+import glob
+import hashlib
+import sqlite3
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from typing import List, Optional
 from rich.console import Console
 from rich.panel import Panel
+from rich.progress import BarColumn, MofNCompleteColumn, Progress, TextColumn, TimeElapsedColumn, TimeRemainingColumn
 from rich.prompt import Prompt, Confirm
 from rich.table import Table
 from rich.text import Text
@@ -24,6 +35,9 @@ CONFIG_DIR = Path.home() / ".any2json"
 CONFIG_FILE = CONFIG_DIR / "config.json"
 
 console = Console()
+err_console = Console(stderr=True)  # bulk mode: progress and errors; stdout may carry results
+
+_client: Optional[httpx.Client] = None
 
 
 def load_config() -> dict:
@@ -39,19 +53,29 @@ def save_config(config: dict):
     CONFIG_FILE.write_text(json.dumps(config, indent=2))
 
 
-def api_request(method: str, endpoint: str, data: dict = None, token: str = None) -> dict:
-    """Make API request."""
+def http_client() -> httpx.Client:
+    """One pooled client for the session, so calls reuse their connection."""
+    global _client
+    if _client is None:
+        _client = httpx.Client(timeout=30)
+    return _client
+
+
+def api_request(method: str, endpoint: str, data: dict = None, token: str = None, files: dict = None) -> dict:
+    """Make API request (multipart with `data` as form fields when `files` is given)."""
     headers = {}
     if token:
         headers["Authorization"] = f"Bearer {token}"
     
     try:
-        with httpx.Client(timeout=30) as client:
-            if method == "GET":
-                r = client.get(f"{API_BASE}{endpoint}", headers=headers)
-            else:
-                r = client.post(f"{API_BASE}{endpoint}", json=data, headers=headers)
-            return r.json()
+        client = http_client()
+        if method == "GET":
+            r = client.get(f"{API_BASE}{endpoint}", headers=headers)
+        elif files:
+            r = client.post(f"{API_BASE}{endpoint}", data=data, files=files, headers=headers, timeout=300)
+        else:
+            r = client.post(f"{API_BASE}{endpoint}", json=data, headers=headers)
+        return r.json()
     except Exception as e:
         return {"error": str(e)}
 
@@ -308,10 +332,16 @@ def convert_media(token: str):
     
     console.print("\n[dim]Processing...[/dim]")
     
-    result = api_request("POST", "/convert", {
-        "input": input_url,
-        "max_tokens": max_tokens
-    }, token=token)
+    if os.path.isfile(input_url):
+        # Local files are uploaded; the server can't read our paths
+        with open(input_url, "rb") as f:
+            result = api_request("POST", "/convert/upload", {"max_tokens": str(max_tokens)}, token=token,
+                                 files={"file": (os.path.basename(input_url), f)})
+    else:
+        result = api_request("POST", "/convert", {
+            "input": input_url,
+            "max_tokens": max_tokens
+        }, token=token)
     
     if result.get("error"):
         console.print(f"[red]Error: {result['error']}[/red]")
@@ -325,8 +355,289 @@ def convert_media(token: str):
     ))
 
 
+# Bulk mode: any2json convert PATH_OR_GLOB...
+
+MANIFEST_NAME = ".any2json-manifest.db"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class BulkError(Exception):
+    """A conversion that failed for good (after retries)."""
+
+
+def is_url(value: str) -> bool:
+    return value.startswith(("http://", "https://"))
+
+
+# Same parsing as backend.vision.retry_after; the CLI is served as a single file (/cli/any2json.py)
+def retry_after(value: Optional[str], default: float) -> float:
+    """Seconds to wait per a Retry-After header (delta-seconds or an HTTP date); `default` if missing or invalid."""
+    if not value:
+        return default
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when.tzinfo is None:  # obsolete date forms carry no zone; HTTP dates are GMT
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def expand_inputs(patterns: List[str]) -> List[str]:
+    """Files and URLs to convert, in order and without repeats.
+    
+    Directories are walked (hidden entries skipped), globs expanded (`**`
+    recurses) and `-` reads one file or URL per line from stdin.
+    """
+    items = []
+    for pattern in patterns:
+        if pattern == "-":
+            items.extend(line.strip() for line in sys.stdin if line.strip())
+        elif is_url(pattern):
+            items.append(pattern)
+        elif os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                items.extend(os.path.join(root, f) for f in sorted(files) if not f.startswith("."))
+        elif os.path.isfile(pattern):
+            items.append(pattern)
+        else:
+            matches = [m for m in sorted(glob.glob(pattern, recursive=True)) if os.path.isfile(m)]
+            if not matches:
+                err_console.print(f"[yellow]No files match {pattern}[/yellow]")
+            items.extend(matches)
+    return list(dict.fromkeys(item if is_url(item) else os.path.abspath(item) for item in items))
+
+
+def output_name(item: str) -> str:
+    """Path of an input's result under the output directory: the input's own
+    path (relative to the working directory when inside it) plus .json."""
+    if is_url(item):
+        return os.path.join("urls", hashlib.sha256(item.encode()).hexdigest()[:16] + ".json")
+    path = Path(item)
+    try:
+        relative = path.relative_to(Path.cwd())
+    except ValueError:
+        relative = Path(*path.parts[1:])
+    return str(relative) + ".json"
+
+
+def fingerprint(item: str) -> tuple:
+    """(size, mtime) of a file, so an edited file is converted again; (None, None) for URLs."""
+    if is_url(item):
+        return None, None
+    stat = os.stat(item)
+    return stat.st_size, stat.st_mtime
+
+
+class Manifest:
+    """Progress of bulk runs, one row per input, in SQLite.
+    
+    An input is skipped when it finished before with the same options and
+    (for files) the same size and mtime. Each result is written before its
+    row, so an interrupted run loses nothing; at worst the item in flight
+    is converted again. Failed inputs are retried on the next run.
+    """
+    
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                input TEXT PRIMARY KEY,
+                options TEXT NOT NULL,
+                size INTEGER,
+                mtime REAL,
+                status TEXT NOT NULL,
+                output TEXT,
+                error TEXT,
+                finished_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+    
+    def finished(self, options: str) -> dict:
+        """input -> (size, mtime) of everything done with these options."""
+        rows = self.conn.execute("SELECT input, size, mtime FROM items WHERE status = 'done' AND options = ?",
+                                 (options,))
+        return {item: (size, mtime) for item, size, mtime in rows}
+    
+    def record(self, item: str, options: str, stamp: tuple, status: str,
+               output: Optional[str] = None, error: Optional[str] = None):
+        self.conn.execute("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                          (item, options, *stamp, status, output, error, time.time()))
+        self.conn.commit()
+    
+    def close(self):
+        self.conn.close()
+
+
+async def convert_one(client: httpx.AsyncClient, item: str, args) -> dict:
+    """Convert one file (uploaded) or URL, retrying rate limits, server errors and timeouts."""
+    options = {"max_tokens": args.max_tokens, "type": args.type, "format": args.format}
+    for attempt in range(args.retries + 1):
+        try:
+            if is_url(item):
+                r = await client.post("/convert", json={"input": item, **options})
+            else:
+                with open(item, "rb") as f:
+                    r = await client.post("/convert/upload", files={"file": (os.path.basename(item), f)},
+                                          data={k: str(v) for k, v in options.items()})
+        except httpx.TransportError as e:
+            if attempt == args.retries:
+                raise BulkError(f"{type(e).__name__}: {e}")
+            await asyncio.sleep(2 ** attempt)
+            continue
+        if r.status_code < 400:
+            try:
+                return r.json()
+            except ValueError:
+                content_type = r.headers.get("content-type", "no content type")
+                raise BulkError(f"{r.status_code}: response is not JSON ({content_type})")
+        if r.status_code not in RETRY_STATUSES or attempt == args.retries:
+            try:
+                detail = r.json().get("detail", r.text)
+            except ValueError:
+                detail = r.text
+            raise BulkError(f"{r.status_code}: {detail}")
+        await asyncio.sleep(retry_after(r.headers.get("Retry-After"), 2 ** attempt))
+
+
+def write_result(out_dir: str, item: str, result: dict) -> str:
+    """Write one result file (atomically, so a crash never leaves half a file); returns its path."""
+    path = os.path.join(out_dir, output_name(item))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
+
+
+async def bulk_convert(items: List[str], args, manifest: Optional[Manifest], api_key: str) -> dict:
+    """Convert `items` with `args.concurrency` requests in flight over one pooled client."""
+    options = json.dumps({"max_tokens": args.max_tokens, "type": args.type, "format": args.format})
+    jsonl = args.out == "-" or args.out.endswith(".jsonl")
+    sink = sys.stdout if args.out == "-" else open(args.out, "a", encoding="utf-8") if jsonl else None
+    counts = {"converted": 0, "failed": 0}
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+    
+    columns = (TextColumn("{task.description}"), BarColumn(), MofNCompleteColumn(),
+               TextColumn("{task.fields[failed]} failed"), TimeElapsedColumn(), TimeRemainingColumn())
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=args.api, headers={"Authorization": f"Bearer {api_key}"},
+                                     limits=limits, timeout=args.timeout) as client:
+            with Progress(*columns, console=err_console) as progress:
+                task = progress.add_task("Converting", total=len(items), failed=0)
+                
+                async def worker():
+                    while not queue.empty():
+                        item = queue.get_nowait()
+                        try:
+                            stamp = fingerprint(item)
+                        except OSError:  # removed since it was listed; the upload reports it
+                            stamp = (None, None)
+                        try:
+                            result = await convert_one(client, item, args)
+                        except (BulkError, OSError) as e:
+                            counts["failed"] += 1
+                            if manifest:
+                                manifest.record(item, options, stamp, "failed", error=str(e))
+                            if jsonl:
+                                sink.write(json.dumps({"input": item, "error": str(e)}, ensure_ascii=False) + "\n")
+                                sink.flush()
+                            progress.console.print(f"[red]✗ {item}: {e}[/red]")
+                        else:
+                            counts["converted"] += 1
+                            if jsonl:
+                                sink.write(json.dumps({"input": item, "result": result}, ensure_ascii=False) + "\n")
+                                sink.flush()
+                                output = args.out
+                            else:
+                                output = write_result(args.out, item, result)
+                            if manifest:
+                                manifest.record(item, options, stamp, "done", output=output)
+                        progress.update(task, advance=1, failed=counts["failed"])
+                
+                await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    finally:
+        if sink and sink is not sys.stdout:
+            sink.close()
+    return counts
+
+
+def run_command(argv: List[str]) -> int:
+    """Non-interactive commands; returns the exit status."""
+    parser = argparse.ArgumentParser(prog="any2json", description="any2json CLI (no arguments: interactive menu)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="convert files, directories, globs or URLs in bulk")
+    convert.add_argument("inputs", nargs="+", metavar="PATH_OR_GLOB",
+                         help="file, directory (walked), glob (quote it; ** recurses), URL, or - for a list on stdin")
+    convert.add_argument("--concurrency", "-c", type=int, default=8, help="conversions in flight")
+    convert.add_argument("--max-tokens", "-m", type=int, default=500)
+    convert.add_argument("--type", default="auto", choices=["auto", "image", "video", "audio", "document"])
+    convert.add_argument("--format", default="nested", choices=["nested", "flat", "progressive"])
+    convert.add_argument("--out", "-o", default="-",
+                         help="directory for one .json per input, a .jsonl file, or - for JSONL on stdout")
+    convert.add_argument("--manifest", help=f"resume state (default: {MANIFEST_NAME} in the output directory, "
+                                            "or FILE.jsonl.manifest.db; none for stdout)")
+    convert.add_argument("--retries", type=int, default=3, help="for rate limits, server errors and timeouts")
+    convert.add_argument("--timeout", type=float, default=300.0, help="seconds per request")
+    convert.add_argument("--api", default=API_BASE, help="API base URL (ANY2JSON_API)")
+    convert.add_argument("--api-key", default=os.environ.get("ANY2JSON_API_KEY"),
+                         help="defaults to ANY2JSON_API_KEY, then the logged-in account")
+    args = parser.parse_args(argv)
+    
+    config = load_config()
+    api_key = args.api_key or config.get("api_key") or config.get("token")
+    if not api_key:
+        err_console.print("[red]No API key: pass --api-key, set ANY2JSON_API_KEY, or log in with `any2json`[/red]")
+        return 2
+    
+    items = expand_inputs(args.inputs)
+    jsonl = args.out == "-" or args.out.endswith(".jsonl")
+    if not jsonl:
+        os.makedirs(args.out, exist_ok=True)
+    manifest_path = args.manifest or (os.path.join(args.out, MANIFEST_NAME) if not jsonl else
+                                      f"{args.out}.manifest.db" if args.out != "-" else None)
+    manifest = Manifest(manifest_path) if manifest_path else None
+    
+    todo = items
+    if manifest:
+        finished = manifest.finished(json.dumps({"max_tokens": args.max_tokens, "type": args.type,
+                                                 "format": args.format}))
+        todo = [item for item in items if item not in finished or
+                (not is_url(item) and os.path.exists(item) and finished[item] != fingerprint(item))]
+    skipped = len(items) - len(todo)
+    err_console.print(f"{len(items)} input(s): {len(todo)} to convert, {skipped} already done"
+                      + (f" (manifest: {manifest_path})" if manifest else ""))
+    
+    started = time.perf_counter()
+    try:
+        counts = asyncio.run(bulk_convert(todo, args, manifest, api_key)) if todo else {"converted": 0, "failed": 0}
+    except KeyboardInterrupt:
+        err_console.print("[yellow]Interrupted. Run the same command again to resume.[/yellow]")
+        return 130
+    finally:
+        if manifest:
+            manifest.close()
+    elapsed = time.perf_counter() - started
+    rate = counts["converted"] / elapsed if elapsed else 0.0
+    err_console.print(f"[green]{counts['converted']} converted[/green], {counts['failed']} failed, "
+                      f"{skipped} skipped in {elapsed:.1f} s ({rate:.1f}/s)")
+    return 1 if counts["failed"] else 0
+
 def main():
-    """Main TUI loop."""
+    """Main TUI loop; with arguments, run a command instead (any2json convert ...)."""
+    if len(sys.argv) > 1:
+        sys.exit(run_command(sys.argv[1:]))
+    
     config = load_config()
     
     while True:
@@ -0,0 +1,43 @@
+import os
+import secrets
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Offline: the stub vision/speech clients stand in for the model APIs
+for name in ("ANTHROPIC_API_KEY", "OPENAI_API_KEY"):
+    os.environ.pop(name, None)
+
+
+# Each app is started once per run: shutdown closes its databases, and the last app
+# to stop closes the worker pools of the conversion pipeline they share
+
+@pytest.fixture(scope="session")
+def client():
+    """The converter (app.py)."""
+    from fastapi.testclient import TestClient
+    from app import app
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def api_client():
+    """The account API (backend/main.py)."""
+    from fastapi.testclient import TestClient
+    from backend import main
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def api(api_client):
+    """api_client authenticated as a freshly registered user."""
+    email = f"{secrets.token_hex(6)}@example.com"
+    token = api_client.post("/api/auth/register", json={"email": email, "password": "pw"}).json()["token"]
+    api_client.headers["Authorization"] = f"Bearer {token}"
+    yield api_client
+    del api_client.headers["Authorization"]
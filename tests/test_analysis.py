@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+from backend.analysis import AnalysisState, AnalysisStore
+
+
+def state_with_file(size: int = 10) -> AnalysisState:
+    fd, path = tempfile.mkstemp(prefix="any2json-test-")
+    os.write(fd, b"x" * size)
+    os.close(fd)
+    return AnalysisState(digest=path, media_type="document", media=b"", elements={}, context={}, path=path)
+
+
+def test_file_removed_with_evicted_state():
+    store = AnalysisStore(max_entries=1)
+    first, second = state_with_file(), state_with_file()
+    path = first.path
+    store.put(first)
+    store.put(second)
+    assert not os.path.exists(path)
+    assert os.path.exists(second.path)
+    assert store.get(second.handle) is second
+    second.discard()
+
+
+def test_file_counts_toward_max_bytes():
+    store = AnalysisStore(max_bytes=100)
+    state = state_with_file(size=1000)
+    path = state.path
+    store.put(state)
+    assert len(store) == 0
+    assert not os.path.exists(path)
@@ -0,0 +1,50 @@
+import base64
+import io
+import wave
+
+import pytest
+from PIL import Image
+
+from backend.ledger import usage_cost
+
+
+def png() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), "red").save(out, "PNG")
+    return out.getvalue()
+
+
+def wav(seconds: float = 2) -> bytes:
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(16000)
+        writer.writeframes(b"\0\1" * int(16000 * seconds))
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("url", ["http://169.254.169.254/latest/meta-data/", "http://127.0.0.1:8000/"])
+def test_private_url_input_is_rejected(api, url):
+    r = api.post("/api/convert", json={"input": url})
+    assert r.status_code == 400
+    assert "private or reserved" in r.json()["detail"]
+
+
+def test_auto_type_is_sniffed_and_billed_as_detected(api):
+    audio = wav()
+    r = api.post("/api/convert", json={"input": base64.b64encode(audio).decode()})
+    assert r.status_code == 200
+    result = r.json()
+    assert result["type"] == "audio"
+    used = api.get("/api/account/balance").json()["used"]
+    assert used == usage_cost("audio", len(audio), result["_tokens_used"])
+
+
+def test_upload_expands_by_handle(api):
+    first = api.post("/api/convert/upload", files={"file": ("a.png", png())}).json()
+    element = first["_expandable"][0]
+    r = api.post("/api/convert/upload", files={"file": ("a.png", png())},
+                 data={"expand": element, "handle": first["_handle"]})
+    assert r.status_code == 200
+    assert [e["id"] for e in r.json()["elements"]] == [element]
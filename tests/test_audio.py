@@ -0,0 +1,35 @@
+import io
+import struct
+import wave
+
+import pytest
+
+from backend.audio import wav_info
+
+
+def pcm(width: int = 2, frames: int = 16000) -> bytes:
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(width)
+        writer.setframerate(16000)
+        writer.writeframes(b"\0" * width * frames)
+    return out.getvalue()
+
+
+def with_format_tag(data: bytes, tag: int) -> bytes:
+    return data[:20] + struct.pack("<H", tag) + data[22:]
+
+
+def test_pcm16_is_read_directly():
+    assert wav_info(io.BytesIO(pcm())) == (16000, 1.0)
+
+
+@pytest.mark.parametrize("data", [
+    with_format_tag(pcm(), 3),  # IEEE float
+    with_format_tag(pcm(), 0xFFFE),  # WAVE_FORMAT_EXTENSIBLE
+    pcm(width=3),
+    pcm()[:30],  # header cut short
+], ids=["float", "extensible", "pcm24", "truncated"])
+def test_wavs_needing_ffmpeg(data):
+    assert wav_info(io.BytesIO(data)) is None
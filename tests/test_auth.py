@@ -0,0 +1,49 @@
+import secrets
+import time
+
+from backend import auth
+from backend.auth import CredentialCache
+
+
+def test_entries_expire_with_ttl_or_credential(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(auth.time, "time", lambda: now)
+    cache = CredentialCache(ttl=60)
+    cache.put("key", "u1")
+    cache.put("jwt", "u2", expires_at=now + 10)
+    assert cache.get("key") == "u1" and cache.get("jwt") == "u2"
+    now += 10
+    assert cache.get("jwt") is None  # the token's own expiry came first
+    assert cache.get("key") == "u1"
+    now += 50
+    assert cache.get("key") is None
+    assert len(cache) == 0 and (cache.hits, cache.misses) == (3, 2)
+
+
+def test_least_recently_used_is_evicted():
+    cache = CredentialCache(maxsize=2)
+    cache.put("a", "u1")
+    cache.put("b", "u2")
+    cache.get("a")
+    cache.put("c", "u3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "u1" and cache.get("c") == "u3"
+
+
+def test_discard_drops_a_credential():
+    cache = CredentialCache()
+    cache.put("key", "u1", expires_at=time.time() + 3600)
+    cache.discard("key")
+    cache.discard("never-cached")
+    assert cache.get("key") is None
+
+
+def test_regenerated_key_stops_working_at_once(api_client):
+    email = f"{secrets.token_hex(6)}@example.com"
+    old_key = api_client.post("/api/auth/register", json={"email": email, "password": "pw"}).json()["api_key"]
+    as_old = {"Authorization": f"Bearer {old_key}"}
+    assert api_client.get("/api/account/balance", headers=as_old).status_code == 200  # now cached
+
+    new_key = api_client.post("/api/account/regenerate-key", headers=as_old).json()["api_key"]
+    assert api_client.get("/api/account/balance", headers=as_old).status_code == 401
+    assert api_client.get("/api/account/balance", headers={"Authorization": f"Bearer {new_key}"}).status_code == 200
@@ -0,0 +1,96 @@
+import asyncio
+import base64
+import io
+import json
+
+from fastapi import HTTPException
+from PIL import Image
+
+from backend.batch import ConcurrencyLimiter, stream_batch
+
+
+async def collect(lines) -> list:
+    return [json.loads(line) async for line in lines]
+
+
+def test_failed_items_are_reported_in_their_line():
+    async def worker(item):
+        if item == "missing":
+            raise HTTPException(404, "Not found")
+        if item == "broken":
+            raise RuntimeError("decoder crashed")
+        return {"summary": item}
+
+    lines = asyncio.run(collect(stream_batch(["a", "missing", "broken"], worker, asyncio.Semaphore(2))))
+    by_index = {line["index"]: line for line in lines}
+    assert by_index[0] == {"index": 0, "result": {"summary": "a"}}
+    assert by_index[1] == {"index": 1, "error": {"status": 404, "detail": "Not found"}}
+    assert by_index[2] == {"index": 2, "error": {"status": 500, "detail": "decoder crashed"}}
+
+
+def test_lines_arrive_in_completion_order():
+    async def worker(delay):
+        await asyncio.sleep(delay)
+        return {"delay": delay}
+
+    lines = asyncio.run(collect(stream_batch([0.03, 0.0, 0.015], worker, asyncio.Semaphore(3))))
+    assert [line["index"] for line in lines] == [1, 2, 0]
+
+
+def test_concurrency_is_capped_across_a_users_batches():
+    limiter = ConcurrencyLimiter(3)
+    running = {"now": 0, "max": 0}
+
+    async def worker(item):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.002)
+        running["now"] -= 1
+        return {}
+
+    async def batch(user: str):
+        try:
+            return await collect(stream_batch(range(10), worker, limiter.checkout(user)))
+        finally:
+            limiter.checkin(user)
+
+    async def run():
+        return await asyncio.gather(batch("u1"), batch("u1"))
+
+    assert [len(lines) for lines in asyncio.run(run())] == [10, 10]
+    assert running["max"] == 3
+    assert not limiter._semaphores  # released with the last batch
+
+
+def test_leaving_early_cancels_pending_items():
+    cancelled = []
+
+    async def worker(item):
+        try:
+            await asyncio.sleep(item)
+        except asyncio.CancelledError:
+            cancelled.append(item)
+            raise
+        return {}
+
+    async def run():
+        lines = stream_batch([0, 10, 10], worker, asyncio.Semaphore(3))
+        first = await lines.__anext__()
+        await lines.aclose()
+        await asyncio.sleep(0)
+        return json.loads(first)
+
+    assert asyncio.run(run())["index"] == 0
+    assert cancelled == [10, 10]
+
+
+def test_batch_route_streams_per_item_results(client):
+    out = io.BytesIO()
+    Image.new("RGB", (32, 32), "blue").save(out, "PNG")
+    items = [{"input": base64.b64encode(out.getvalue()).decode(), "type": "image"},
+             {"input": "http://127.0.0.1:9/secret"}]
+    r = client.post("/convert/batch", json={"items": items})
+    assert r.status_code == 200
+    lines = {line["index"]: line for line in map(json.loads, r.text.splitlines())}
+    assert lines[0]["result"]["type"] == "image"
+    assert lines[1]["error"]["status"] == 400
@@ -0,0 +1,20 @@
+import asyncio
+
+from backend.cache import ResultCache
+
+
+def test_disk_tier_round_trip_and_eviction(tmp_path):
+    async def run():
+        cache = ResultCache(max_entries=1, disk_dir=str(tmp_path), disk_max_bytes=150)
+        await cache.put("a", {"type": "image", "summary": "x" * 40})
+        await cache.put("b", {"type": "image", "summary": "y" * 40})
+        assert await cache.get("a") == {"type": "image", "summary": "x" * 40}  # from disk
+        assert cache.disk_hits == 1
+        await cache.put("c", {"type": "image", "summary": "z" * 40})  # evicts "b": the disk hit refreshed "a"
+        return cache
+
+    cache = asyncio.run(run())
+    assert sorted(p.stem for p in tmp_path.glob("*.json")) == ["a", "c"]
+    assert cache.stats()["disk_bytes"] == sum(p.stat().st_size for p in tmp_path.glob("*.json"))
+    reloaded = ResultCache(disk_dir=str(tmp_path))
+    assert asyncio.run(reloaded.get("c"))["summary"] == "z" * 40
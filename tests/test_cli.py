@@ -0,0 +1,50 @@
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "cli"))
+
+from any2json import BulkError, convert_one, retry_after  # noqa: E402
+
+
+def test_retry_after_seconds_and_dates():
+    assert retry_after("7", 1) == 7
+    assert retry_after(None, 4) == 4
+    assert retry_after("soon", 2) == 2
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 28 <= retry_after(later, 1) <= 30
+    assert retry_after("Wed, 21 Oct 2015 07:28:00 GMT", 1) == 0
+
+
+def run(handler, retries: int = 1):
+    args = SimpleNamespace(max_tokens=500, type="auto", format="nested", retries=retries)
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://test") as client:
+            return await convert_one(client, "https://example.com/a.png", args)
+    return asyncio.run(go())
+
+
+def test_non_json_success_is_a_bulk_error():
+    with pytest.raises(BulkError, match="not JSON"):
+        run(lambda request: httpx.Response(200, text="<html>proxy login</html>",
+                                           headers={"Content-Type": "text/html"}))
+
+
+def test_retries_after_an_http_date():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        return httpx.Response(200, json={"type": "image"})
+
+    assert run(handler) == {"type": "image"}
+    assert len(calls) == 2
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from backend.coalesce import SingleFlight
+
+
+def test_concurrent_callers_share_one_run():
+    flights = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"summary": "x"}
+
+    async def run():
+        return await asyncio.gather(*(flights.do("k", fn) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result == {"summary": "x"} for result, _ in results)
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    stats = flights.stats()
+    assert (stats["flights"], stats["coalesced"], stats["max_waiters"], stats["in_flight"]) == (1, 4, 4, 0)
+
+
+def test_leader_leaving_does_not_cancel_waiters():
+    flights = SingleFlight()
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def fn():
+            await gate.wait()
+            return "done"
+
+        leader = asyncio.create_task(flights.do("k", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("k", fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == ("done", True)
+    assert flights.stats()["leader_disconnects"] == 1 and flights.stats()["cancelled"] == 0
+
+
+def test_last_caller_leaving_cancels_the_computation():
+    flights = SingleFlight()
+    cancelled = []
+
+    async def fn():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def run():
+        callers = [asyncio.create_task(flights.do("k", fn)) for _ in range(3)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        # A new caller starts a fresh flight
+        return await flights.do("k", lambda: asyncio.sleep(0, "again"))
+
+    assert asyncio.run(run()) == ("again", False)
+    assert cancelled == [1]
+    assert flights.stats()["cancelled"] == 1 and flights.stats()["flights"] == 2
+
+
+def test_error_reaches_every_waiter_and_is_not_cached():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("model down")
+
+    async def run():
+        return await asyncio.gather(*(flights.do("k", fail) for _ in range(3)), return_exceptions=True)
+
+    assert [type(e) for e in asyncio.run(run())] == [ValueError] * 3
+    assert asyncio.run(flights.do("k", lambda: asyncio.sleep(0, "ok"))) == ("ok", False)
+
+
+def test_stream_replays_events_to_late_joiners():
+    flights = SingleFlight()
+
+    async def events():
+        for i in range(3):
+            await asyncio.sleep(0.005)
+            yield i
+
+    async def fn():
+        return "head", events()
+
+    async def consume(delay: float):
+        await asyncio.sleep(delay)
+        result, replay, shared = await flights.stream("k", fn)
+        return result, [event async for event in replay], shared
+
+    async def run():
+        return await asyncio.gather(consume(0), consume(0.008))
+
+    first, late = asyncio.run(run())
+    assert first == ("head", [0, 1, 2], False)
+    assert late == ("head", [0, 1, 2], True)
+    assert flights.stats()["in_flight"] == 0
@@ -0,0 +1,37 @@
+import io
+import os
+
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+
+from backend import document
+
+
+def write_pdf(path: str, pages: int = 3):
+    writer = pypdf.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(200, 200)
+    buf = io.BytesIO()
+    writer.write(buf)
+    with open(path, "wb") as f:
+        f.write(buf.getvalue())
+
+
+def test_reader_of_removed_file_is_evicted(tmp_path):
+    removed, other = str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")
+    write_pdf(removed)
+    assert document.pdf_outline(removed)["units"] == 3
+    os.unlink(removed)
+    write_pdf(other, pages=5)
+    assert document.pdf_outline(other)["units"] == 5
+    assert [key[0] for key in document._readers] == [other]
+
+
+def test_replaced_file_is_read_again(tmp_path):
+    path = str(tmp_path / "a.pdf")
+    write_pdf(path, pages=2)
+    assert document.pdf_outline(path)["units"] == 2
+    os.unlink(path)
+    write_pdf(path, pages=4)  # same name, new file
+    assert document.pdf_outline(path)["units"] == 4
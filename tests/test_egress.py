@@ -0,0 +1,25 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from backend.egress import check_public, is_public
+
+
+@pytest.mark.parametrize("address", ["127.0.0.1", "10.1.2.3", "172.16.0.1", "192.168.1.1", "169.254.169.254",
+                                     "100.64.0.1", "0.0.0.0", "224.0.0.1", "::1", "fe80::1%eth0", "fd00::1",
+                                     "::ffff:127.0.0.1"])
+def test_non_public(address):
+    assert not is_public(address)
+
+
+@pytest.mark.parametrize("address", ["93.184.216.34", "2606:2800:220:1::1"])
+def test_public(address):
+    assert is_public(address)
+
+
+def test_check_public_rejects_loopback_unless_allowed():
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(check_public("http://localhost:8080/hook"))
+    assert e.value.status_code == 400
+    asyncio.run(check_public("http://localhost:8080/hook", allow={"localhost"}))
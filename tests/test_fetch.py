@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from backend import fetch as fetch_module
+from backend.egress import PublicTransport
+from backend.fetch import MediaFetcher
+
+
+class Handler(BaseHTTPRequestHandler):
+    hits = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        Handler.hits += 1
+        port = self.server.server_address[1]
+        redirects = {"/local": f"http://127.0.0.1:{port}/media", "/metadata": "http://169.254.169.254/latest/",
+                     "/private": "http://10.0.0.5/media", "/loop": f"http://127.0.0.1:{port}/loop"}
+        if self.path in redirects:
+            self.send_response(302)
+            self.send_header("Location", redirects[self.path])
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", "5")
+        self.end_headers()
+        self.wfile.write(b"hello")
+
+
+@pytest.fixture(scope="module")
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+
+
+def fetch(url: str, allow=()) -> bytes:
+    async def run():
+        fetcher = MediaFetcher(allow_hosts=allow)
+        try:
+            with await fetcher.fetch(url) as media:
+                return media.read()
+        finally:
+            await fetcher.aclose()
+    return asyncio.run(run())
+
+
+def test_private_host_rejected(server):
+    with pytest.raises(HTTPException) as e:
+        fetch(server + "/media")
+    assert e.value.status_code == 400
+
+
+def test_allowed_host_and_redirect_followed(server):
+    assert fetch(server + "/media", allow={"127.0.0.1"}) == b"hello"
+    assert fetch(server + "/local", allow={"127.0.0.1"}) == b"hello"
+
+
+@pytest.mark.parametrize("path", ["/metadata", "/private"])
+def test_redirect_to_private_rejected(server, path):
+    with pytest.raises(HTTPException) as e:
+        fetch(server + path, allow={"127.0.0.1"})
+    assert e.value.status_code == 400
+
+
+def test_redirect_loop(server):
+    with pytest.raises(HTTPException) as e:
+        fetch(server + "/loop", allow={"127.0.0.1"})
+    assert e.value.status_code == 502
+
+
+def test_connection_goes_only_to_checked_addresses(server, monkeypatch):
+    # The up-front check saw a public address, but by connect time the name points at loopback (DNS rebinding)
+    async def passed(url, allow=()):
+        pass
+    monkeypatch.setattr(fetch_module, "check_public", passed)
+    hits = Handler.hits
+    with pytest.raises(HTTPException) as e:
+        fetch(server.replace("127.0.0.1", "localhost") + "/media")
+    assert e.value.status_code == 502
+    assert Handler.hits == hits
+
+
+def test_public_transport_refuses_private_webhooks(server):
+    async def post(allow):
+        async with httpx.AsyncClient(transport=PublicTransport(allow)) as client:
+            return await client.post(server + "/hook")
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(post(()))
+    assert asyncio.run(post({"127.0.0.1"})).status_code == 501  # reached: the test server has no do_POST
@@ -0,0 +1,83 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from backend.ledger import PRICING, UsageLedger, usage_cost
+
+
+def test_usage_cost():
+    assert usage_cost("audio", 2**20, 1000) == pytest.approx(0.005 + 0.001 + 0.002)
+    assert usage_cost("unknown", 0, 0) == PRICING["image"]["base"]
+
+
+def test_recorded_entry_is_committed_on_return(tmp_path):
+    path = str(tmp_path / "ledger.db")
+    ledger = UsageLedger(path)
+
+    async def run():
+        return await asyncio.gather(*(ledger.record(f"r{i}", "u1", 0.5, 10) for i in range(20)))
+
+    assert all(asyncio.run(run()))
+    # Neither stopped nor closed: as if the process died right after answering
+    other = UsageLedger(path)
+    assert other.usage("u1") == {"used": 10.0, "requests": 20, "tokens": 200}
+    other.close()
+    ledger.close()
+
+
+def test_restart_loses_and_duplicates_nothing(tmp_path):
+    path = str(tmp_path / "ledger.db")
+
+    async def record(ledger, ids):
+        return await asyncio.gather(*(ledger.record(i, f"u{n % 2}", 0.25, 4) for n, i in enumerate(ids)))
+
+    ledger = UsageLedger(path)
+    asyncio.run(record(ledger, [f"r{i}" for i in range(10)]))
+    before = ledger.usage("u0"), ledger.usage("u1")
+    ledger.close()
+
+    restarted = UsageLedger(path)
+    assert (restarted.usage("u0"), restarted.usage("u1")) == before
+    # Replayed ids (a rerun job) are not charged again, new ones are
+    assert asyncio.run(record(restarted, [f"r{i}" for i in range(10)])) == [False] * 10
+    assert asyncio.run(record(restarted, ["r10", "r11"])) == [True, True]
+    assert restarted.usage("u0") == {"used": 1.5, "requests": 6, "tokens": 24}
+    assert restarted.usage("u1") == {"used": 1.5, "requests": 6, "tokens": 24}
+    assert restarted.stats()["duplicates"] == 10
+    restarted.close()
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*), SUM(cost) FROM usage").fetchone() == (12, 3.0)
+    assert conn.execute("SELECT SUM(used), SUM(requests) FROM balances").fetchone() == (3.0, 12)
+    conn.close()
+
+
+def test_concurrent_repeats_are_charged_once():
+    ledger = UsageLedger()
+
+    async def run():
+        first = await asyncio.gather(ledger.record("job1", "u1", 1.0), ledger.record("job1", "u1", 1.0))
+        again = await ledger.record("job1", "u1", 1.0)
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert sorted(first) == [False, True] and again is False
+    assert ledger.usage("u1")["requests"] == 1 and ledger.used("u1") == 1.0
+    ledger.close()
+
+
+def test_cancelled_caller_is_still_charged():
+    ledger = UsageLedger()
+
+    async def run():
+        task = asyncio.create_task(ledger.record("r1", "u1", 0.1))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await ledger.stop()
+
+    asyncio.run(run())
+    assert ledger.used("u1") == 0.1
+    ledger.close()
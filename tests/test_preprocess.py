@@ -0,0 +1,27 @@
+import asyncio
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from backend.preprocess import ImagePreprocessor
+
+
+def png() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (64, 48), "teal").save(out, "PNG")
+    return out.getvalue()
+
+
+def test_concurrent_misses_count_bytes_once():
+    preprocessor = ImagePreprocessor()
+    data = png()
+
+    async def run():
+        return await asyncio.gather(*(preprocessor.run(data, "digest", 500) for _ in range(4)))
+
+    results = asyncio.run(run())
+    preprocessor.shutdown()
+    assert len(preprocessor._cache) == 1
+    assert preprocessor._cached_bytes == len(results[0])
@@ -0,0 +1,72 @@
+import pytest
+
+from backend.ratelimit import DAY, MemoryRateStore, RateLimiter, SQLiteRateStore, limited_response, take
+
+
+def test_bucket_refills_continuously():
+    state, decision = take(None, 1000.0, per_minute=60, per_day=1000, cost=60)
+    assert decision.allowed and decision.remaining == 0
+    state, decision = take(state, 1000.5, 60, 1000)
+    assert not decision.allowed
+    assert decision.retry_after == pytest.approx(0.5)
+    state, decision = take(state, 1001.0, 60, 1000)
+    assert decision.allowed
+
+
+def test_day_window_slides():
+    now = 10 * DAY
+    state, decision = take(None, now, per_minute=100, per_day=100, cost=100)
+    assert decision.allowed and decision.day_remaining == 0
+    # Half a day into the next window, half of yesterday's count still overlaps
+    state, decision = take(state, now + 1.5 * DAY, 100, 100, cost=60)
+    assert not decision.allowed and decision.day_remaining == 50
+    state, decision = take(state, now + 1.5 * DAY, 100, 100, cost=50)
+    assert decision.allowed
+
+
+@pytest.mark.parametrize("cost", [61, 99, 10_001])
+def test_cost_above_capacity_is_refused_outright(cost):
+    state, decision = take(None, 1000.0, per_minute=60, per_day=10_000, cost=cost)
+    assert not decision.allowed and not decision.fits
+    assert "Retry-After" not in decision.headers()
+    assert decision.remaining == 60  # nothing was charged
+    response = limited_response(decision, "paid")
+    assert response.status_code == 413
+    assert "retry-after" not in response.headers
+
+
+def test_retry_after_is_honest():
+    state, decision = take(None, 1000.0, per_minute=60, per_day=10_000, cost=50)
+    state, decision = take(state, 1000.0, 60, 10_000, cost=20)
+    assert not decision.allowed and decision.fits
+    # After the promised wait the same request goes through
+    state, decision = take(state, 1000.0 + decision.retry_after, 60, 10_000, cost=20)
+    assert decision.allowed
+
+
+@pytest.mark.parametrize("store", [lambda tmp: MemoryRateStore(),
+                                   lambda tmp: SQLiteRateStore(str(tmp / "rate.db"))], ids=["memory", "sqlite"])
+def test_limiter_counts_per_key(tmp_path, store):
+    limiter = RateLimiter(store(tmp_path), limits={"free": (2, 100)})
+    assert limiter.check("a", "free").allowed
+    assert limiter.check("a", "free").allowed
+    assert not limiter.check("a", "free").allowed
+    assert limiter.check("b", "unknown-tier").allowed  # falls back to the default tier
+    assert limiter.stats() == {"allowed": 3, "limited": 1, "keys": 2}
+
+
+def test_sqlite_state_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "rate.db")
+    first, second = RateLimiter(SQLiteRateStore(path)), RateLimiter(SQLiteRateStore(path))
+    assert first.check("a", "free", cost=10).allowed
+    assert not second.check("a", "free").allowed
+
+
+def test_oversized_batch_is_413_without_retry_after(api):
+    items = [{"input": "aGVsbG8="}] * 11  # free tier: 10 requests/min
+    r = api.post("/api/convert/batch", json={"items": items})
+    assert r.status_code == 413
+    assert "Retry-After" not in r.headers
+    r = api.post("/api/convert/batch", json={"items": items[:2]})
+    assert r.status_code == 200
+    assert r.headers["X-RateLimit-Remaining"] == "8"
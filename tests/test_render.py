@@ -0,0 +1,85 @@
+import asyncio
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from backend.render import FORMATS, GIST_CHARS, Renderer, gist
+from backend.streaming import collect_document, document_events
+from backend.tokens import fit_document, fit_events
+
+
+DOCUMENT = {
+    "type": "image",
+    "summary": "A kitchen",
+    "elements": [
+        {"label": "kettle", "id": "e1", "box": [1, 2, 3, 4]},
+        {"id": "e2", "label": "mug"},
+        {"id": "e3", "label": "note", "box": None, "text": "buy milk"},
+    ],
+    "_tokens_used": 0,
+}
+
+
+def events(document: dict) -> list:
+    keys = list(document)
+    split = keys.index("elements")
+    return [("head", {k: document[k] for k in keys[:split]}),
+            *(("element", element) for element in document["elements"]),
+            ("trailer", {k: document[k] for k in keys[split + 1:]})]
+
+
+def test_flat_sends_columns_then_rows():
+    rendered = list(Renderer("flat").events(events(DOCUMENT)))
+    assert rendered[0] == ("head", {"type": "image", "summary": "A kitchen", "columns": ["id", "label", "box"]})
+    assert [data for kind, data in rendered if kind == "element"] == [
+        ["e1", "kettle", [1, 2, 3, 4]],
+        ["e2", "mug"],  # the trailing null is dropped
+        ["e3", "note", None, {"text": "buy milk"}],  # fields outside the columns follow in an object
+    ]
+    assert rendered[-1] == ("trailer", {"_tokens_used": 0})
+
+
+def test_flat_without_elements_still_has_columns():
+    rendered = list(Renderer("flat").events(events({**DOCUMENT, "elements": []})))
+    assert rendered == [("head", {"type": "image", "summary": "A kitchen", "columns": []}),
+                        ("trailer", {"_tokens_used": 0})]
+
+
+def test_progressive_sends_id_and_gist():
+    rendered = list(Renderer("progressive").events(events(DOCUMENT)))
+    assert [data for kind, data in rendered if kind == "element"] == [["e1", "kettle"], ["e2", "mug"], ["e3", "note"]]
+    long = gist({"id": "t1", "text": "word " * 40})
+    assert long.endswith("…") and len(long) <= GIST_CHARS + 1
+    assert gist({"id": "x", "label": " ", "type": "chart"}) == "chart"
+
+
+def test_unknown_format_is_refused():
+    with pytest.raises(ValueError):
+        Renderer("yaml")
+
+
+@pytest.mark.parametrize("format", FORMATS)
+def test_streamed_and_buffered_render_alike(format):
+    async def streamed():
+        return await collect_document(fit_events(document_events(DOCUMENT), 2000, format=format))
+
+    assert asyncio.run(streamed()) == fit_document(DOCUMENT, 2000, format=format)
+
+
+@pytest.mark.parametrize("format", FORMATS)
+def test_convert_renders_requested_format(client, format):
+    out = io.BytesIO()
+    Image.new("RGB", (32, 32), "green").save(out, "PNG")
+    image = base64.b64encode(out.getvalue()).decode()
+    buffered = client.post("/convert", json={"input": image, "format": format}).json()
+    streamed = client.post("/convert", json={"input": image, "format": format, "stream": True}).json()
+    assert buffered == streamed
+    if format == "flat":
+        assert buffered["columns"][0] == "id"
+        assert all(isinstance(row, list) for row in buffered["elements"])
+    elif format == "progressive":
+        assert all(len(pair) == 2 for pair in buffered["elements"])
+    else:
+        assert all(isinstance(element, dict) for element in buffered["elements"])
@@ -0,0 +1,89 @@
+import asyncio
+import zlib
+
+import pytest
+
+from backend import responses
+from backend.responses import CompressionMiddleware, available_encodings, negotiate_encoding
+
+
+def decoder(encoding: str):
+    """Incremental decoder for `encoding`: bytes in, bytes out."""
+    if encoding == "zstd":
+        return responses.zstandard.ZstdDecompressor().decompressobj().decompress
+    if encoding == "br":
+        return responses.brotli.Decompressor().process
+    return zlib.decompressobj(31).decompress
+
+
+def serve(parts, content_type: str = "application/x-ndjson", content_length: bool = False):
+    """ASGI app sending `parts` as one body (a single part) or streamed."""
+
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type.encode())]
+        if content_length:
+            headers.append((b"content-length", str(sum(map(len, parts))).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for i, part in enumerate(parts):
+            await send({"type": "http.response.body", "body": part, "more_body": i < len(parts) - 1})
+
+    return app
+
+
+def call(app, accept_encoding=None):
+    """(headers, body parts) of the response, through CompressionMiddleware."""
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": headers}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(CompressionMiddleware(app)(scope, receive, send))
+    start, *bodies = sent
+    return {k.decode(): v.decode() for k, v in start["headers"]}, [m["body"] for m in bodies]
+
+
+@pytest.mark.parametrize("encoding", available_encodings())
+def test_streamed_chunks_decode_as_they_arrive(encoding):
+    parts = [b'{"index":%d,"result":{"summary":"a short line"}}\n' % i for i in range(4)] + [b""]
+    headers, bodies = call(serve(parts, content_length=True), encoding)
+    assert headers["content-encoding"] == encoding
+    assert "content-length" not in headers
+    assert "Accept-Encoding" in headers["vary"]
+    decode = decoder(encoding)
+    # Each line is readable before the next one is sent, though far below the size threshold
+    assert [decode(body) for body in bodies[:-1]] == parts[:-1]
+    assert decode(bodies[-1]) == b""
+
+
+@pytest.mark.parametrize("encoding", available_encodings())
+def test_whole_body_is_compressed_above_threshold(encoding):
+    body = b'{"summary":"' + b"word " * 400 + b'"}'
+    headers, bodies = call(serve([body], "application/json", content_length=True), encoding)
+    assert headers["content-encoding"] == encoding
+    assert int(headers["content-length"]) == len(bodies[0]) < len(body)
+    assert decoder(encoding)(bodies[0]) == body
+
+
+@pytest.mark.parametrize("parts, content_type, accept_encoding", [
+    ([b'{"type":"image"}'], "application/json", "gzip"),  # below the threshold
+    ([b"\x89PNG" * 1000], "image/png", "gzip"),  # not compressible
+    ([b"x" * 2000, b""], "application/x-ndjson", None),  # client didn't ask
+    ([b"x" * 2000, b""], "application/x-ndjson", "identity"),
+])
+def test_left_uncompressed(parts, content_type, accept_encoding):
+    headers, bodies = call(serve(parts, content_type), accept_encoding)
+    assert "content-encoding" not in headers
+    assert bodies == parts
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("gzip") == "gzip"
+    assert negotiate_encoding("*") == available_encodings()[0]
+    assert negotiate_encoding("br;q=0.5, gzip;q=0.8") == "gzip"
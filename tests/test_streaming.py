@@ -0,0 +1,33 @@
+import asyncio
+import base64
+
+import pytest
+from fastapi import HTTPException
+
+from backend.streaming import collect_document, document_events, started
+
+
+def test_started_replays_every_event():
+    document = {"type": "image", "summary": "s", "elements": [{"id": "e1"}, {"id": "e2"}], "_tokens_used": 9}
+
+    async def run():
+        return await collect_document(await started(document_events(document)))
+
+    assert asyncio.run(run()) == document
+
+
+def test_started_raises_before_the_first_event():
+    async def failing():
+        raise HTTPException(400, "bad input")
+        yield  # an async generator
+
+    with pytest.raises(HTTPException):
+        asyncio.run(started(failing()))
+
+
+@pytest.mark.parametrize("accept", ["application/json", "text/event-stream"])
+def test_stream_error_keeps_its_status(client, accept):
+    rtf = base64.b64encode(b"{\\rtf1 hello}").decode()
+    r = client.post("/convert", json={"input": rtf, "type": "document", "stream": True},
+                    headers={"Accept": accept})
+    assert r.status_code == 400
@@ -0,0 +1,49 @@
+import pytest
+
+from backend.render import FORMATS
+from backend.tokens import MIN_TOKENS, count_tokens, counter, fit_document, shrink
+from backend.vision import stub_completion, to_document
+
+
+def document(max_tokens: int, list_key: str = "elements", elements: int = 5) -> dict:
+    if list_key == "elements":
+        return to_document(stub_completion("", 1000, max_tokens), "image", max_tokens)
+    return {"type": "video", "summary": "A street at night, cars passing, then a long shot of the harbour",
+            list_key: [{"id": f"s{i}", "time": f"0:{i:02d}-0:{i + 1:02d}", "label": "street",
+                        "summary": "Cars pass under the lights"} for i in range(elements)],
+            "metadata": {"max_tokens_requested": max_tokens}}
+
+
+def test_shrink_leaves_protected_strings_whole():
+    # Too small for anything but the protected field: it stays whole, the rest goes
+    out = shrink({"type": "document", "summary": "word " * 50}, 8, counter)
+    assert out == {"type": "document", "summary": None}
+
+
+@pytest.mark.parametrize("format", FORMATS)
+@pytest.mark.parametrize("list_key", ["elements", "scenes"])
+def test_floor_budget_keeps_type_and_fits(format, list_key):
+    doc = document(MIN_TOKENS, list_key)
+    fitted = fit_document(doc, MIN_TOKENS, list_key, format)
+    assert fitted["type"] == doc["type"]
+    assert fitted["_tokens_used"] <= MIN_TOKENS
+    assert count_tokens(fitted) <= MIN_TOKENS
+    if format == "flat":
+        assert "columns" in fitted
+
+
+@pytest.mark.parametrize("max_tokens", [MIN_TOKENS, 150, 500, 2000])
+def test_budget_respected(max_tokens):
+    fitted = fit_document(document(max_tokens), max_tokens)
+    assert fitted["type"] == "image"
+    assert fitted["_tokens_used"] <= max_tokens
+
+
+@pytest.mark.parametrize("max_tokens", [-5, 0, 10, 30, MIN_TOKENS - 1])
+def test_convert_rejects_budget_below_floor(client, max_tokens):
+    r = client.post("/convert", json={"input": "https://example.com/a.png", "max_tokens": max_tokens})
+    assert r.status_code == 422
+    r = client.post("/convert/upload", files={"file": ("a.png", b"\x89PNG")}, data={"max_tokens": max_tokens})
+    assert r.status_code == 422
+    r = client.post("/convert/raw", params={"max_tokens": max_tokens}, content=b"\x89PNG")
+    assert r.status_code == 422
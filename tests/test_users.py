@@ -0,0 +1,61 @@
+import pytest
+
+from backend.users import SQLiteUserStore, User, UserRegistry
+
+
+def make_user(n: int, **fields) -> User:
+    return User(id=f"u{n}", email=f"u{n}@example.com", password_hash="h", api_key=f"key{n}", **fields)
+
+
+def test_lookups_by_id_email_and_key():
+    registry = UserRegistry()
+    user = registry.add(make_user(1))
+    registry.add(make_user(2))
+    assert len(registry) == 2 and "u1" in registry
+    assert registry.get("u1") is user
+    assert registry.get_by_email("u1@example.com") is user
+    assert registry.get_by_api_key("key1") is user
+    assert registry.get_by_api_key("key3") is None
+
+
+def test_duplicate_id_or_email_is_refused():
+    registry = UserRegistry()
+    registry.add(make_user(1))
+    with pytest.raises(ValueError):
+        registry.add(make_user(1))
+    with pytest.raises(ValueError):
+        registry.add(User(id="u9", email="u1@example.com", password_hash="h", api_key="key9"))
+    assert len(registry) == 1
+
+
+def test_set_api_key_and_remove_update_indexes():
+    registry = UserRegistry()
+    user = registry.add(make_user(1))
+    registry.set_api_key(user, "rotated")
+    assert registry.get_by_api_key("key1") is None
+    assert registry.get_by_api_key("rotated") is user
+    registry.remove("u1")
+    assert registry.get("u1") is None
+    assert registry.get_by_email("u1@example.com") is None
+    assert registry.get_by_api_key("rotated") is None
+    registry.remove("u1")  # already gone: no error
+
+
+def test_sqlite_store_survives_reopen(tmp_path):
+    path = str(tmp_path / "users.db")
+    registry = UserRegistry(SQLiteUserStore(path))
+    user = registry.add(make_user(1, tier="paid", totp_enabled=True))
+    registry.set_api_key(user, "rotated")
+    user.balance = 5.0
+    registry.save(user)
+    registry.add(make_user(2))
+    registry.remove("u2")
+    registry.store.close()
+
+    reopened = UserRegistry(SQLiteUserStore(path))
+    assert len(reopened) == 1
+    loaded = reopened.get_by_api_key("rotated")
+    assert loaded == User(id="u1", email="u1@example.com", password_hash="h", api_key="rotated",
+                          balance=5.0, tier="paid", totp_enabled=True)
+    assert loaded.totp_enabled is True
+    reopened.store.close()
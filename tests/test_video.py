@@ -0,0 +1,20 @@
+import subprocess
+
+import pytest
+from backend import pipeline
+
+
+@pytest.mark.parametrize("error", [
+    subprocess.CalledProcessError(1, "ffprobe"),
+    subprocess.TimeoutExpired("ffmpeg", 60),
+    ValueError("unreadable probe output"),
+], ids=["failed", "timeout", "bad-probe"])
+def test_unreadable_video_is_400(client, monkeypatch, error):
+    async def scenes(path, max_tokens):
+        raise error
+    monkeypatch.setattr(pipeline, "FFMPEG", "ffmpeg")
+    monkeypatch.setattr(pipeline, "FFPROBE", "ffprobe")
+    monkeypatch.setattr(pipeline.video_analyzer, "scenes", scenes)
+    r = client.post("/convert/upload", files={"file": ("a.mp4", b"\0" * 64)}, data={"type": "video"})
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Cannot read video"
@@ -0,0 +1,39 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+from backend.speech import OpenAISpeechBackend
+from backend.vision import OpenAIBackend, VisionError, retry_after
+
+
+def test_retry_after_seconds_and_dates():
+    assert retry_after("7") == 7
+    assert retry_after(None) == 0
+    assert retry_after("soon", 2) == 2
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 28 <= retry_after(later) <= 30
+    assert retry_after("Wed, 21 Oct 2015 07:28:00 GMT", 1) == 0
+
+
+def rate_limited(request: httpx.Request) -> httpx.Response:
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    return httpx.Response(429, headers={"Retry-After": later}, text="slow down")
+
+
+@pytest.mark.parametrize("call", [
+    lambda client: OpenAIBackend("key").complete(client, "prompt", b"\x89PNG", 100),
+    lambda client: OpenAISpeechBackend("key").complete(client, "prompt", b"RIFF", 100),
+], ids=["vision", "speech"])
+def test_provider_error_carries_http_date_retry_after(call):
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(rate_limited)) as client:
+            with pytest.raises(VisionError) as caught:
+                await call(client)
+        return caught.value
+
+    error = asyncio.run(go())
+    assert error.status == 429
+    assert 28 <= error.retry_after <= 30